@@ -4,9 +4,10 @@ import json
 import logging
 import signal
 import sys
+import time
 from collections import defaultdict
-from dataclasses import dataclass
-from typing import Any, Awaitable, Dict, List, Tuple
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
 
 import aiohttp
 
@@ -84,6 +85,12 @@ class Client:
 
         return body
 
+    async def get_metrics_str(self) -> str:
+        resp = await self.sess.get(f"{self.endpoint}/metrics")
+        if not resp.ok:
+            raise ClientException(f"Response: {resp}")
+        return await resp.text()
+
 
 @dataclass
 class Completed:
@@ -94,8 +101,39 @@ class Completed:
 
 sigint_received = asyncio.Event()
 
+# Latest download_remote_layers status of every timeline that has been started, by task id
+# ("tenant_id:timeline_id"). Used for the aggregate progress line.
+statuses: Dict[str, Dict[str, Any]] = {}
+
+
+@dataclass
+class PollInterval:
+    """
+    Poll quickly while a download makes progress, back off exponentially while it doesn't.
+    """
+
+    min: float
+    max: float
+    current: float = field(init=False)
+
+    def __post_init__(self):
+        self.current = self.min
+
+    def next(self, made_progress: bool) -> float:
+        if made_progress:
+            self.current = self.min
+        else:
+            self.current = min(self.max, self.current * 2)
+        return self.current
+
+
+def downloaded_count(status: Optional[Dict[str, Any]]) -> int:
+    if status is None:
+        return 0
+    return int(status["successful_download_count"]) + int(status["failed_download_count"])
 
-async def do_timeline(client: Client, tenant_id, timeline_id):
+
+async def do_timeline(client: Client, tenant_id, timeline_id, poll_interval: PollInterval):
     """
     Spawn download_remote_layers task for given timeline,
     then poll until the download has reached a terminal state.
@@ -122,17 +160,23 @@ async def do_timeline(client: Client, tenant_id, timeline_id):
         tenant_id, timeline_id, ongoing_ok=False
     )
 
+    id = f"{tenant_id}:{timeline_id}"
+    prev: Optional[Dict[str, Any]] = None
     while True:
         st = await client.timeline_poll_download_remote_layers_status(tenant_id, timeline_id)
-        logging.info(f"{tenant_id}:{timeline_id} state is: {st}")
+        logging.debug(f"{id} state is: {st}")
 
         if spawned["task_id"] != st["task_id"]:
             raise ClientException("download task ids changed while polling")
+        statuses[id] = st
 
         if st["state"] == "Running":
-            await asyncio.sleep(10)
+            made_progress = downloaded_count(st) > downloaded_count(prev)
+            prev = st
+            await asyncio.sleep(poll_interval.next(made_progress))
             continue
 
+        logging.info(f"{id} state is: {st}")
         if st["state"] != "Completed":
             raise ClientException(
                 f"download task reached terminal state != Completed: {st['state']}"
@@ -154,25 +198,88 @@ async def main(args):
     return exit_code
 
 
-async def taskq_handler(task_q, result_q):
+async def taskq_handler(task_q, result_q, client: Client, args):
     while True:
         try:
-            (id, fut) = task_q.get_nowait()
+            (tid, tlid) = task_q.get_nowait()
         except asyncio.QueueEmpty:
             logging.debug("taskq_handler observed empty task_q, returning")
             return
+        id = f"{tid}:{tlid}"
         logging.info(f"starting task {id}")
+        # create the coroutine only now, so that at most `concurrent_tasks` exist at a time
+        poll_interval = PollInterval(args.min_poll_interval, args.max_poll_interval)
         try:
-            res = await fut
+            res = await do_timeline(client, tid, tlid, poll_interval)
         except Exception as e:
             res = e
         result_q.put_nowait((id, res))
 
 
-async def print_progress(result_q, tasks):
+async def scrape_ondemand_download_metrics(client: Client) -> Optional[Tuple[float, float]]:
+    """Returns the pageserver's total on-demand downloaded (layers, bytes), None if unavailable."""
+    try:
+        metrics = await client.get_metrics_str()
+    except Exception as e:
+        logging.warning(f"failed to scrape pageserver metrics: {e}")
+        return None
+
+    values = {}
+    for line in metrics.splitlines():
+        if line.startswith("pageserver_remote_ondemand_downloaded_"):
+            name, value = line.rsplit(" ", 1)
+            values[name] = float(value)
+    return (
+        values.get("pageserver_remote_ondemand_downloaded_layers_total", 0.0),
+        values.get("pageserver_remote_ondemand_downloaded_bytes_total", 0.0),
+    )
+
+
+async def print_progress(result_q, total_tasks: int, client: Client, interval: float):
+    """
+    Periodically log task completion, and aggregate layers/s and bytes/s since the last line.
+    Layer counts come from the status payloads of all polled downloads; bytes come from the
+    pageserver's on-demand download metrics, which also include downloads started by others.
+    """
+    started_at = time.monotonic()
+    prev_at = started_at
+    prev_layers = 0
+    first_metrics = prev_metrics = await scrape_ondemand_download_metrics(client)
     while True:
-        await asyncio.sleep(10)
-        logging.info(f"{result_q.qsize()} / {len(tasks)} tasks done")
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        elapsed = max(now - prev_at, 1e-9)
+
+        layers = sum(downloaded_count(st) for st in statuses.values())
+        total_layers = sum(int(st["total_layer_count"]) for st in statuses.values())
+        line = (
+            f"{result_q.qsize()} / {total_tasks} tasks done, "
+            f"{layers} / {total_layers} layers of started tasks downloaded, "
+            f"{(layers - prev_layers) / elapsed:.1f} layers/s"
+        )
+
+        metrics = await scrape_ondemand_download_metrics(client)
+        if metrics is not None and prev_metrics is not None and first_metrics is not None:
+            line += (
+                f", pageserver: {(metrics[0] - prev_metrics[0]) / elapsed:.1f} layers/s"
+                f" {(metrics[1] - prev_metrics[1]) / elapsed / (1024 * 1024):.1f} MiB/s,"
+                f" {(metrics[1] - first_metrics[1]) / (1024 * 1024):.0f} MiB in {now - started_at:.0f}s"
+            )
+        if first_metrics is None:
+            first_metrics = metrics
+        logging.info(line)
+
+        prev_at, prev_layers = now, layers
+        if metrics is not None:
+            prev_metrics = metrics
+
+
+def load_resume_report(resume_from) -> List[str]:
+    """Ids of the timelines that a previous run's report lists as completed without errors."""
+    if resume_from is None:
+        return []
+    previous = json.load(resume_from)
+    return list(previous.get("completed_without_errors", []))
 
 
 async def main_impl(args, report_out, client: Client):
@@ -214,20 +321,32 @@ async def main_impl(args, report_out, client: Client):
         logging.info(f"spec had {len(tenant_and_timline_ids) - len(tmp)} duplicates")
     tenant_and_timline_ids = tmp
 
-    logging.info("create tasks and process them at specified concurrency")
-    task_q: asyncio.Queue[Tuple[str, Awaitable[Any]]] = asyncio.Queue()
-    tasks = {
-        f"{tid}:{tlid}": do_timeline(client, tid, tlid) for tid, tlid in tenant_and_timline_ids
-    }
-    for task in tasks.items():
-        task_q.put_nowait(task)
+    already_completed = set(load_resume_report(args.resume_from))
+    if already_completed:
+        todo = [
+            (tid, tlid)
+            for tid, tlid in tenant_and_timline_ids
+            if f"{tid}:{tlid}" not in already_completed
+        ]
+        logging.info(
+            f"skipping {len(tenant_and_timline_ids) - len(todo)} timelines completed in previous report"
+        )
+    else:
+        todo = tenant_and_timline_ids
+
+    logging.info("queue tasks and process them at specified concurrency")
+    task_q: asyncio.Queue[Tuple[str, str]] = asyncio.Queue()
+    for tid, tlid in todo:
+        task_q.put_nowait((tid, tlid))
 
     result_q: asyncio.Queue[Tuple[str, Any]] = asyncio.Queue()
     taskq_handlers = []
     for _ in range(0, args.concurrent_tasks):
-        taskq_handlers.append(taskq_handler(task_q, result_q))
+        taskq_handlers.append(taskq_handler(task_q, result_q, client, args))
 
-    print_progress_task = asyncio.create_task(print_progress(result_q, tasks))
+    print_progress_task = asyncio.create_task(
+        print_progress(result_q, len(todo), client, args.progress_interval)
+    )
 
     await asyncio.gather(*taskq_handlers)
     print_progress_task.cancel()
@@ -243,6 +362,11 @@ async def main_impl(args, report_out, client: Client):
     assert task_q.empty()
 
     report = defaultdict(list)
+    # keep the report cumulative, so that it can be resumed from again
+    for tid, tlid in tenant_and_timline_ids:
+        id = f"{tid}:{tlid}"
+        if id in already_completed:
+            report["completed_without_errors"].append(id)
     for id, result in results:
         logging.info(f"result for {id}: {result}")
         if isinstance(result, Completed):
@@ -297,6 +421,31 @@ if __name__ == "__main__":
         help="Max concurrent download tasks spawned by pageserver. Each layer is a separate task.",
     )
 
+    parser.add_argument(
+        "--resume-from",
+        type=argparse.FileType("r"),
+        default=None,
+        help="report of a previous run; timelines it lists as completed without errors are skipped. Must not be the same file as --report-output",
+    )
+    parser.add_argument(
+        "--min-poll-interval",
+        type=float,
+        default=0.1,
+        help="poll interval in seconds while a download makes progress (default 0.1)",
+    )
+    parser.add_argument(
+        "--max-poll-interval",
+        type=float,
+        default=10,
+        help="poll interval backs off up to this many seconds while a download makes no progress (default 10)",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=10,
+        help="seconds between progress and throughput log lines (default 10)",
+    )
+
     parser.add_argument(
         "what",
         nargs="+",
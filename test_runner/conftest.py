@@ -4,6 +4,9 @@ pytest_plugins = (
     "fixtures.httpserver",
     "fixtures.neon_fixtures",
     "fixtures.benchmark_fixture",
+    "fixtures.resource_accounting",
+    "fixtures.profiling",
+    "fixtures.remote_storage_proxy",
     "fixtures.pg_stats",
     "fixtures.compare_fixtures",
     "fixtures.slow",
@@ -0,0 +1,201 @@
+"""
+Client-visible availability probes.
+
+An `AvailabilityProbe` runs a few asyncpg workers against an endpoint in a
+background thread, each doing small writes and point reads back to back, and
+records the outcome and latency of every operation. Tests mark phases, e.g.
+"before", "during" and "after" a migration, and the probe reports error
+counts and latency percentiles per phase, and the longest window in which no
+operation succeeded.
+
+Workers reconnect after errors, so that a compute restart or a dropped
+connection shows up as a window of failed operations rather than ending the
+probe.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from fixtures.benchmark_fixture import LatencyHistogram, MetricReport, NeonBenchmarker
+from fixtures.log_helper import log
+from fixtures.neon_fixtures import PgProtocol
+
+PROBE_TABLE = "availability_probe"
+
+
+@dataclass
+class ProbeOp:
+    kind: str  # "read" or "write"
+    # time.monotonic() when the operation was started, and how long it took
+    start: float
+    latency: float
+    phase: str
+    error: Optional[str] = None
+
+    @property
+    def end(self) -> float:
+        return self.start + self.latency
+
+
+@dataclass
+class PhaseSummary:
+    ops: int = 0
+    errors: int = 0
+    read: LatencyHistogram = field(default_factory=LatencyHistogram)
+    write: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+
+class AvailabilityProbe:
+    """
+    Probe `pg` with `workers` concurrent workers, each alternating between an
+    INSERT into `PROBE_TABLE` and a point read of a random row of it. Every
+    operation has `op_timeout` seconds to complete before it counts as failed.
+    """
+
+    def __init__(
+        self,
+        pg: PgProtocol,
+        workers: int = 4,
+        op_timeout: float = 10.0,
+        reconnect_interval: float = 0.05,
+        seed: int = 0,
+    ):
+        self.pg = pg
+        self.workers = workers
+        self.op_timeout = op_timeout
+        self.reconnect_interval = reconnect_interval
+        self.seed = seed
+        self.ops: List[ProbeOp] = []
+        self.phase = "before"
+        # phase name -> time.monotonic() when it started
+        self.phases: Dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def setup(self):
+        """Create the table that the probe writes to and reads from."""
+        self.pg.safe_psql_many(
+            [
+                f"CREATE TABLE IF NOT EXISTS {PROBE_TABLE} (id bigserial PRIMARY KEY, worker int, payload text)",
+                f"INSERT INTO {PROBE_TABLE} (worker, payload) SELECT -1, 'seed' FROM generate_series(1, 1000)",
+            ]
+        )
+
+    def mark(self, phase: str):
+        """Start a new phase: operations started from now on belong to it."""
+        self.phase = phase
+        self.phases[phase] = time.monotonic()
+        log.info(f"availability probe: phase {phase}")
+
+    def start(self):
+        self.mark(self.phase)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        asyncio.run(self._run_workers())
+
+    async def _run_workers(self):
+        await asyncio.gather(*(self._worker(i) for i in range(self.workers)))
+
+    async def _worker(self, worker_id: int):
+        rng = random.Random(self.seed + worker_id)
+        conn = None
+        max_id = 1000
+        write = True
+        while not self._stop.is_set():
+            kind = "write" if write else "read"
+            phase = self.phase
+            start = time.monotonic()
+            error = None
+            try:
+                if conn is None:
+                    conn = await asyncio.wait_for(self.pg.connect_async(), self.op_timeout)
+                if write:
+                    row_id = await asyncio.wait_for(
+                        conn.fetchval(
+                            f"INSERT INTO {PROBE_TABLE} (worker, payload) VALUES ($1, $2) RETURNING id",
+                            worker_id,
+                            "x" * 100,
+                        ),
+                        self.op_timeout,
+                    )
+                    max_id = max(max_id, row_id)
+                else:
+                    await asyncio.wait_for(
+                        conn.fetchval(
+                            f"SELECT payload FROM {PROBE_TABLE} WHERE id = $1",
+                            rng.randint(1, max_id),
+                        ),
+                        self.op_timeout,
+                    )
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                if conn is not None:
+                    conn.terminate()
+                    conn = None
+            self.ops.append(ProbeOp(kind, start, time.monotonic() - start, phase, error))
+            if error is not None:
+                await asyncio.sleep(self.reconnect_interval)
+            write = not write
+        if conn is not None:
+            await conn.close()
+
+    def summary(self) -> Dict[str, PhaseSummary]:
+        phases: Dict[str, PhaseSummary] = {}
+        for op in self.ops:
+            s = phases.setdefault(op.phase, PhaseSummary())
+            s.ops += 1
+            if op.error is not None:
+                s.errors += 1
+            else:
+                (s.read if op.kind == "read" else s.write).add(int(op.latency * 1e9))
+        return phases
+
+    def longest_unavailability(self) -> float:
+        """
+        The longest time between the end of one successful operation and the
+        end of the next one, counting all workers together. With no errors
+        this is about the latency of the slowest operation.
+        """
+        ends = sorted(op.end for op in self.ops if op.error is None)
+        if not ends:
+            return max((op.end for op in self.ops), default=0.0) - min(
+                (op.start for op in self.ops), default=0.0
+            )
+        longest = 0.0
+        for previous, current in zip(ends, ends[1:]):
+            longest = max(longest, current - previous)
+        return longest
+
+    def errors(self) -> Dict[str, int]:
+        """Error message -> count"""
+        errors: Dict[str, int] = {}
+        for op in self.ops:
+            if op.error is not None:
+                errors[op.error] = errors.get(op.error, 0) + 1
+        return errors
+
+    def record(self, zenbenchmark: NeonBenchmarker, prefix: str):
+        for message, count in sorted(self.errors().items(), key=lambda e: -e[1])[:10]:
+            log.info(f"availability probe: {count} x {message}")
+        zenbenchmark.record(
+            f"{prefix}.longest_unavailability",
+            self.longest_unavailability(),
+            "s",
+            MetricReport.LOWER_IS_BETTER,
+        )
+        for phase, s in self.summary().items():
+            name = f"{prefix}.{phase}"
+            zenbenchmark.record(f"{name}.ops", s.ops, "", MetricReport.TEST_PARAM)
+            zenbenchmark.record(f"{name}.errors", s.errors, "", MetricReport.LOWER_IS_BETTER)
+            for kind, histogram in (("read", s.read), ("write", s.write)):
+                if histogram.count > 0:
+                    zenbenchmark.record_histogram(f"{name}.{kind}", histogram, "ms", divisor=1e6)
@@ -2,15 +2,16 @@ import calendar
 import dataclasses
 import enum
 import json
+import math
 import os
 import re
 import timeit
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 from pathlib import Path
 
 # Type-related stuff
-from typing import Callable, ClassVar, Dict, Iterator, Optional
+from typing import Callable, ClassVar, ContextManager, Dict, Iterator, Optional, Sequence
 
 import pytest
 from _pytest.config import Config
@@ -18,8 +19,10 @@ from _pytest.config.argparsing import Parser
 from _pytest.terminal import TerminalReporter
 
 from fixtures.log_helper import log
+from fixtures.metrics import PrometheusHistogram
 from fixtures.neon_fixtures import NeonPageserver
 from fixtures.types import TenantId, TimelineId
+from fixtures.utils import scan_dir_size
 
 """
 This file contains fixtures for micro-benchmarks.
@@ -203,6 +206,81 @@ class PgBenchInitResult:
         )
 
 
+def percentile(ordered: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted, non-empty sequence."""
+    assert len(ordered) > 0
+    rank = min(len(ordered), max(1, math.ceil(pct / 100 * len(ordered)))) - 1
+    return ordered[rank]
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of non-negative integers, e.g. latencies in nanoseconds.
+
+    Values below 2**SUB_BUCKET_BITS are counted exactly, larger ones in buckets
+    whose width is at most 1/2**(SUB_BUCKET_BITS-1) of their values, so memory
+    use doesn't depend on the number of samples. Histograms filled by different
+    threads can be merged afterwards.
+    """
+
+    SUB_BUCKET_BITS = 7
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.total_sq = 0
+        self.max = 0
+
+    @classmethod
+    def _bucket(cls, value: int) -> int:
+        shift = max(0, value.bit_length() - cls.SUB_BUCKET_BITS)
+        return (shift << cls.SUB_BUCKET_BITS) + (value >> shift)
+
+    @classmethod
+    def _bucket_upper_bound(cls, bucket: int) -> int:
+        shift, mantissa = divmod(bucket, 1 << cls.SUB_BUCKET_BITS)
+        return ((mantissa + 1) << shift) - 1
+
+    def add(self, value: int):
+        assert value >= 0
+        bucket = self._bucket(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.total_sq += value * value
+        self.max = max(self.max, value)
+
+    def merge(self, other: "LatencyHistogram"):
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.max = max(self.max, other.max)
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def stdev(self) -> float:
+        """Sample standard deviation, like `statistics.stdev`."""
+        if self.count < 2:
+            return 0.0
+        variance = (self.total_sq - self.total * self.total / self.count) / (self.count - 1)
+        return math.sqrt(max(0.0, variance))
+
+    def percentile(self, pct: float) -> int:
+        """Nearest-rank percentile, rounded up to the upper bound of its bucket."""
+        assert self.count > 0
+        rank = min(self.count, max(1, math.ceil(pct / 100 * self.count)))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self._bucket_upper_bound(bucket), self.max)
+        return self.max
+
+
 @enum.unique
 class MetricReport(str, enum.Enum):  # str is a hack to make it json serializable
     # this means that this is a constant test parameter
@@ -224,6 +302,8 @@ class NeonBenchmarker:
         # property recorder here is a pytest fixture provided by junitxml module
         # https://docs.pytest.org/en/6.2.x/reference.html#pytest.junitxml.record_property
         self.property_recorder = property_recorder
+        # Wraps every record_duration block if set, see fixtures/profiling.py
+        self.profile: Optional[Callable[[str], ContextManager[None]]] = None
 
     def record(
         self,
@@ -255,9 +335,11 @@ class NeonBenchmarker:
         with zenbenchmark.record_duration('foobar_runtime'):
             foobar()   # measure this
         """
-        start = timeit.default_timer()
-        yield
-        end = timeit.default_timer()
+        # the profiler is attached before and detached after the timed block
+        with self.profile(metric_name) if self.profile is not None else nullcontext():
+            start = timeit.default_timer()
+            yield
+            end = timeit.default_timer()
 
         self.record(
             metric_name=metric_name,
@@ -266,6 +348,76 @@ class NeonBenchmarker:
             report=MetricReport.LOWER_IS_BETTER,
         )
 
+    def record_distribution(
+        self,
+        metric_name: str,
+        values: Sequence[float],
+        unit: str,
+        report: MetricReport = MetricReport.LOWER_IS_BETTER,
+        percentiles: Sequence[int] = (50, 90, 99),
+    ):
+        """
+        Record the average, the maximum and the given percentiles of a series of
+        measurements, as `{metric_name}_avg`, `{metric_name}_p50`, ..., `{metric_name}_max`.
+        """
+        if not values:
+            log.warning(f"no values to record for {metric_name}")
+            return
+
+        ordered = sorted(values)
+        self.record(f"{metric_name}_avg", sum(ordered) / len(ordered), unit, report)
+        for pct in percentiles:
+            self.record(f"{metric_name}_p{pct}", percentile(ordered, pct), unit, report)
+        self.record(f"{metric_name}_max", ordered[-1], unit, report)
+
+    def record_histogram(
+        self,
+        metric_name: str,
+        histogram: LatencyHistogram,
+        unit: str,
+        divisor: float = 1.0,
+        report: MetricReport = MetricReport.LOWER_IS_BETTER,
+        percentiles: Sequence[float] = (50, 90, 99, 99.9),
+    ):
+        """
+        Like `record_distribution`, for the values in `histogram`. The values are
+        divided by `divisor` first, e.g. 1e9 to record nanoseconds in seconds.
+        Also records the number of values as `{metric_name}_count`.
+        """
+        if histogram.count == 0:
+            log.warning(f"no values to record for {metric_name}")
+            return
+
+        self.record(f"{metric_name}_count", histogram.count, "", MetricReport.TEST_PARAM)
+        self.record(f"{metric_name}_avg", histogram.mean() / divisor, unit, report)
+        for pct in percentiles:
+            self.record(
+                f"{metric_name}_p{pct:g}", histogram.percentile(pct) / divisor, unit, report
+            )
+        self.record(f"{metric_name}_max", histogram.max / divisor, unit, report)
+
+    def record_prometheus_histogram(
+        self,
+        metric_name: str,
+        histogram: PrometheusHistogram,
+        percentiles: Sequence[float] = (50, 99),
+    ):
+        """
+        Record the count, mean and percentiles of `histogram`, a Prometheus
+        histogram of seconds, in milliseconds.
+        """
+        self.record(f"{metric_name}_count", histogram.count, "", MetricReport.TEST_PARAM)
+        self.record(
+            f"{metric_name}_avg", histogram.mean() * 1000, "ms", MetricReport.LOWER_IS_BETTER
+        )
+        for pct in percentiles:
+            self.record(
+                f"{metric_name}_p{pct:g}",
+                histogram.percentile(pct) * 1000,
+                "ms",
+                MetricReport.LOWER_IS_BETTER,
+            )
+
     def record_pg_bench_result(self, prefix: str, pg_bench_result: PgBenchRunResult):
         self.record(
             f"{prefix}.number_of_clients",
@@ -382,14 +534,8 @@ class NeonBenchmarker:
         """
         Calculate the on-disk size of a timeline
         """
-        path = f"{repo_dir}/tenants/{tenant_id}/timelines/{timeline_id}"
-
-        totalbytes = 0
-        for root, _dirs, files in os.walk(path):
-            for name in files:
-                totalbytes += os.path.getsize(os.path.join(root, name))
-
-        return totalbytes
+        path = repo_dir / "tenants" / str(tenant_id) / "timelines" / str(timeline_id)
+        return scan_dir_size(path).total_bytes
 
     @contextmanager
     def record_pageserver_writes(
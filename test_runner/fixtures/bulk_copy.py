@@ -0,0 +1,234 @@
+"""
+Bulk data sources for COPY FROM STDIN benchmarks.
+
+Formatting rows in Python one at a time while COPY runs is slow enough that a
+bulk-load benchmark ends up measuring the client instead of the server. A
+`CopyDataSource` renders a few blocks of rows upfront, in COPY text or binary
+format, and then streams the same blocks over and over. The blocks are kept as
+immutable `bytes`, which both psycopg2 and asyncpg send as is, without copying;
+only the last, partial block is sliced, through a `memoryview`.
+
+Integer columns hold a row id that counts up within the distinct blocks, so
+ids repeat every `block_rows * distinct_blocks` rows. Text values are written
+as is, so they must not contain characters that COPY text format escapes.
+"""
+
+import math
+import struct
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import AsyncIterator, Iterator, List, Optional, Sequence, Tuple, Union
+
+from fixtures.benchmark_fixture import MetricReport, NeonBenchmarker
+from fixtures.log_helper import log
+
+MB = 1024 * 1024
+
+BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+BINARY_TRAILER = struct.pack("!h", -1)
+
+
+class CopyFormat(str, Enum):
+    TEXT = "text"
+    BINARY = "binary"
+
+
+@dataclass
+class CopyColumn:
+    name: str
+    # "int4", "int8" or "text". Integer columns hold the row id.
+    type: str
+    # Text columns hold `fill`, repeated or truncated to `width` characters
+    width: int = 0
+    fill: str = "Somewhat long string to consume some space."
+
+    def text_value(self) -> str:
+        if self.width <= 0:
+            return self.fill
+        return (self.fill * (self.width // len(self.fill) + 1))[: self.width]
+
+
+DEFAULT_COLUMNS: Sequence[CopyColumn] = (CopyColumn("i", "int4"), CopyColumn("t", "text"))
+
+_SQL_TYPES = {"int4": "int", "int8": "bigint", "text": "text"}
+# struct format and size of the binary COPY field, length prefix included
+_INT_FIELDS = {"int4": ("!ii", 4), "int8": ("!iq", 8)}
+
+
+class CopyDataSource:
+    """
+    `rows` rows of `columns`, rendered in blocks of `block_rows` rows.
+
+    Usage with psycopg2:
+
+        source = CopyDataSource(1000000)
+        cur.execute(source.create_table_sql("copytest"))
+        cur.copy_expert(source.copy_sql("copytest"), source.reader())
+
+    and with asyncpg:
+
+        await conn.copy_to_table("copytest", source=source.async_chunks(), format=source.format.value)
+    """
+
+    def __init__(
+        self,
+        rows: int,
+        columns: Sequence[CopyColumn] = DEFAULT_COLUMNS,
+        format: CopyFormat = CopyFormat.TEXT,
+        block_rows: int = 10000,
+        distinct_blocks: int = 1,
+    ):
+        assert rows >= 0 and block_rows > 0 and distinct_blocks > 0
+        for column in columns:
+            assert column.type in _SQL_TYPES, f"unsupported column type {column.type}"
+        self.rows = rows
+        self.columns = list(columns)
+        self.format = format
+        self.block_rows = block_rows
+
+        start = time.perf_counter()
+        self.blocks: List[bytes] = []
+        # end offset of every row in each block, to cut the last block at a row boundary
+        self._row_ends: List[List[int]] = []
+        n_distinct = max(1, min(distinct_blocks, math.ceil(rows / block_rows)))
+        for block in range(n_distinct):
+            data, row_ends = self._render_block(block * block_rows)
+            self.blocks.append(data)
+            self._row_ends.append(row_ends)
+        self.render_seconds = time.perf_counter() - start
+
+    def _render_block(self, first_id: int) -> Tuple[bytes, List[int]]:
+        parts: List[bytes] = []
+        row_ends = []
+        size = 0
+        text_values = [c.text_value() for c in self.columns]
+        encoded_values = [v.encode() for v in text_values]
+        if self.format == CopyFormat.TEXT:
+            for row_id in range(first_id, first_id + self.block_rows):
+                text_fields = [
+                    str(row_id) if c.type != "text" else v
+                    for c, v in zip(self.columns, text_values)
+                ]
+                row = ("\t".join(text_fields) + "\n").encode()
+                parts.append(row)
+                size += len(row)
+                row_ends.append(size)
+        else:
+            column_count = struct.pack("!h", len(self.columns))
+            for row_id in range(first_id, first_id + self.block_rows):
+                binary_fields = [column_count]
+                for c, v in zip(self.columns, encoded_values):
+                    if c.type == "text":
+                        binary_fields.append(struct.pack("!i", len(v)))
+                        binary_fields.append(v)
+                    else:
+                        fmt, length = _INT_FIELDS[c.type]
+                        binary_fields.append(struct.pack(fmt, length, row_id))
+                row = b"".join(binary_fields)
+                parts.append(row)
+                size += len(row)
+                row_ends.append(size)
+        return b"".join(parts), row_ends
+
+    def create_table_sql(self, table: str) -> str:
+        columns = ", ".join(f"{c.name} {_SQL_TYPES[c.type]}" for c in self.columns)
+        return f"CREATE TABLE {table} ({columns})"
+
+    def copy_sql(self, table: str) -> str:
+        columns = ", ".join(c.name for c in self.columns)
+        return f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT {self.format.value})"
+
+    def chunks(self) -> Iterator[Union[bytes, memoryview]]:
+        """The whole COPY stream, one block at a time."""
+        if self.format == CopyFormat.BINARY:
+            yield BINARY_HEADER
+        full_blocks, last_rows = divmod(self.rows, self.block_rows)
+        for n in range(full_blocks):
+            yield self.blocks[n % len(self.blocks)]
+        if last_rows > 0:
+            idx = full_blocks % len(self.blocks)
+            yield memoryview(self.blocks[idx])[: self._row_ends[idx][last_rows - 1]]
+        if self.format == CopyFormat.BINARY:
+            yield BINARY_TRAILER
+
+    async def async_chunks(self) -> AsyncIterator[bytes]:
+        """`chunks` for asyncpg's `copy_to_table`."""
+        for chunk in self.chunks():
+            yield chunk if isinstance(chunk, bytes) else chunk.tobytes()
+
+    def reader(self) -> "CopyDataReader":
+        return CopyDataReader(self)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(len(chunk) for chunk in self.chunks())
+
+    def client_throughput(self, repeat: int = 3) -> float:
+        """
+        Bytes per second that the client side can produce without a server,
+        through the same `reader` that feeds psycopg2. Compare with the
+        throughput of the actual COPY to see whether the client is a bottleneck.
+        """
+        best = 0.0
+        for _ in range(repeat):
+            reader = self.reader()
+            start = time.perf_counter()
+            while reader.read(8192):
+                pass
+            elapsed = time.perf_counter() - start
+            best = max(best, reader.bytes_read / elapsed if elapsed > 0 else 0.0)
+        return best
+
+    def record_client_throughput(self, zenbenchmark: NeonBenchmarker, prefix: str):
+        zenbenchmark.record(
+            f"{prefix}.client_throughput",
+            self.client_throughput() / MB,
+            "MB/s",
+            MetricReport.HIGHER_IS_BETTER,
+        )
+        zenbenchmark.record(
+            f"{prefix}.client_render_time", self.render_seconds, "s", MetricReport.LOWER_IS_BETTER
+        )
+
+    def record_throughput(
+        self, zenbenchmark: NeonBenchmarker, prefix: str, seconds: float, copies: int = 1
+    ):
+        """Record the throughput of `copies` COPYs of this source that took `seconds` in total."""
+        if seconds <= 0:
+            log.warning(f"no duration to compute {prefix} throughput from")
+            return
+        zenbenchmark.record(
+            f"{prefix}.throughput",
+            self.total_bytes * copies / MB / seconds,
+            "MB/s",
+            MetricReport.HIGHER_IS_BETTER,
+        )
+        zenbenchmark.record(
+            f"{prefix}.rows_per_second",
+            self.rows * copies / seconds,
+            "",
+            MetricReport.HIGHER_IS_BETTER,
+        )
+
+
+class CopyDataReader:
+    """
+    File-like reader of a `CopyDataSource`, for psycopg2's `copy_expert`.
+    `read` ignores the requested size and returns a whole block: psycopg2 sends
+    whatever `read` returns, so this saves copying blocks into smaller pieces.
+    """
+
+    def __init__(self, source: CopyDataSource):
+        self._chunks = source.chunks()
+        self.bytes_read = 0
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        chunk = next(self._chunks, b"")
+        self.bytes_read += len(chunk)
+        # psycopg2 only accepts bytes or str
+        return chunk if isinstance(chunk, bytes) else chunk.tobytes()
+
+    def readline(self, size: Optional[int] = -1) -> bytes:
+        # COPY FROM only uses read(), but psycopg2 wants a file-like object with both
+        return self.read(size)
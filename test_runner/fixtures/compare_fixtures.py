@@ -2,7 +2,7 @@ from abc import ABC, abstractmethod
 from contextlib import _GeneratorContextManager, contextmanager
 
 # Type-related stuff
-from typing import Dict, Iterator, List
+from typing import Dict, Iterator, List, Optional
 
 import pytest
 from _pytest.fixtures import FixtureRequest
@@ -17,6 +17,7 @@ from fixtures.neon_fixtures import (
     wait_for_last_flush_lsn,
 )
 from fixtures.pg_stats import PgStatTable
+from fixtures.types import TenantId
 
 
 class PgCompare(ABC):
@@ -99,6 +100,7 @@ class NeonCompare(PgCompare):
         neon_simple_env: NeonEnv,
         pg_bin: PgBin,
         branch_name: str,
+        tenant_id: Optional[TenantId] = None,
     ):
         self.env = neon_simple_env
         self._zenbenchmark = zenbenchmark
@@ -107,14 +109,19 @@ class NeonCompare(PgCompare):
 
         # note that neon_simple_env now uses LOCAL_FS remote storage
 
-        # Create tenant
-        tenant_conf: Dict[str, str] = {}
-        if False:  # TODO add pytest setting for this
-            tenant_conf["trace_read_requests"] = "true"
-        self.tenant, _ = self.env.neon_cli.create_tenant(conf=tenant_conf)
-
-        # Create timeline
-        self.timeline = self.env.neon_cli.create_timeline(branch_name, tenant_id=self.tenant)
+        if tenant_id is None:
+            # Create tenant
+            tenant_conf: Dict[str, str] = {}
+            if False:  # TODO add pytest setting for this
+                tenant_conf["trace_read_requests"] = "true"
+            self.tenant, _ = self.env.neon_cli.create_tenant(conf=tenant_conf)
+
+            # Create timeline
+            self.timeline = self.env.neon_cli.create_timeline(branch_name, tenant_id=self.tenant)
+        else:
+            # Use an existing branch, e.g. one restored from a snapshot of a repo dir
+            self.tenant = tenant_id
+            self.timeline = dict(self.env.neon_cli.list_timelines(tenant_id))[branch_name]
 
         # Start pg
         self._pg = self.env.endpoints.create_start(branch_name, "main", self.tenant)
@@ -1,4 +1,6 @@
+import math
 from collections import defaultdict
+from dataclasses import dataclass
 from typing import Dict, List, Optional, Tuple
 
 from prometheus_client.parser import text_string_to_metric_families
@@ -46,6 +48,71 @@ def histogram(prefix_without_trailing_underscore: str) -> List[str]:
     return [f"{prefix_without_trailing_underscore}_{x}" for x in ["bucket", "count", "sum"]]
 
 
+@dataclass
+class PrometheusHistogram:
+    """
+    A Prometheus histogram, summed over all label sets that match a filter.
+    Subtract two snapshots to get the observations made in between, add
+    histograms of different processes to combine them.
+    """
+
+    # upper bound -> cumulative count, sorted by upper bound
+    buckets: Dict[float, float]
+    sum: float
+    count: float
+
+    @classmethod
+    def from_metrics(
+        cls, metrics: Metrics, name: str, filter: Optional[Dict[str, str]] = None
+    ) -> "PrometheusHistogram":
+        buckets: Dict[float, float] = defaultdict(float)
+        for sample in metrics.query_all(f"{name}_bucket", filter):
+            buckets[float(sample.labels["le"])] += sample.value
+        return cls(
+            buckets=dict(sorted(buckets.items())),
+            sum=sum(s.value for s in metrics.query_all(f"{name}_sum", filter)),
+            count=sum(s.value for s in metrics.query_all(f"{name}_count", filter)),
+        )
+
+    def __sub__(self, other: "PrometheusHistogram") -> "PrometheusHistogram":
+        return PrometheusHistogram(
+            buckets={le: n - other.buckets.get(le, 0.0) for le, n in self.buckets.items()},
+            sum=self.sum - other.sum,
+            count=self.count - other.count,
+        )
+
+    def __add__(self, other: "PrometheusHistogram") -> "PrometheusHistogram":
+        bounds = sorted(set(self.buckets) | set(other.buckets))
+        return PrometheusHistogram(
+            buckets={le: self.buckets.get(le, 0.0) + other.buckets.get(le, 0.0) for le in bounds},
+            sum=self.sum + other.sum,
+            count=self.count + other.count,
+        )
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count > 0 else 0.0
+
+    def percentile(self, pct: float) -> float:
+        """
+        Estimate a percentile by linear interpolation within its bucket, like
+        `histogram_quantile` in PromQL. Observations in the +Inf bucket are
+        reported as the largest finite bucket bound.
+        """
+        if self.count <= 0:
+            return 0.0
+        rank = self.count * pct / 100
+        lower_bound, lower_count = 0.0, 0.0
+        for le, n in self.buckets.items():
+            if n >= rank:
+                if math.isinf(le):
+                    return lower_bound
+                if n == lower_count:
+                    return le
+                return lower_bound + (le - lower_bound) * (rank - lower_count) / (n - lower_count)
+            lower_bound, lower_count = le, n
+        return lower_bound
+
+
 PAGESERVER_PER_TENANT_REMOTE_TIMELINE_CLIENT_METRICS: Tuple[str, ...] = (
     "pageserver_remote_timeline_client_calls_unfinished",
     "pageserver_remote_physical_size",
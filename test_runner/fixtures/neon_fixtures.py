@@ -66,6 +66,7 @@ from fixtures.utils import (
     ATTACHMENT_NAME_REGEX,
     allure_add_grafana_links,
     allure_attach_from_dir,
+    get_dir_size,
     get_self_dir,
     subprocess_capture,
     wait_until,
@@ -218,16 +219,6 @@ def worker_base_port(worker_seq_no: int, worker_port_num: int) -> int:
     return BASE_PORT + worker_seq_no * worker_port_num
 
 
-def get_dir_size(path: str) -> int:
-    """Return size in bytes."""
-    totalbytes = 0
-    for root, _dirs, files in os.walk(path):
-        for name in files:
-            totalbytes += os.path.getsize(os.path.join(root, name))
-
-    return totalbytes
-
-
 @pytest.fixture(scope="session")
 def port_distributor(worker_base_port: int, worker_port_num: int) -> PortDistributor:
     return PortDistributor(base_port=worker_base_port, port_number=worker_port_num)
@@ -3705,20 +3696,41 @@ def check_restored_datadir_content(test_output_dir: Path, env: NeonEnv, endpoint
     assert (mismatch, error) == ([], [])
 
 
-def logical_replication_sync(subscriber: VanillaPostgres, publisher: Endpoint) -> Lsn:
-    """Wait logical replication subscriber to sync with publisher."""
+def logical_replication_sync(
+    subscriber: VanillaPostgres,
+    publisher: Endpoint,
+    timeout: Optional[float] = None,
+    min_interval: float = 0.5,
+    max_interval: float = 0.5,
+) -> Lsn:
+    """
+    Wait logical replication subscriber to sync with publisher.
+
+    Polls every `min_interval` seconds at first, backing off up to `max_interval`
+    while the subscriber is behind. With a `timeout`, raises if the subscriber
+    hasn't caught up within that many seconds.
+    """
     publisher_lsn = Lsn(publisher.safe_psql("SELECT pg_current_wal_flush_lsn()")[0][0])
-    while True:
-        res = subscriber.safe_psql("select latest_end_lsn from pg_catalog.pg_stat_subscription")[0][
-            0
-        ]
-        if res:
-            log.info(f"subscriber_lsn={res}")
-            subscriber_lsn = Lsn(res)
-            log.info(f"Subscriber LSN={subscriber_lsn}, publisher LSN={ publisher_lsn}")
-            if subscriber_lsn >= publisher_lsn:
-                return subscriber_lsn
-        time.sleep(0.5)
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    interval = min_interval
+    subscriber_lsn = None
+    with subscriber.cursor() as cur:
+        while True:
+            cur.execute("select latest_end_lsn from pg_catalog.pg_stat_subscription")
+            row = cur.fetchone()
+            res = row[0] if row is not None else None
+            if res:
+                subscriber_lsn = Lsn(res)
+                log.info(f"Subscriber LSN={subscriber_lsn}, publisher LSN={publisher_lsn}")
+                if subscriber_lsn >= publisher_lsn:
+                    return subscriber_lsn
+            if deadline is not None and time.monotonic() >= deadline:
+                raise Exception(
+                    f"logical replication subscriber did not catch up within {timeout}s: "
+                    f"subscriber LSN={subscriber_lsn}, publisher LSN={publisher_lsn}"
+                )
+            time.sleep(interval)
+            interval = min(interval * 2, max_interval)
 
 
 def tenant_get_shards(
@@ -0,0 +1,562 @@
+"""
+Deterministic, streaming generators of TPC-H and ClickBench-like data.
+
+The data is generated row by row and fed into `COPY ... FROM STDIN` through a
+file-like adapter, so no intermediate files are written and memory use doesn't
+depend on the scale. The same seed and scale always produce the same rows.
+
+This is not the official `dbgen`: value distributions are simplified, but the
+schemas, key relationships and the vocabulary the queries filter on follow the
+specifications closely enough for the queries in `performance/tpc-h/queries`
+and the ClickBench queries in `performance/test_perf_olap.py` to produce
+realistic plans and non-empty results.
+"""
+
+import hashlib
+import random
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+from fixtures.log_helper import log
+from fixtures.neon_fixtures import PgProtocol
+from fixtures.utils import get_self_dir
+
+TPCH_DIR = get_self_dir().parent / "performance" / "tpc-h"
+
+Row = Sequence[Any]
+
+
+class CopyReader:
+    """
+    A read-only file-like object rendering rows from an iterator in the COPY text
+    format on demand, to be passed to psycopg2's `copy_expert`.
+
+    Values are rendered with `str()`, None becomes NULL. The generators below
+    never produce tabs, newlines or backslashes, so no escaping is done.
+    """
+
+    def __init__(self, rows: Iterator[Row]):
+        self._rows = rows
+        self._pending = b""
+        self.rows_read = 0
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunks = [self._pending]
+        length = len(self._pending)
+        while size < 0 or length < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = ("\t".join("\\N" if v is None else str(v) for v in row) + "\n").encode()
+            chunks.append(line)
+            length += len(line)
+            self.rows_read += 1
+
+        data = b"".join(chunks)
+        if 0 <= size < len(data):
+            data, self._pending = data[:size], data[size:]
+        else:
+            self._pending = b""
+        self.bytes_read += len(data)
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        # COPY FROM only uses read(), but psycopg2 wants a file-like object with both
+        return self.read(size)
+
+
+@dataclass
+class OlapTable:
+    name: str
+    # Generate the rows of the table for the given scale and seed
+    rows: Callable[[float, int], Iterator[Row]]
+
+
+@dataclass
+class OlapDataset:
+    name: str
+    schema_sql: str
+    # Statements to run after the data is loaded, e.g. to create indexes
+    post_load_sql: str
+    tables: List[OlapTable]
+
+
+def _rng(seed: int, *parts: Any) -> random.Random:
+    """An RNG for one table or one entity, independent of the generation order of the others."""
+    return random.Random(f"{seed}:" + ":".join(str(p) for p in parts))
+
+
+def _money(cents: int) -> str:
+    return f"{cents // 100}.{cents % 100:02d}"
+
+
+def _hash64(value: str) -> int:
+    """A stable signed 64-bit hash, like ClickBench's URLHash and RefererHash columns."""
+    return int.from_bytes(
+        hashlib.blake2b(value.encode(), digest_size=8).digest(), "big", signed=True
+    )
+
+
+#
+# TPC-H
+#
+
+TPCH_REGIONS = ["AFRICA", "AMERICA", "ASIA", "EUROPE", "MIDDLE EAST"]
+# (name, region key), in the order of the specification
+TPCH_NATIONS = [
+    ("ALGERIA", 0), ("ARGENTINA", 1), ("BRAZIL", 1), ("CANADA", 1), ("EGYPT", 4),
+    ("ETHIOPIA", 0), ("FRANCE", 3), ("GERMANY", 3), ("INDIA", 2), ("INDONESIA", 2),
+    ("IRAN", 4), ("IRAQ", 4), ("JAPAN", 2), ("JORDAN", 4), ("KENYA", 0),
+    ("MOROCCO", 0), ("MOZAMBIQUE", 0), ("PERU", 1), ("CHINA", 2), ("ROMANIA", 3),
+    ("SAUDI ARABIA", 4), ("VIETNAM", 2), ("RUSSIA", 3), ("UNITED KINGDOM", 3),
+    ("UNITED STATES", 1),
+]  # fmt: skip
+TPCH_COLORS = [
+    "almond", "antique", "aquamarine", "azure", "beige", "bisque", "black", "blanched",
+    "blue", "blush", "brown", "burlywood", "burnished", "chartreuse", "chiffon", "chocolate",
+    "coral", "cornflower", "cornsilk", "cream", "cyan", "dark", "deep", "dim", "dodger",
+    "drab", "firebrick", "floral", "forest", "frosted", "gainsboro", "ghost", "goldenrod",
+    "green", "grey", "honeydew", "hot", "indian", "ivory", "khaki", "lace", "lavender",
+    "lawn", "lemon", "light", "lime", "linen", "magenta", "maroon", "medium", "metallic",
+    "midnight", "mint", "misty", "moccasin", "navajo", "navy", "olive", "orange", "orchid",
+    "pale", "papaya", "peach", "peru", "pink", "plum", "powder", "puff", "purple", "red",
+    "rose", "rosy", "royal", "saddle", "salmon", "sandy", "seashell", "sienna", "sky",
+    "slate", "smoke", "snow", "spring", "steel", "tan", "thistle", "tomato", "turquoise",
+    "violet", "wheat", "white", "yellow",
+]  # fmt: skip
+TPCH_TYPES = (
+    ["STANDARD", "SMALL", "MEDIUM", "LARGE", "ECONOMY", "PROMO"],
+    ["ANODIZED", "BURNISHED", "PLATED", "POLISHED", "BRUSHED"],
+    ["TIN", "NICKEL", "BRASS", "STEEL", "COPPER"],
+)
+TPCH_CONTAINERS = (
+    ["SM", "LG", "MED", "JUMBO", "WRAP"],
+    ["CASE", "BOX", "BAG", "JAR", "PKG", "PACK", "CAN", "DRUM"],
+)
+TPCH_SEGMENTS = ["AUTOMOBILE", "BUILDING", "FURNITURE", "MACHINERY", "HOUSEHOLD"]
+TPCH_PRIORITIES = ["1-URGENT", "2-HIGH", "3-MEDIUM", "4-NOT SPECIFIED", "5-LOW"]
+TPCH_SHIP_INSTRUCTIONS = ["DELIVER IN PERSON", "COLLECT COD", "NONE", "TAKE BACK RETURN"]
+TPCH_SHIP_MODES = ["REG AIR", "AIR", "RAIL", "SHIP", "TRUCK", "MAIL", "FOB"]
+# Words for the free-text comments, including the ones queries 13 and 16 look for
+TPCH_WORDS = [
+    "furiously", "quickly", "carefully", "blithely", "slyly", "fluffily", "final", "ironic",
+    "regular", "express", "pending", "bold", "even", "special", "unusual", "silent",
+    "requests", "deposits", "packages", "accounts", "instructions", "theodolites", "foxes",
+    "pinto", "beans", "asymptotes", "Customer", "Complaints", "sleep", "haggle", "nag",
+    "wake", "cajole", "detect", "integrate", "among", "above", "across", "after",
+]  # fmt: skip
+
+TPCH_START_DATE = date(1992, 1, 1)
+TPCH_END_DATE = date(1998, 12, 31)
+TPCH_CURRENT_DATE = date(1995, 6, 17)
+# Orders are placed up to 151 days before the end date, so that all lines ship in time
+TPCH_ORDER_DAYS = (TPCH_END_DATE - TPCH_START_DATE).days - 151
+
+
+def _tpch_count(base: int, scale: float) -> int:
+    return max(1, int(base * scale))
+
+
+def _tpch_text(rng: random.Random, max_len: int) -> str:
+    words: List[str] = []
+    length = -1
+    target = rng.randint(max_len // 3, max_len)
+    while True:
+        word = rng.choice(TPCH_WORDS)
+        if length + 1 + len(word) > target:
+            break
+        words.append(word)
+        length += 1 + len(word)
+    return " ".join(words)
+
+
+def _tpch_phone(rng: random.Random, nationkey: int) -> str:
+    return f"{nationkey + 10}-{rng.randint(100, 999)}-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}"
+
+
+def _tpch_part_retailprice(partkey: int) -> int:
+    """Retail price in cents, as defined by the specification."""
+    return 90000 + (partkey // 10) % 20001 + 100 * (partkey % 1000)
+
+
+def _tpch_suppliers(scale: float) -> int:
+    # every part has four different suppliers
+    return max(4, int(10_000 * scale))
+
+
+def _tpch_part_supplier(partkey: int, i: int, suppliers: int) -> int:
+    """
+    The i-th (0..3) supplier of a part. Unlike the formula of the specification,
+    this gives four different suppliers at any scale.
+    """
+    return (partkey - 1 + i * (suppliers // 4)) % suppliers + 1
+
+
+def _tpch_region(scale: float, seed: int) -> Iterator[Row]:
+    rng = _rng(seed, "region")
+    for key, name in enumerate(TPCH_REGIONS):
+        yield (key, name, _tpch_text(rng, 152))
+
+
+def _tpch_nation(scale: float, seed: int) -> Iterator[Row]:
+    rng = _rng(seed, "nation")
+    for key, (name, regionkey) in enumerate(TPCH_NATIONS):
+        yield (key, name, regionkey, _tpch_text(rng, 152))
+
+
+def _tpch_supplier(scale: float, seed: int) -> Iterator[Row]:
+    rng = _rng(seed, "supplier")
+    for key in range(1, _tpch_suppliers(scale) + 1):
+        nationkey = rng.randrange(len(TPCH_NATIONS))
+        comment = _tpch_text(rng, 101)
+        # a few suppliers have complaints, query 16 excludes them
+        if key % 1000 == 7:
+            comment = f"{comment[:60]} Customer slyly Complaints"
+        yield (
+            key,
+            f"Supplier#{key:09d}",
+            _tpch_text(rng, 40),
+            nationkey,
+            _tpch_phone(rng, nationkey),
+            _money(rng.randint(-99999, 999999)),
+            comment,
+        )
+
+
+def _tpch_part(scale: float, seed: int) -> Iterator[Row]:
+    rng = _rng(seed, "part")
+    for key in range(1, _tpch_count(200_000, scale) + 1):
+        mfgr = rng.randint(1, 5)
+        yield (
+            key,
+            " ".join(rng.sample(TPCH_COLORS, 5)),
+            f"Manufacturer#{mfgr}",
+            f"Brand#{mfgr}{rng.randint(1, 5)}",
+            " ".join(rng.choice(syllable) for syllable in TPCH_TYPES),
+            rng.randint(1, 50),
+            " ".join(rng.choice(syllable) for syllable in TPCH_CONTAINERS),
+            _money(_tpch_part_retailprice(key)),
+            _tpch_text(rng, 23),
+        )
+
+
+def _tpch_partsupp(scale: float, seed: int) -> Iterator[Row]:
+    rng = _rng(seed, "partsupp")
+    suppliers = _tpch_suppliers(scale)
+    for partkey in range(1, _tpch_count(200_000, scale) + 1):
+        for i in range(4):
+            yield (
+                partkey,
+                _tpch_part_supplier(partkey, i, suppliers),
+                rng.randint(1, 9999),
+                _money(rng.randint(100, 100000)),
+                _tpch_text(rng, 199),
+            )
+
+
+def _tpch_customer(scale: float, seed: int) -> Iterator[Row]:
+    rng = _rng(seed, "customer")
+    for key in range(1, _tpch_count(150_000, scale) + 1):
+        nationkey = rng.randrange(len(TPCH_NATIONS))
+        yield (
+            key,
+            f"Customer#{key:09d}",
+            _tpch_text(rng, 40),
+            nationkey,
+            _tpch_phone(rng, nationkey),
+            _money(rng.randint(-99999, 999999)),
+            rng.choice(TPCH_SEGMENTS),
+            _tpch_text(rng, 117),
+        )
+
+
+@dataclass
+class _TpchLine:
+    partkey: int
+    suppkey: int
+    quantity: int
+    # in cents
+    extendedprice: int
+    # in hundredths
+    discount: int
+    tax: int
+    returnflag: str
+    linestatus: str
+    shipdate: date
+    commitdate: date
+    receiptdate: date
+
+
+def _tpch_order(
+    orderkey: int, scale: float, seed: int
+) -> Tuple[random.Random, int, date, List[_TpchLine]]:
+    """
+    Generate the customer, date and lines of one order. Both the `orders` and the
+    `lineitem` tables are generated from this, so that they agree.
+    """
+    # seeding with an int is much cheaper than with a string, this runs for every order twice
+    rng = random.Random((seed << 40) | orderkey)
+    customers = _tpch_count(150_000, scale)
+    parts = _tpch_count(200_000, scale)
+    suppliers = _tpch_suppliers(scale)
+
+    # a third of the customers never place orders, queries 13 and 22 look for them
+    custkey = rng.randint(1, customers)
+    while custkey % 3 == 0 and customers >= 3:
+        custkey = rng.randint(1, customers)
+    orderdate = TPCH_START_DATE + timedelta(days=rng.randint(0, TPCH_ORDER_DAYS))
+
+    lines = []
+    for _ in range(rng.randint(1, 7)):
+        partkey = rng.randint(1, parts)
+        quantity = rng.randint(1, 50)
+        shipdate = orderdate + timedelta(days=rng.randint(1, 121))
+        receiptdate = shipdate + timedelta(days=rng.randint(1, 30))
+        if receiptdate <= TPCH_CURRENT_DATE:
+            returnflag = rng.choice("RA")
+        else:
+            returnflag = "N"
+        lines.append(
+            _TpchLine(
+                partkey=partkey,
+                suppkey=_tpch_part_supplier(partkey, rng.randrange(4), suppliers),
+                quantity=quantity,
+                extendedprice=quantity * _tpch_part_retailprice(partkey),
+                discount=rng.randint(0, 10),
+                tax=rng.randint(0, 8),
+                returnflag=returnflag,
+                linestatus="O" if shipdate > TPCH_CURRENT_DATE else "F",
+                shipdate=shipdate,
+                commitdate=orderdate + timedelta(days=rng.randint(30, 90)),
+                receiptdate=receiptdate,
+            )
+        )
+    return rng, custkey, orderdate, lines
+
+
+def _tpch_orders(scale: float, seed: int) -> Iterator[Row]:
+    for key in range(1, _tpch_count(1_500_000, scale) + 1):
+        rng, custkey, orderdate, lines = _tpch_order(key, scale, seed)
+        statuses = {line.linestatus for line in lines}
+        status = "P" if len(statuses) > 1 else ("F" if statuses == {"F"} else "O")
+        totalprice = sum(
+            line.extendedprice * (100 - line.discount) * (100 + line.tax) // 10000 for line in lines
+        )
+        comment = _tpch_text(rng, 79)
+        # query 13 excludes orders with special requests
+        if key % 50 == 0:
+            comment = f"{comment[:50]} special deposits requests"
+        yield (
+            key,
+            custkey,
+            status,
+            _money(totalprice),
+            orderdate.isoformat(),
+            rng.choice(TPCH_PRIORITIES),
+            f"Clerk#{rng.randint(1, max(1, int(1000 * scale))):09d}",
+            0,
+            comment,
+        )
+
+
+def _tpch_lineitem(scale: float, seed: int) -> Iterator[Row]:
+    for key in range(1, _tpch_count(1_500_000, scale) + 1):
+        rng, _, _, lines = _tpch_order(key, scale, seed)
+        for number, line in enumerate(lines, start=1):
+            yield (
+                key,
+                line.partkey,
+                line.suppkey,
+                number,
+                line.quantity,
+                _money(line.extendedprice),
+                f"0.{line.discount:02d}",
+                f"0.{line.tax:02d}",
+                line.returnflag,
+                line.linestatus,
+                line.shipdate.isoformat(),
+                line.commitdate.isoformat(),
+                line.receiptdate.isoformat(),
+                rng.choice(TPCH_SHIP_INSTRUCTIONS),
+                rng.choice(TPCH_SHIP_MODES),
+                _tpch_text(rng, 44),
+            )
+
+
+def tpch_dataset() -> OlapDataset:
+    """TPC-H, scale 1 is the official scale factor 1: 6M rows in `lineitem`, about 1GB."""
+    return OlapDataset(
+        name="tpch",
+        schema_sql=(TPCH_DIR / "create-schema.sql").read_text(),
+        post_load_sql=(TPCH_DIR / "create-indexes.sql").read_text(),
+        tables=[
+            OlapTable("region", _tpch_region),
+            OlapTable("nation", _tpch_nation),
+            OlapTable("supplier", _tpch_supplier),
+            OlapTable("part", _tpch_part),
+            OlapTable("partsupp", _tpch_partsupp),
+            OlapTable("customer", _tpch_customer),
+            OlapTable("orders", _tpch_orders),
+            OlapTable("lineitem", _tpch_lineitem),
+        ],
+    )
+
+
+#
+# ClickBench
+#
+
+# The columns of ClickBench's `hits` table used by the queries, with the same types
+HITS_SCHEMA = """
+CREATE TABLE hits (
+    WatchID BIGINT NOT NULL,
+    Title TEXT NOT NULL,
+    EventTime TIMESTAMP NOT NULL,
+    EventDate DATE NOT NULL,
+    CounterID INTEGER NOT NULL,
+    ClientIP INTEGER NOT NULL,
+    RegionID INTEGER NOT NULL,
+    UserID BIGINT NOT NULL,
+    URL TEXT NOT NULL,
+    Referer TEXT NOT NULL,
+    IsRefresh SMALLINT NOT NULL,
+    ResolutionWidth SMALLINT NOT NULL,
+    MobilePhone SMALLINT NOT NULL,
+    MobilePhoneModel TEXT NOT NULL,
+    TraficSourceID SMALLINT NOT NULL,
+    SearchEngineID SMALLINT NOT NULL,
+    SearchPhrase TEXT NOT NULL,
+    AdvEngineID SMALLINT NOT NULL,
+    WindowClientWidth SMALLINT NOT NULL,
+    WindowClientHeight SMALLINT NOT NULL,
+    IsLink SMALLINT NOT NULL,
+    IsDownload SMALLINT NOT NULL,
+    DontCountHits SMALLINT NOT NULL,
+    RefererHash BIGINT NOT NULL,
+    URLHash BIGINT NOT NULL,
+    PRIMARY KEY (CounterID, EventDate, UserID, EventTime, WatchID)
+);
+"""
+
+HITS_DOMAINS = [
+    "google.com", "www.google.ru", "yandex.ru", "mail.ru", "avito.ru", "vk.com",
+    "news.example.com", "shop.example.org", "auto.ru", "kinopoisk.ru",
+]  # fmt: skip
+HITS_WORDS = [
+    "weather", "news", "cars", "buy", "cheap", "online", "free", "download", "video",
+    "music", "game", "recipe", "hotel", "flight", "phone", "review", "price", "moscow",
+]  # fmt: skip
+HITS_PHONE_MODELS = ["iPhone", "iPad", "Galaxy", "Lumia", "Xperia", "Nexus", "Redmi"]
+HITS_RESOLUTIONS = [(1024, 768), (1280, 1024), (1366, 768), (1440, 900), (1920, 1080)]
+HITS_START = datetime(2013, 7, 1)
+HITS_DAYS = 31
+
+
+def _hits_url(rng: random.Random) -> str:
+    path = "/".join(rng.choices(HITS_WORDS, k=rng.randint(1, 4)))
+    return f"http://{rng.choice(HITS_DOMAINS)}/{path}"
+
+
+def _hits(scale: float, seed: int) -> Iterator[Row]:
+    rng = _rng(seed, "hits")
+    rows = max(1, int(10_000_000 * scale))
+    users = [rng.getrandbits(63) for _ in range(max(1, rows // 20))]
+    client_ips = [rng.randint(-(2**31), 2**31 - 1) for _ in range(max(1, rows // 10))]
+    # a fixed pool of pages, so that the GROUP BY URL and Title queries find popular ones
+    pages = [(_hits_url(rng), " ".join(rng.choices(HITS_WORDS, k=3))) for _ in range(1000)]
+    phrases = [" ".join(rng.choices(HITS_WORDS, k=rng.randint(1, 3))) for _ in range(5000)]
+
+    for _ in range(rows):
+        event_time = HITS_START + timedelta(seconds=rng.randrange(HITS_DAYS * 86400))
+        # a few counters get most of the hits, queries 36-42 look at counter 62
+        counter_id = 62 if rng.random() < 0.2 else int(rng.paretovariate(1.2)) % 100000
+        url, title = rng.choice(pages)
+        # the Title column sometimes mentions Google, queries 22 and 23 search for it
+        if "google" in url:
+            title = f"Google {title}"
+        referer = _hits_url(rng) if rng.random() < 0.6 else ""
+        mobile_phone = rng.randint(1, 10) if rng.random() < 0.1 else 0
+        search_engine = rng.randint(1, 50) if rng.random() < 0.3 else 0
+        width, height = rng.choice(HITS_RESOLUTIONS)
+        yield (
+            rng.getrandbits(63),
+            title,
+            event_time.isoformat(" "),
+            event_time.date().isoformat(),
+            counter_id,
+            rng.choice(client_ips),
+            rng.randint(0, 300),
+            rng.choice(users),
+            url,
+            referer,
+            int(rng.random() < 0.1),
+            width,
+            mobile_phone,
+            rng.choice(HITS_PHONE_MODELS) if mobile_phone else "",
+            rng.randint(-1, 9),
+            search_engine,
+            rng.choice(phrases) if search_engine else "",
+            rng.randint(1, 30) if rng.random() < 0.05 else 0,
+            width - rng.randint(0, 100),
+            height - rng.randint(100, 300),
+            int(rng.random() < 0.05),
+            int(rng.random() < 0.01),
+            int(rng.random() < 0.02),
+            _hash64(referer),
+            _hash64(url),
+        )
+
+
+def clickbench_dataset() -> OlapDataset:
+    """ClickBench `hits`, scale 1 is 10M rows, a tenth of the original dataset."""
+    return OlapDataset(
+        name="clickbench",
+        schema_sql=HITS_SCHEMA,
+        post_load_sql="",
+        tables=[OlapTable("hits", _hits)],
+    )
+
+
+OLAP_DATASETS: Dict[str, Callable[[], OlapDataset]] = {
+    "tpch": tpch_dataset,
+    "clickbench": clickbench_dataset,
+}
+
+
+def load_olap_dataset(
+    pg: PgProtocol, dataset: OlapDataset, scale: float, seed: int = 0, **kwargs: Any
+) -> Dict[str, int]:
+    """
+    Create the dataset's tables and stream the generated rows into them with COPY.
+    Extra arguments are passed to `pg.connect`. Returns the number of rows per table.
+    """
+    rows: Dict[str, int] = {}
+    with closing(pg.connect(**kwargs)) as conn, conn.cursor() as cur:
+        cur.execute(dataset.schema_sql)
+        for table in dataset.tables:
+            reader = CopyReader(table.rows(scale, seed))
+            cur.copy_expert(f"COPY {table.name} FROM STDIN", reader, size=256 * 1024)
+            rows[table.name] = reader.rows_read
+            log.info(
+                f"Loaded {reader.rows_read} rows ({reader.bytes_read} bytes) into {table.name}"
+            )
+        if dataset.post_load_sql:
+            cur.execute(dataset.post_load_sql)
+        cur.execute("VACUUM (FREEZE, ANALYZE)")
+    return rows
+
+
+def olap_dataset_fingerprint(dataset: OlapDataset, scale: float, seed: int = 0) -> str:
+    """
+    A short hash of the schema and the first rows of every table, to tell whether a
+    cached copy of a dataset was generated by the same version of the generator.
+    """
+    h = hashlib.blake2b(digest_size=8)
+    h.update(dataset.schema_sql.encode())
+    h.update(dataset.post_load_sql.encode())
+    for table in dataset.tables:
+        h.update(CopyReader(table.rows(scale, seed)).read(64 * 1024))
+    return h.hexdigest()
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
 import json
+import random
+import threading
 import time
 from collections import defaultdict
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Set, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple, Union
 
 import requests
 from requests.adapters import HTTPAdapter
@@ -12,10 +15,14 @@ from urllib3.util.retry import Retry
 
 from fixtures.log_helper import log
 from fixtures.metrics import Metrics, parse_metrics
+from fixtures.pageserver.types import LayerTable
 from fixtures.pg_version import PgVersion
 from fixtures.types import Lsn, TenantId, TenantShardId, TimelineId
 from fixtures.utils import Fn
 
+if TYPE_CHECKING:
+    from fixtures.benchmark_fixture import NeonBenchmarker
+
 
 class PageserverApiException(Exception):
     def __init__(self, message, status_code: int):
@@ -78,19 +85,21 @@ class LayerMapInfo:
 
     @classmethod
     def from_json(cls, d: Dict[str, Any]) -> LayerMapInfo:
-        info = LayerMapInfo(in_memory_layers=[], historic_layers=[])
-
         json_in_memory_layers = d["in_memory_layers"]
         assert isinstance(json_in_memory_layers, List)
-        for json_in_memory_layer in json_in_memory_layers:
-            info.in_memory_layers.append(InMemoryLayerInfo.from_json(json_in_memory_layer))
-
         json_historic_layers = d["historic_layers"]
         assert isinstance(json_historic_layers, List)
-        for json_historic_layer in json_historic_layers:
-            info.historic_layers.append(HistoricLayerInfo.from_json(json_historic_layer))
 
-        return info
+        return LayerMapInfo(
+            in_memory_layers=[InMemoryLayerInfo.from_json(x) for x in json_in_memory_layers],
+            historic_layers=[HistoricLayerInfo.from_json(x) for x in json_historic_layers],
+        )
+
+    def layer_table(self) -> LayerTable:
+        """Columnar view of the historic layers, see `LayerTable`."""
+        return LayerTable.from_layers(
+            (x.layer_file_name, x.layer_file_size) for x in self.historic_layers
+        )
 
     def kind_count(self) -> Dict[str, int]:
         counts: Dict[str, int] = defaultdict(int)
@@ -110,6 +119,93 @@ class LayerMapInfo:
         return set(x.layer_file_name for x in self.historic_layers)
 
 
+@dataclass
+class LayerFilter:
+    """
+    Selects historic layers for the bulk layer operations of `PageserverHttpClient`.
+    All conditions that are set must hold.
+    """
+
+    # "Delta" and/or "Image"
+    kinds: Optional[Set[str]] = None
+    # Layers that overlap with [lsn_min, lsn_max)
+    lsn_min: Optional[Lsn] = None
+    lsn_max: Optional[Lsn] = None
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+    # True for layers that are only in remote storage, False for resident layers
+    remote: Optional[bool] = None
+    # Of the matching layers, pick this fraction at random
+    fraction: float = 1.0
+    seed: int = 0
+
+    def matches(self, layer: HistoricLayerInfo) -> bool:
+        if self.kinds is not None and layer.kind not in self.kinds:
+            return False
+        if self.remote is not None and layer.remote != self.remote:
+            return False
+        size = layer.layer_file_size or 0
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        lsn_start = Lsn(layer.lsn_start)
+        # image layers cover a single LSN
+        lsn_end = Lsn(layer.lsn_end) if layer.lsn_end is not None else lsn_start + 1
+        if self.lsn_min is not None and lsn_end <= self.lsn_min:
+            return False
+        if self.lsn_max is not None and lsn_start >= self.lsn_max:
+            return False
+        return True
+
+    def select(self, layers: List[HistoricLayerInfo]) -> List[HistoricLayerInfo]:
+        matching = sorted((x for x in layers if self.matches(x)), key=lambda x: x.layer_file_name)
+        if self.fraction >= 1.0:
+            return matching
+        n = round(len(matching) * self.fraction)
+        return random.Random(self.seed).sample(matching, n)
+
+
+@dataclass
+class BulkLayerResult:
+    """Outcome of a bulk layer eviction or download."""
+
+    op: str
+    layers: int = 0
+    # sum of the sizes of the layers, as reported by the layer map
+    bytes: int = 0
+    seconds: float = 0.0
+    # layer file name -> error, for the layers that failed
+    errors: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def layers_per_second(self) -> float:
+        return self.layers / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.seconds if self.seconds > 0 else 0.0
+
+    def record(self, zenbenchmark: NeonBenchmarker, prefix: str):
+        from fixtures.benchmark_fixture import MetricReport
+
+        zenbenchmark.record(f"{prefix}.layers", self.layers, "", MetricReport.TEST_PARAM)
+        zenbenchmark.record(
+            f"{prefix}.bytes", self.bytes / (1024 * 1024), "MB", MetricReport.TEST_PARAM
+        )
+        zenbenchmark.record(f"{prefix}.duration", self.seconds, "s", MetricReport.LOWER_IS_BETTER)
+        zenbenchmark.record(
+            f"{prefix}.layers_per_second", self.layers_per_second, "", MetricReport.HIGHER_IS_BETTER
+        )
+        zenbenchmark.record(
+            f"{prefix}.throughput",
+            self.bytes_per_second / (1024 * 1024),
+            "MB/s",
+            MetricReport.HIGHER_IS_BETTER,
+        )
+        zenbenchmark.record(f"{prefix}.errors", len(self.errors), "", MetricReport.LOWER_IS_BETTER)
+
+
 @dataclass
 class TenantConfig:
     tenant_specific_overrides: Dict[str, Any]
@@ -755,12 +851,8 @@ class PageserverHttpClient(requests.Session):
 
     def download_all_layers(
         self, tenant_id: Union[TenantId, TenantShardId], timeline_id: TimelineId
-    ):
-        info = self.layer_map_info(tenant_id, timeline_id)
-        for layer in info.historic_layers:
-            if not layer.remote:
-                continue
-            self.download_layer(tenant_id, timeline_id, layer.layer_file_name)
+    ) -> BulkLayerResult:
+        return self.download_layers(tenant_id, timeline_id, LayerFilter(remote=True))
 
     def evict_layer(
         self, tenant_id: Union[TenantId, TenantShardId], timeline_id: TimelineId, layer_name: str
@@ -772,10 +864,102 @@ class PageserverHttpClient(requests.Session):
 
         assert res.status_code in (200, 304)
 
-    def evict_all_layers(self, tenant_id: Union[TenantId, TenantShardId], timeline_id: TimelineId):
-        info = self.layer_map_info(tenant_id, timeline_id)
-        for layer in info.historic_layers:
-            self.evict_layer(tenant_id, timeline_id, layer.layer_file_name)
+    def evict_all_layers(
+        self, tenant_id: Union[TenantId, TenantShardId], timeline_id: TimelineId
+    ) -> BulkLayerResult:
+        return self.evict_layers(tenant_id, timeline_id, LayerFilter(remote=False))
+
+    def download_layers(
+        self,
+        tenant_id: Union[TenantId, TenantShardId],
+        timeline_id: TimelineId,
+        filter: Optional[LayerFilter] = None,
+        parallelism: int = 8,
+        raise_on_error: bool = True,
+    ) -> BulkLayerResult:
+        """Download the layers selected by `filter`, `parallelism` at a time."""
+        return self._bulk_layer_op(
+            "download", tenant_id, timeline_id, filter, parallelism, raise_on_error
+        )
+
+    def evict_layers(
+        self,
+        tenant_id: Union[TenantId, TenantShardId],
+        timeline_id: TimelineId,
+        filter: Optional[LayerFilter] = None,
+        parallelism: int = 8,
+        raise_on_error: bool = True,
+    ) -> BulkLayerResult:
+        """Evict the layers selected by `filter`, `parallelism` at a time."""
+        return self._bulk_layer_op(
+            "evict", tenant_id, timeline_id, filter, parallelism, raise_on_error
+        )
+
+    def _bulk_layer_op(
+        self,
+        op: str,
+        tenant_id: Union[TenantId, TenantShardId],
+        timeline_id: TimelineId,
+        filter: Optional[LayerFilter],
+        parallelism: int,
+        raise_on_error: bool,
+    ) -> BulkLayerResult:
+        layers = (filter or LayerFilter()).select(
+            self.layer_map_info(tenant_id, timeline_id).historic_layers
+        )
+
+        # requests.Session isn't thread-safe, give every worker a client of its
+        # own, which keeps its connection alive between requests
+        local = threading.local()
+        clients: List[PageserverHttpClient] = []
+        clients_lock = threading.Lock()
+
+        def client() -> PageserverHttpClient:
+            c: Optional[PageserverHttpClient] = getattr(local, "client", None)
+            if c is None:
+                c = PageserverHttpClient(
+                    self.port, self.is_testing_enabled_or_skip, self.auth_token
+                )
+                local.client = c
+                with clients_lock:
+                    clients.append(c)
+            return c
+
+        def run(layer: HistoricLayerInfo) -> Optional[str]:
+            try:
+                if op == "evict":
+                    client().evict_layer(tenant_id, timeline_id, layer.layer_file_name)
+                else:
+                    client().download_layer(tenant_id, timeline_id, layer.layer_file_name)
+            except Exception as e:
+                return str(e) or type(e).__name__
+            return None
+
+        result = BulkLayerResult(op)
+        start = time.monotonic()
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, parallelism)) as executor:
+                for layer, error in zip(layers, executor.map(run, layers)):
+                    if error is None:
+                        result.layers += 1
+                        result.bytes += layer.layer_file_size or 0
+                    else:
+                        result.errors[layer.layer_file_name] = error
+        finally:
+            for c in clients:
+                c.close()
+        result.seconds = time.monotonic() - start
+
+        log.info(
+            f"{op} of {result.layers} layers ({result.bytes} bytes) of {tenant_id}/{timeline_id} "
+            f"took {result.seconds:.3f}s, {len(result.errors)} errors"
+        )
+        if raise_on_error and result.errors:
+            name, error = next(iter(result.errors.items()))
+            raise PageserverApiException(
+                f"{op} failed for {len(result.errors)} layers, e.g. {name}: {error}", 500
+            )
+        return result
 
     def disk_usage_eviction_run(self, request: dict[str, Any]):
         res = self.put(
@@ -0,0 +1,263 @@
+"""
+Per-phase accounting of what checkpoint, compaction and GC do to a timeline.
+
+`LayerAccounting` takes a snapshot of the timeline's layer map, sizes and IO
+metrics before and after each phase, e.g. a `timeline_compact` call, and keeps
+the differences. This shows how many layers and bytes each phase created and
+removed, not just how long it took.
+"""
+
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Union
+
+from fixtures.benchmark_fixture import MetricReport, NeonBenchmarker
+from fixtures.metrics import Metrics
+from fixtures.pageserver.http import PageserverHttpClient
+from fixtures.types import Lsn, TenantId, TenantShardId, TimelineId
+
+MB = 1024 * 1024
+
+
+@dataclass
+class TimelineSnapshot:
+    # layer file name -> file size
+    layers: Dict[str, int]
+    last_record_lsn: Lsn
+    logical_size: int
+    physical_size: int
+    # pageserver_written_persistent_bytes_total and pageserver_created_persistent_files_total
+    bytes_written: int
+    files_created: int
+    io_read_bytes: int
+    io_write_bytes: int
+    remote_upload_bytes: int
+
+    @classmethod
+    def take(
+        cls,
+        pageserver_http: PageserverHttpClient,
+        tenant_id: Union[TenantId, TenantShardId],
+        timeline_id: TimelineId,
+    ) -> "TimelineSnapshot":
+        layer_map = pageserver_http.layer_map_info(tenant_id, timeline_id)
+        detail = pageserver_http.timeline_detail(tenant_id, timeline_id)
+        metrics = pageserver_http.get_metrics()
+        # metrics are labelled with the tenant id, without the shard number
+        tenant = tenant_id.tenant_id if isinstance(tenant_id, TenantShardId) else tenant_id
+        labels = {"tenant_id": str(tenant), "timeline_id": str(timeline_id)}
+
+        def counter(name: str, **extra_labels: str) -> int:
+            return _sum_samples(metrics, name, {**labels, **extra_labels})
+
+        return cls(
+            layers={x.layer_file_name: x.layer_file_size or 0 for x in layer_map.historic_layers},
+            last_record_lsn=Lsn(detail["last_record_lsn"]),
+            logical_size=int(detail["current_logical_size"]),
+            physical_size=int(detail["current_physical_size"]),
+            bytes_written=counter("pageserver_written_persistent_bytes_total"),
+            files_created=counter("pageserver_created_persistent_files_total"),
+            io_read_bytes=counter("pageserver_io_operations_bytes_total", operation="read"),
+            io_write_bytes=counter("pageserver_io_operations_bytes_total", operation="write"),
+            remote_upload_bytes=counter(
+                "pageserver_remote_timeline_client_bytes_finished_total",
+                file_kind="layer",
+                op_kind="upload",
+            ),
+        )
+
+
+def _sum_samples(metrics: Metrics, name: str, labels: Dict[str, str]) -> int:
+    return int(sum(sample.value for sample in metrics.query_all(name, labels)))
+
+
+@dataclass
+class PhaseReport:
+    index: int
+    name: str
+    duration: float
+    layers_created: int
+    layers_deleted: int
+    bytes_created: int
+    bytes_deleted: int
+    bytes_written: int
+    files_created: int
+    io_read_bytes: int
+    io_write_bytes: int
+    remote_upload_bytes: int
+    # WAL ingested since the end of the previous phase of the same name, i.e. the
+    # WAL this phase had to process
+    wal_bytes: int
+    logical_size: int
+    physical_size: int
+
+    @property
+    def write_amplification(self) -> float:
+        return self.bytes_written / self.wal_bytes if self.wal_bytes > 0 else 0.0
+
+    @property
+    def physical_logical_ratio(self) -> float:
+        return self.physical_size / self.logical_size if self.logical_size > 0 else 0.0
+
+
+class LayerAccounting:
+    """
+    Usage:
+
+        accounting = LayerAccounting(pageserver_http, tenant_id, timeline_id)
+        run_workload()
+        accounting.checkpoint()
+        accounting.compact()
+        accounting.gc(0)
+        accounting.record(zenbenchmark, "maintenance")
+
+    Other operations can be accounted for with `with accounting.phase("name"):`.
+    """
+
+    def __init__(
+        self,
+        pageserver_http: PageserverHttpClient,
+        tenant_id: Union[TenantId, TenantShardId],
+        timeline_id: TimelineId,
+    ):
+        self.pageserver_http = pageserver_http
+        self.tenant_id = tenant_id
+        self.timeline_id = timeline_id
+        self.baseline = self.snapshot()
+        self.last = self.baseline
+        self.phases: List[PhaseReport] = []
+        # phase name -> last_record_lsn at the end of the last phase of that name
+        self._phase_end_lsns: Dict[str, Lsn] = {}
+
+    def snapshot(self) -> TimelineSnapshot:
+        return TimelineSnapshot.take(self.pageserver_http, self.tenant_id, self.timeline_id)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Account for the changes made by the body. Only the body is timed."""
+        before = self.snapshot()
+        start = time.monotonic()
+        yield
+        duration = time.monotonic() - start
+        after = self.snapshot()
+
+        created = after.layers.keys() - before.layers.keys()
+        deleted = before.layers.keys() - after.layers.keys()
+        since_lsn = self._phase_end_lsns.get(name, self.baseline.last_record_lsn)
+        self.phases.append(
+            PhaseReport(
+                index=len(self.phases),
+                name=name,
+                duration=duration,
+                layers_created=len(created),
+                layers_deleted=len(deleted),
+                bytes_created=sum(after.layers[x] for x in created),
+                bytes_deleted=sum(before.layers[x] for x in deleted),
+                bytes_written=after.bytes_written - before.bytes_written,
+                files_created=after.files_created - before.files_created,
+                io_read_bytes=after.io_read_bytes - before.io_read_bytes,
+                io_write_bytes=after.io_write_bytes - before.io_write_bytes,
+                remote_upload_bytes=after.remote_upload_bytes - before.remote_upload_bytes,
+                wal_bytes=max(0, after.last_record_lsn - since_lsn),
+                logical_size=after.logical_size,
+                physical_size=after.physical_size,
+            )
+        )
+        self._phase_end_lsns[name] = after.last_record_lsn
+        self.last = after
+
+    def checkpoint(self, **kwargs):
+        with self.phase("checkpoint"):
+            self.pageserver_http.timeline_checkpoint(self.tenant_id, self.timeline_id, **kwargs)
+
+    def compact(self, **kwargs):
+        with self.phase("compact"):
+            self.pageserver_http.timeline_compact(self.tenant_id, self.timeline_id, **kwargs)
+
+    def gc(self, gc_horizon: Optional[int] = 0):
+        with self.phase("gc"):
+            self.pageserver_http.timeline_gc(self.tenant_id, self.timeline_id, gc_horizon)
+
+    def write_amplification(self) -> float:
+        """Bytes written by the pageserver per byte of WAL ingested since the baseline."""
+        wal_bytes = self.last.last_record_lsn - self.baseline.last_record_lsn
+        written = self.last.bytes_written - self.baseline.bytes_written
+        return written / wal_bytes if wal_bytes > 0 else 0.0
+
+    def record(self, zenbenchmark: NeonBenchmarker, prefix: str, per_phase: bool = True):
+        """
+        Record totals per phase name as `{prefix}.{name}.*`, overall write amplification
+        and final sizes as `{prefix}.*`. With `per_phase`, also record every phase in
+        order as `{prefix}.{index:03d}_{name}.*`, so the metrics form a timeline.
+        """
+        if per_phase:
+            for phase in self.phases:
+                self._record_phase(zenbenchmark, f"{prefix}.{phase.index:03d}_{phase.name}", phase)
+
+        for name in dict.fromkeys(phase.name for phase in self.phases):
+            phases = [phase for phase in self.phases if phase.name == name]
+            total = PhaseReport(
+                index=-1,
+                name=name,
+                duration=sum(p.duration for p in phases),
+                layers_created=sum(p.layers_created for p in phases),
+                layers_deleted=sum(p.layers_deleted for p in phases),
+                bytes_created=sum(p.bytes_created for p in phases),
+                bytes_deleted=sum(p.bytes_deleted for p in phases),
+                bytes_written=sum(p.bytes_written for p in phases),
+                files_created=sum(p.files_created for p in phases),
+                io_read_bytes=sum(p.io_read_bytes for p in phases),
+                io_write_bytes=sum(p.io_write_bytes for p in phases),
+                remote_upload_bytes=sum(p.remote_upload_bytes for p in phases),
+                wal_bytes=sum(p.wal_bytes for p in phases),
+                logical_size=phases[-1].logical_size,
+                physical_size=phases[-1].physical_size,
+            )
+            self._record_phase(zenbenchmark, f"{prefix}.{name}", total)
+            zenbenchmark.record(f"{prefix}.{name}.count", len(phases), "", MetricReport.TEST_PARAM)
+
+        zenbenchmark.record(
+            f"{prefix}.write_amplification",
+            self.write_amplification(),
+            "",
+            MetricReport.LOWER_IS_BETTER,
+        )
+        zenbenchmark.record(
+            f"{prefix}.layers", len(self.last.layers), "", MetricReport.LOWER_IS_BETTER
+        )
+        zenbenchmark.record(
+            f"{prefix}.physical_size",
+            self.last.physical_size / MB,
+            "MB",
+            MetricReport.LOWER_IS_BETTER,
+        )
+        zenbenchmark.record(
+            f"{prefix}.logical_size", self.last.logical_size / MB, "MB", MetricReport.TEST_PARAM
+        )
+
+    @staticmethod
+    def _record_phase(zenbenchmark: NeonBenchmarker, name: str, phase: PhaseReport):
+        lower = MetricReport.LOWER_IS_BETTER
+        zenbenchmark.record(f"{name}.duration", phase.duration, "s", lower)
+        zenbenchmark.record(f"{name}.layers_created", phase.layers_created, "", lower)
+        zenbenchmark.record(
+            f"{name}.layers_deleted", phase.layers_deleted, "", MetricReport.TEST_PARAM
+        )
+        zenbenchmark.record(f"{name}.bytes_created", phase.bytes_created / MB, "MB", lower)
+        zenbenchmark.record(
+            f"{name}.bytes_deleted", phase.bytes_deleted / MB, "MB", MetricReport.TEST_PARAM
+        )
+        zenbenchmark.record(f"{name}.bytes_written", phase.bytes_written / MB, "MB", lower)
+        zenbenchmark.record(f"{name}.io_read_bytes", phase.io_read_bytes / MB, "MB", lower)
+        zenbenchmark.record(f"{name}.io_write_bytes", phase.io_write_bytes / MB, "MB", lower)
+        zenbenchmark.record(
+            f"{name}.remote_upload_bytes", phase.remote_upload_bytes / MB, "MB", lower
+        )
+        zenbenchmark.record(
+            f"{name}.wal_bytes", phase.wal_bytes / MB, "MB", MetricReport.TEST_PARAM
+        )
+        zenbenchmark.record(f"{name}.write_amplification", phase.write_amplification, "", lower)
+        zenbenchmark.record(
+            f"{name}.physical_logical_ratio", phase.physical_logical_ratio, "", lower
+        )
@@ -0,0 +1,283 @@
+"""
+Read-path cost analysis of a timeline's layer map.
+
+The pageserver reconstructs a page at an LSN by walking down the layers that
+cover the page's key: deltas are visited from the newest downwards until an
+image layer is reached. This module replays that search over the layer map
+returned by the `layer` API, so that tests can see how many layers a read has
+to visit, not just how long a query took.
+
+The model only looks at layer boundaries. A delta layer may contain a full page
+image (a `will_init` record) that ends the search early, so the numbers here are
+an upper bound for the layers actually read.
+"""
+
+import random
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from fixtures.benchmark_fixture import MetricReport, NeonBenchmarker
+from fixtures.pageserver.http import PageserverHttpClient
+from fixtures.pageserver.types import LayerKind, LayerTable
+from fixtures.types import Lsn, TenantId, TenantShardId, TimelineId
+
+
+@dataclass
+class _SegmentLayers:
+    """Layers covering one key segment, split by kind and sorted by (lsn_start, lsn_end)."""
+
+    delta_starts: List[int]
+    deltas: List[int]
+    image_starts: List[int]
+    images: List[int]
+
+
+class LayerCoverageIndex:
+    """
+    Interval index over the (key, lsn) space of a `LayerTable`.
+
+    The key space is cut into segments at every layer key boundary, so that each
+    segment is covered by the same set of layers. The layers of a segment are
+    collected the first time a key in it is looked up.
+    """
+
+    def __init__(self, table: LayerTable):
+        self.table = table
+        self.boundaries = sorted(set(table.key_start) | set(table.key_end))
+        self._segments: Dict[int, _SegmentLayers] = {}
+
+    def _segment(self, key: int) -> Optional[_SegmentLayers]:
+        idx = bisect_right(self.boundaries, key) - 1
+        if idx < 0 or idx >= len(self.boundaries) - 1:
+            return None
+
+        segment = self._segments.get(idx)
+        if segment is None:
+            seg_start = self.boundaries[idx]
+            t = self.table
+            covering = [
+                i for i, (ks, ke) in enumerate(zip(t.key_start, t.key_end)) if ks <= seg_start < ke
+            ]
+            covering.sort(key=lambda i: (t.lsn_start[i], t.lsn_end[i]))
+            deltas = [i for i in covering if t.kind[i] != LayerKind.IMAGE]
+            images = [i for i in covering if t.kind[i] == LayerKind.IMAGE]
+            segment = _SegmentLayers(
+                delta_starts=[t.lsn_start[i] for i in deltas],
+                deltas=deltas,
+                image_starts=[t.lsn_start[i] for i in images],
+                images=images,
+            )
+            self._segments[idx] = segment
+        return segment
+
+    def reconstruct_path(self, key: int, lsn: Lsn) -> Tuple[List[int], bool]:
+        """
+        Return the indices of the layers a read of `key` at `lsn` visits, newest
+        first, and whether the search ended at an image layer. If it didn't, the
+        read continues in the ancestor timeline or fails.
+
+        This follows `LayerMap::search` in the pageserver: the newest image wins
+        over the newest delta if it is at least as new, otherwise the delta is
+        visited and the search continues below it.
+        """
+        segment = self._segment(key)
+        if segment is None:
+            return [], False
+
+        t = self.table
+        path = []
+        end_lsn = lsn.as_int() + 1
+        while True:
+            d = bisect_left(segment.delta_starts, end_lsn) - 1
+            im = bisect_left(segment.image_starts, end_lsn) - 1
+            delta = segment.deltas[d] if d >= 0 else None
+            image = segment.images[im] if im >= 0 else None
+
+            if image is not None and (
+                delta is None
+                or t.lsn_end[image] >= t.lsn_end[delta]
+                or t.lsn_start[image] + 1 == end_lsn
+            ):
+                path.append(image)
+                return path, True
+            if delta is None:
+                return path, False
+
+            path.append(delta)
+            end_lsn = t.lsn_start[delta]
+            if image is not None:
+                end_lsn = max(end_lsn, t.lsn_start[image] + 1)
+
+    def image_coverage_gaps(self, lsn: Lsn) -> Tuple[int, int]:
+        """
+        Return the number of key segments that no image layer at or below `lsn`
+        covers, and the total number of key segments that any layer covers.
+        Reads of keys in such a gap have to visit every delta down to the bottom
+        of the timeline.
+        """
+        t = self.table
+        lsn_int = lsn.as_int()
+        n = len(self.boundaries)
+        # difference arrays over segment indices, swept once below
+        any_layer = [0] * n
+        image_layer = [0] * n
+        for i in range(len(t)):
+            start = bisect_left(self.boundaries, t.key_start[i])
+            end = bisect_left(self.boundaries, t.key_end[i])
+            any_layer[start] += 1
+            any_layer[end] -= 1
+            if t.kind[i] == LayerKind.IMAGE and t.lsn_start[i] <= lsn_int:
+                image_layer[start] += 1
+                image_layer[end] -= 1
+
+        gaps = 0
+        covered = 0
+        any_depth = 0
+        image_depth = 0
+        for idx in range(n - 1):
+            any_depth += any_layer[idx]
+            image_depth += image_layer[idx]
+            if any_depth > 0:
+                covered += 1
+                if image_depth == 0:
+                    gaps += 1
+        return gaps, covered
+
+
+@dataclass
+class LayerCoverageReport:
+    layer_count: int
+    l0_count: int
+    size_by_kind: Dict[LayerKind, int]
+    samples: int
+    # per sampled read: delta layers visited, and all layers visited
+    deltas_visited: List[int]
+    layers_visited: List[int]
+    # sampled reads that did not end at an image layer
+    reads_without_image: int
+    image_gap_segments: int
+    key_segments: int
+
+    @property
+    def read_amplification(self) -> float:
+        """Average number of layers visited per read."""
+        return sum(self.layers_visited) / len(self.layers_visited) if self.layers_visited else 0.0
+
+    def record(self, zenbenchmark: NeonBenchmarker, prefix: str):
+        """Record the report as `zenbenchmark` metrics, all prefixed with `prefix`."""
+        zenbenchmark.record(f"{prefix}.layers", self.layer_count, "", MetricReport.LOWER_IS_BETTER)
+        zenbenchmark.record(f"{prefix}.l0_layers", self.l0_count, "", MetricReport.LOWER_IS_BETTER)
+        for kind, size in self.size_by_kind.items():
+            zenbenchmark.record(
+                f"{prefix}.{kind.name.lower()}_layers_size",
+                size / (1024 * 1024),
+                "MB",
+                MetricReport.LOWER_IS_BETTER,
+            )
+        zenbenchmark.record(f"{prefix}.sampled_reads", self.samples, "", MetricReport.TEST_PARAM)
+        zenbenchmark.record_distribution(f"{prefix}.deltas_per_read", self.deltas_visited, "")
+        zenbenchmark.record(
+            f"{prefix}.read_amplification",
+            self.read_amplification,
+            "",
+            MetricReport.LOWER_IS_BETTER,
+        )
+        zenbenchmark.record(
+            f"{prefix}.reads_without_image",
+            self.reads_without_image,
+            "",
+            MetricReport.LOWER_IS_BETTER,
+        )
+        zenbenchmark.record(
+            f"{prefix}.image_coverage_gaps",
+            self.image_gap_segments / self.key_segments if self.key_segments else 0.0,
+            "",
+            MetricReport.LOWER_IS_BETTER,
+        )
+
+
+def sample_keys(table: LayerTable, n: int, rng: random.Random) -> List[int]:
+    """
+    Pick `n` keys that are actually in use. Keys are 144 bits wide and sparse, so
+    sampling uniformly over a layer's key range would mostly hit keys that don't
+    exist; take the start keys of non-L0 layers instead.
+    """
+    candidates = [
+        table.key_start[i] for i in table.indices_of_kind(LayerKind.IMAGE, LayerKind.DELTA)
+    ]
+    if not candidates:
+        candidates = list(table.key_start)
+    if not candidates:
+        return []
+    return [rng.choice(candidates) for _ in range(n)]
+
+
+def sample_lsns(table: LayerTable, n: int) -> List[Lsn]:
+    """`n` LSNs spread evenly over the timeline's history, always including the latest one."""
+    if len(table) == 0:
+        return []
+    lowest = min(table.lsn_start)
+    latest = max(table.lsn_end) - 1
+    if n <= 1 or latest <= lowest:
+        return [Lsn(latest)]
+    step = (latest - lowest) / (n - 1)
+    return [Lsn(int(lowest + step * i)) for i in range(n - 1)] + [Lsn(latest)]
+
+
+def analyze_layer_table(
+    table: LayerTable,
+    keys: Optional[Sequence[int]] = None,
+    lsns: Optional[Sequence[Lsn]] = None,
+    n_keys: int = 100,
+    n_lsns: int = 4,
+    seed: int = 0,
+) -> LayerCoverageReport:
+    """
+    Replay reads of sampled keys at sampled LSNs over the layer map. If `keys` or
+    `lsns` are not given, they are sampled from the layers themselves.
+    """
+    index = LayerCoverageIndex(table)
+    if keys is None:
+        keys = sample_keys(table, n_keys, random.Random(seed))
+    if lsns is None:
+        lsns = sample_lsns(table, n_lsns)
+
+    deltas_visited = []
+    layers_visited = []
+    reads_without_image = 0
+    for lsn in lsns:
+        for key in keys:
+            path, complete = index.reconstruct_path(key, lsn)
+            layers_visited.append(len(path))
+            deltas_visited.append(sum(1 for i in path if table.is_delta(i)))
+            if not complete:
+                reads_without_image += 1
+
+    if lsns:
+        gaps, segments = index.image_coverage_gaps(max(lsns))
+    else:
+        gaps, segments = 0, 0
+
+    return LayerCoverageReport(
+        layer_count=len(table),
+        l0_count=table.l0_count(),
+        size_by_kind=table.size_by_kind(),
+        samples=len(layers_visited),
+        deltas_visited=deltas_visited,
+        layers_visited=layers_visited,
+        reads_without_image=reads_without_image,
+        image_gap_segments=gaps,
+        key_segments=segments,
+    )
+
+
+def analyze_layer_map(
+    pageserver_http: PageserverHttpClient,
+    tenant_id: Union[TenantId, TenantShardId],
+    timeline_id: TimelineId,
+    **kwargs,
+) -> LayerCoverageReport:
+    """Fetch the timeline's layer map and analyze it, see `analyze_layer_table`."""
+    table = pageserver_http.layer_map_info(tenant_id, timeline_id).layer_table()
+    return analyze_layer_table(table, **kwargs)
@@ -0,0 +1,101 @@
+"""
+Many tenants on one pageserver, without a compute or an initdb per tenant.
+
+A template tenant is loaded once, through a compute. Its remote storage and
+its local timeline directories are then duplicated under new tenant ids, with
+hard links instead of copies of the layer files, and the duplicates are
+attached over the HTTP API. Attach keeps local layers that match the remote
+index, so the duplicates start out with the same resident layers as the
+template, and cost next to no disk space on either side.
+
+Only local FS remote storage can be duplicated this way.
+"""
+
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from fixtures.log_helper import log
+from fixtures.neon_fixtures import NeonPageserver
+from fixtures.remote_storage import LocalFsStorage
+from fixtures.types import TenantId
+
+
+def duplicate_tenant(
+    pageserver: NeonPageserver,
+    remote_storage: LocalFsStorage,
+    template: TenantId,
+    tenant_id: TenantId,
+):
+    """
+    Make `tenant_id` a copy of `template` in remote storage and in the local
+    timeline directories of `pageserver`, hard linking the files.
+    """
+    shutil.copytree(
+        remote_storage.tenant_path(template),
+        remote_storage.tenant_path(tenant_id),
+        copy_function=os.link,
+    )
+    shutil.copytree(
+        pageserver.tenant_dir(template) / "timelines",
+        pageserver.tenant_dir(tenant_id) / "timelines",
+        copy_function=os.link,
+        ignore=shutil.ignore_patterns("*.___temp"),
+    )
+
+
+def attach_many_tenants(
+    pageserver: NeonPageserver,
+    remote_storage: LocalFsStorage,
+    template: TenantId,
+    n_tenants: int,
+    tenant_conf: Optional[Dict[str, Any]] = None,
+    parallelism: int = 16,
+) -> List[TenantId]:
+    """
+    Duplicate `template` `n_tenants` times and attach the duplicates to
+    `pageserver`, without waiting for them to become active. The template must
+    be fully uploaded, and have no uploads in flight.
+    """
+    tenant_ids = [TenantId.generate() for _ in range(n_tenants)]
+
+    def attach(tenant_id: TenantId):
+        duplicate_tenant(pageserver, remote_storage, template, tenant_id)
+        pageserver.tenant_location_configure(
+            tenant_id,
+            {"mode": "AttachedSingle", "secondary_conf": None, "tenant_conf": tenant_conf or {}},
+        )
+
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        futures = [executor.submit(attach, tenant_id) for tenant_id in tenant_ids]
+        for future in futures:
+            future.result()
+    return tenant_ids
+
+
+def wait_until_all_active(
+    pageserver: NeonPageserver, timeout: float = 600, interval: float = 0.1
+) -> float:
+    """
+    Like `NeonPageserver.quiesce_tenants`, but polls more often and for as long
+    as many tenants need, and fails on Broken tenants. Returns how long it took.
+    """
+    client = pageserver.http_client()
+    start = time.perf_counter()
+    last_states: Dict[str, int] = {}
+    while True:
+        states: Dict[str, int] = {}
+        for t in client.tenant_list():
+            slug = t["state"]["slug"]
+            states[slug] = states.get(slug, 0) + 1
+        assert "Broken" not in states, f"broken tenants: {states}"
+        elapsed = time.perf_counter() - start
+        if set(states.keys()) <= {"Active"}:
+            return elapsed
+        assert elapsed < timeout, f"tenants still not active after {elapsed:.1f}s: {states}"
+        if states != last_states:
+            log.info(f"waiting for tenants to become active: {states}")
+            last_states = states
+        time.sleep(interval)
@@ -1,5 +1,7 @@
+from array import array
 from dataclasses import dataclass
-from typing import Any, Dict, Tuple, Union
+from enum import IntEnum
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 
 from fixtures.types import KEY_MAX, KEY_MIN, Key, Lsn
 
@@ -17,11 +19,9 @@ class ImageLayerFileName:
     key_end: Key
 
     def to_str(self):
-        ret = (
+        return (
             f"{self.key_start.as_int():036X}-{self.key_end.as_int():036X}__{self.lsn.as_int():016X}"
         )
-        assert self == parse_layer_file_name(ret)
-        return ret
 
 
 @dataclass(frozen=True)
@@ -35,9 +35,7 @@ class DeltaLayerFileName:
         return self.key_start == KEY_MIN and self.key_end == KEY_MAX
 
     def to_str(self):
-        ret = f"{self.key_start.as_int():036X}-{self.key_end.as_int():036X}__{self.lsn_start.as_int():016X}-{self.lsn_end.as_int():016X}"
-        assert self == parse_layer_file_name(ret)
-        return ret
+        return f"{self.key_start.as_int():036X}-{self.key_end.as_int():036X}__{self.lsn_start.as_int():016X}-{self.lsn_end.as_int():016X}"
 
 
 LayerFileName = Union[ImageLayerFileName, DeltaLayerFileName]
@@ -47,67 +45,61 @@ class InvalidFileName(Exception):
     pass
 
 
-def parse_image_layer(f_name: str) -> Tuple[int, int, int]:
-    """Parse an image layer file name. Return key start, key end, and snapshot lsn"""
-    parts = f_name.split("__")
-    if len(parts) != 2:
-        raise InvalidFileName(f"expecting two parts separated by '__', got: {parts}")
-    key_parts = parts[0].split("-")
-    if len(key_parts) != 2:
-        raise InvalidFileName(
-            f"expecting two key parts separated by '--' in parts[0], got: {key_parts}"
-        )
+def split_layer_file_name(f_name: str) -> Tuple[int, int, int, Optional[int]]:
+    """
+    Parse an image or delta layer file name in a single pass over the name.
+    Return key start, key end, lsn start, and lsn end, which is None for image layers.
+    """
+    key_part, sep, lsn_part = f_name.partition("__")
+    if not sep or "__" in lsn_part:
+        raise InvalidFileName(f"expecting two parts separated by '__', got: {f_name}")
+    key_start, sep, key_end = key_part.partition("-")
+    if not sep or "-" in key_end:
+        raise InvalidFileName(f"expecting two key parts separated by '-', got: {key_part}")
+    lsn_start, sep, lsn_end = lsn_part.partition("-")
     try:
-        return int(key_parts[0], 16), int(key_parts[1], 16), int(parts[1], 16)
+        return (
+            int(key_start, 16),
+            int(key_end, 16),
+            int(lsn_start, 16),
+            int(lsn_end, 16) if sep else None,
+        )
     except ValueError as e:
         raise InvalidFileName(f"conversion error: {f_name}") from e
 
 
+def parse_image_layer(f_name: str) -> Tuple[int, int, int]:
+    """Parse an image layer file name. Return key start, key end, and snapshot lsn"""
+    key_start, key_end, lsn, lsn_end = split_layer_file_name(f_name)
+    if lsn_end is not None:
+        raise InvalidFileName(f"expecting a single lsn, got a delta layer: {f_name}")
+    return key_start, key_end, lsn
+
+
 def parse_delta_layer(f_name: str) -> Tuple[int, int, int, int]:
     """Parse a delta layer file name. Return key start, key end, lsn start, and lsn end"""
-    parts = f_name.split("__")
-    if len(parts) != 2:
-        raise InvalidFileName(f"expecting two parts separated by '__', got: {parts}")
-    key_parts = parts[0].split("-")
-    if len(key_parts) != 2:
-        raise InvalidFileName(
-            f"expecting two key parts separated by '--' in parts[0], got: {key_parts}"
-        )
-    lsn_parts = parts[1].split("-")
-    if len(lsn_parts) != 2:
-        raise InvalidFileName(
-            f"expecting two lsn parts separated by '--' in parts[1], got: {lsn_parts}"
-        )
-    try:
-        return (
-            int(key_parts[0], 16),
-            int(key_parts[1], 16),
-            int(lsn_parts[0], 16),
-            int(lsn_parts[1], 16),
-        )
-    except ValueError as e:
-        raise InvalidFileName(f"conversion error: {f_name}") from e
+    key_start, key_end, lsn_start, lsn_end = split_layer_file_name(f_name)
+    if lsn_end is None:
+        raise InvalidFileName(f"expecting two lsn parts, got an image layer: {f_name}")
+    return key_start, key_end, lsn_start, lsn_end
 
 
 def parse_layer_file_name(file_name: str) -> LayerFileName:
     try:
-        key_start, key_end, lsn = parse_image_layer(file_name)
-        return ImageLayerFileName(lsn=Lsn(lsn), key_start=Key(key_start), key_end=Key(key_end))
-    except InvalidFileName:
-        pass
+        key_start, key_end, lsn_start, lsn_end = split_layer_file_name(file_name)
+    except InvalidFileName as e:
+        raise ValueError(f"invalid layer file name: {file_name}") from e
 
-    try:
-        key_start, key_end, lsn_start, lsn_end = parse_delta_layer(file_name)
-        return DeltaLayerFileName(
-            lsn_start=Lsn(lsn_start),
-            lsn_end=Lsn(lsn_end),
-            key_start=Key(key_start),
-            key_end=Key(key_end),
+    if lsn_end is None:
+        return ImageLayerFileName(
+            lsn=Lsn(lsn_start), key_start=Key(key_start), key_end=Key(key_end)
         )
-    except InvalidFileName:
-        pass
-
-    raise ValueError()
+    return DeltaLayerFileName(
+        lsn_start=Lsn(lsn_start),
+        lsn_end=Lsn(lsn_end),
+        key_start=Key(key_start),
+        key_end=Key(key_end),
+    )
 
 
 def is_future_layer(layer_file_name: LayerFileName, disk_consistent_lsn: Lsn):
@@ -143,3 +135,115 @@ class IndexPartDump:
             },
             disk_consistent_lsn=Lsn(d["disk_consistent_lsn"]),
         )
+
+
+class LayerKind(IntEnum):
+    IMAGE = 0
+    DELTA = 1
+    # Delta layer spanning the whole key space, i.e. not yet compacted
+    L0 = 2
+
+
+_KEY_MIN_INT = KEY_MIN.as_int()
+_KEY_MAX_INT = KEY_MAX.as_int()
+
+
+class LayerTable:
+    """
+    Columnar table of historic layers, for timelines with too many layers to
+    comfortably handle as a list of `LayerFileName` objects.
+
+    LSNs, sizes and kinds are kept in `array`s. Keys are 144 bits wide, which
+    doesn't fit a machine word, so key columns are plain lists of ints. Image
+    layers are stored with the LSN range `lsn..lsn + 1`, the same way the
+    pageserver treats them, so queries can handle both kinds uniformly.
+    """
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.key_start: List[int] = []
+        self.key_end: List[int] = []
+        self.lsn_start = array("Q")
+        self.lsn_end = array("Q")
+        self.size = array("Q")
+        self.kind = array("B")
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def append(self, layer_file_name: str, size: int = 0):
+        key_start, key_end, lsn_start, lsn_end = split_layer_file_name(layer_file_name)
+        if lsn_end is None:
+            kind = LayerKind.IMAGE
+            lsn_end = lsn_start + 1
+        elif key_start == _KEY_MIN_INT and key_end == _KEY_MAX_INT:
+            kind = LayerKind.L0
+        else:
+            kind = LayerKind.DELTA
+
+        self.names.append(layer_file_name)
+        self.key_start.append(key_start)
+        self.key_end.append(key_end)
+        self.lsn_start.append(lsn_start)
+        self.lsn_end.append(lsn_end)
+        self.size.append(size)
+        self.kind.append(kind)
+
+    @classmethod
+    def from_layers(cls, layers: Iterable[Tuple[str, Optional[int]]]) -> "LayerTable":
+        """Build a table from (layer file name, size) pairs. Unknown sizes count as 0."""
+        table = cls()
+        for layer_file_name, size in layers:
+            table.append(layer_file_name, size or 0)
+        return table
+
+    def layer_file_name(self, i: int) -> LayerFileName:
+        return parse_layer_file_name(self.names[i])
+
+    def is_delta(self, i: int) -> bool:
+        return self.kind[i] != LayerKind.IMAGE
+
+    def indices_of_kind(self, *kinds: LayerKind) -> List[int]:
+        wanted = {int(k) for k in kinds}
+        return [i for i, k in enumerate(self.kind) if k in wanted]
+
+    def covering(self, key_start: int, key_end: int, lsn: Lsn) -> List[int]:
+        """
+        Indices of layers that overlap the key range `key_start..key_end` and
+        contain `lsn` in their LSN range.
+        """
+        lsn_int = lsn.as_int()
+        return [
+            i
+            for i, (ks, ke, ls, le) in enumerate(
+                zip(self.key_start, self.key_end, self.lsn_start, self.lsn_end)
+            )
+            if ks < key_end and key_start < ke and ls <= lsn_int < le
+        ]
+
+    def below(self, key_start: int, key_end: int, lsn: Lsn) -> List[int]:
+        """
+        Indices of layers that overlap the key range `key_start..key_end` and
+        start at or below `lsn`, i.e. the candidates a read at `lsn` may visit.
+        """
+        lsn_int = lsn.as_int()
+        return [
+            i
+            for i, (ks, ke, ls) in enumerate(zip(self.key_start, self.key_end, self.lsn_start))
+            if ks < key_end and key_start < ke and ls <= lsn_int
+        ]
+
+    def l0_count(self) -> int:
+        return self.kind.count(LayerKind.L0)
+
+    def count_by_kind(self) -> Dict[LayerKind, int]:
+        return {kind: self.kind.count(kind) for kind in LayerKind}
+
+    def size_by_kind(self) -> Dict[LayerKind, int]:
+        sizes = [0] * len(LayerKind)
+        for kind, size in zip(self.kind, self.size):
+            sizes[kind] += size
+        return {kind: sizes[kind] for kind in LayerKind}
+
+    def total_size(self) -> int:
+        return sum(self.size)
@@ -0,0 +1,169 @@
+"""
+Sampling profilers for benchmarks.
+
+With `--profile-components=pageserver,safekeeper,...`, every `record_duration`
+block of a benchmark attaches a sampling profiler to the processes of the
+selected components while the block runs, and saves a flamegraph as
+`profile-{metric}-{component}.svg` in the test output directory, where it is
+attached to the Allure report.
+
+Neon processes are profiled with `perf record`; turning its output into an SVG
+needs `inferno-collapse-perf` and `inferno-flamegraph`, or `stackcollapse-perf.pl`
+and `flamegraph.pl` from FlameGraph, on the PATH. The `harness` component is
+the pytest process itself, which is profiled with `py-spy`.
+
+Profiling is best effort: if a profiler can't be started, e.g. because of
+`kernel.perf_event_paranoid`, a warning is logged and the benchmark runs as usual.
+"""
+
+import os
+import re
+import shutil
+import signal
+import subprocess
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import pytest
+from _pytest.config import Config
+from _pytest.config.argparsing import Parser
+from _pytest.fixtures import FixtureRequest
+
+from fixtures.log_helper import log
+from fixtures.resource_accounting import COMPONENTS, find_test_processes
+
+HARNESS = "harness"
+PROFILABLE_COMPONENTS = sorted({*COMPONENTS.values(), "postgres", HARNESS})
+
+PERF_FREQUENCY = 99
+
+
+def _flamegraph_tools() -> Optional[Tuple[str, str]]:
+    for collapse, flamegraph in [
+        ("inferno-collapse-perf", "inferno-flamegraph"),
+        ("stackcollapse-perf.pl", "flamegraph.pl"),
+    ]:
+        if shutil.which(collapse) and shutil.which(flamegraph):
+            return collapse, flamegraph
+    return None
+
+
+class ComponentProfiler:
+    """Profile the processes of `components` of a test, see `find_test_processes`."""
+
+    def __init__(self, components: Sequence[str], output_dir: Path, roots: Sequence[Path]):
+        self.components = list(components)
+        self.output_dir = output_dir
+        self.roots = roots
+
+    def _start(
+        self, component: str, pids: List[int], base: Path
+    ) -> Optional["subprocess.Popen[bytes]"]:
+        if component == HARNESS:
+            cmd = ["py-spy", "record", "--pid", str(os.getpid()), "--format", "flamegraph"]
+            cmd += ["--output", f"{base}.svg"]
+        else:
+            cmd = ["perf", "record", "-F", str(PERF_FREQUENCY), "-g", "--quiet"]
+            cmd += ["-p", ",".join(str(pid) for pid in pids), "-o", f"{base}.perf.data"]
+        if shutil.which(cmd[0]) is None:
+            log.warning(f"cannot profile {component}: {cmd[0]} not found")
+            return None
+        log.info(f"profiling {component}: {' '.join(cmd)}")
+        with open(f"{base}.stderr", "wb") as stderr:
+            return subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=stderr)
+
+    def _finish(self, component: str, proc: "subprocess.Popen[bytes]", base: Path):
+        # both perf and py-spy write their output on SIGINT
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        if component == HARNESS:
+            return
+        output = Path(f"{base}.perf.data")
+        if not output.exists():
+            log.warning(f"{component} profile was not written, see {base}.stderr")
+            return
+
+        tools = _flamegraph_tools()
+        if tools is None:
+            log.warning(f"no flamegraph tools found, keeping {output} as is")
+            return
+        collapse, flamegraph = tools
+        svg = Path(f"{base}.svg")
+        with svg.open("wb") as out:
+            script = subprocess.Popen(["perf", "script", "-i", str(output)], stdout=subprocess.PIPE)
+            folded = subprocess.Popen([collapse], stdin=script.stdout, stdout=subprocess.PIPE)
+            assert script.stdout is not None
+            script.stdout.close()
+            rendered = subprocess.run(
+                [flamegraph, "--title", base.name],
+                stdin=folded.stdout,
+                stdout=out,
+            )
+            script.wait()
+            folded.wait()
+        if rendered.returncode != 0:
+            log.warning(f"failed to render {svg}")
+            return
+        # the SVG has everything that's needed, the raw samples can be large
+        output.unlink()
+
+    @contextmanager
+    def profile(self, name: str) -> Iterator[None]:
+        """Profile the selected components while the body runs."""
+        pids: Dict[str, List[int]] = {}
+        for process, component in find_test_processes(self.roots):
+            pids.setdefault(component, []).append(process.pid)
+
+        running = []
+        safe_name = re.sub(r"[^\w.-]", "_", name)
+        for component in self.components:
+            if component != HARNESS and not pids.get(component):
+                log.warning(f"cannot profile {component}: no running processes")
+                continue
+            base = self.output_dir / f"profile-{safe_name}-{component}"
+            profiler = self._start(component, pids.get(component, []), base)
+            if profiler is not None:
+                running.append((component, profiler, base))
+
+        try:
+            yield
+        finally:
+            for component, profiler, base in running:
+                self._finish(component, profiler, base)
+
+
+def pytest_addoption(parser: Parser):
+    parser.addoption(
+        "--profile-components",
+        default="",
+        help="Comma-separated list of components to profile during the record_duration blocks "
+        f"of benchmarks: {', '.join(PROFILABLE_COMPONENTS)}",
+    )
+
+
+@pytest.fixture(scope="function", autouse=True)
+def component_profiler(
+    request: FixtureRequest, pytestconfig: Config, top_output_dir: Path, test_output_dir: Path
+) -> Optional[ComponentProfiler]:
+    option = pytestconfig.getoption("--profile-components")
+    if not option or "zenbenchmark" not in request.fixturenames:
+        return None
+
+    components = [c.strip() for c in option.split(",") if c.strip()]
+    for component in components:
+        if component not in PROFILABLE_COMPONENTS:
+            raise ValueError(
+                f"unknown component {component} in --profile-components, "
+                f"expected one of {', '.join(PROFILABLE_COMPONENTS)}"
+            )
+
+    profiler = ComponentProfiler(
+        components, test_output_dir, [test_output_dir, top_output_dir / "shared_repo"]
+    )
+    request.getfixturevalue("zenbenchmark").profile = profiler.profile
+    return profiler
@@ -0,0 +1,278 @@
+"""
+Concurrent read latency probes.
+
+A `ReadProbe` runs a set of read queries from several threads, each with its own
+connection opened upfront, while a test runs some other workload. Latencies are
+measured around `execute` + `fetchall` with `time.perf_counter_ns` and collected
+into per-thread histograms, which are merged when the probe stops.
+
+On Neon, every sample is also tagged with how far the pageserver is behind the
+compute's WAL (flush LSN - `last_record_lsn`) at the time the query was sent,
+so that read stalls can be correlated with ingest lag.
+"""
+
+import random
+import threading
+import time
+from bisect import bisect_right
+from contextlib import closing, contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import psycopg2
+from psycopg2.extensions import connection as PgConnection
+
+from fixtures.benchmark_fixture import LatencyHistogram, MetricReport, NeonBenchmarker
+from fixtures.compare_fixtures import NeonCompare, PgCompare
+from fixtures.log_helper import log
+from fixtures.types import Lsn
+
+MB = 1024 * 1024
+
+# Lower bounds of the WAL lag bands that samples are grouped into
+DEFAULT_LAG_BANDS: Tuple[int, ...] = (0, 1 * MB, 16 * MB, 128 * MB, 1024 * MB)
+
+
+@dataclass
+class ProbeQuery:
+    name: str
+    sql: str
+    # Parameters for one execution of `sql`, drawn from the reader's RNG
+    params: Optional[Callable[[random.Random], Sequence[Any]]] = None
+
+
+def point_lookup(table: str, column: str, max_key: int) -> ProbeQuery:
+    """Fetch one row by a random key in 1..max_key."""
+    return ProbeQuery(
+        "point_lookup",
+        f"SELECT * FROM {table} WHERE {column} = %s",
+        lambda rng: (rng.randint(1, max_key),),
+    )
+
+
+def index_range(table: str, column: str, max_key: int, width: int = 100) -> ProbeQuery:
+    """Fetch `width` consecutive keys, starting at a random key."""
+
+    def params(rng: random.Random) -> Sequence[Any]:
+        start = rng.randint(1, max_key)
+        return (start, start + width - 1)
+
+    return ProbeQuery(
+        "index_range", f"SELECT * FROM {table} WHERE {column} BETWEEN %s AND %s", params
+    )
+
+
+def seqscan(table: str) -> ProbeQuery:
+    return ProbeQuery("seqscan", f"SELECT count(*) FROM {table}")
+
+
+class WalLagSampler:
+    """
+    Poll the difference between the compute's flush LSN and the pageserver's
+    `last_record_lsn` of a `NeonCompare` timeline. `lag` is the latest value, or
+    None until the first poll succeeds.
+    """
+
+    def __init__(self, env: NeonCompare, interval: float = 0.1):
+        self.env = env
+        self.interval = interval
+        self.lag: Optional[int] = None
+        self.max_lag = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        http = self.env.pageserver_http_client
+        with closing(self.env.pg.connect()) as conn, conn.cursor() as cur:
+            while not self._stop.is_set():
+                try:
+                    cur.execute("SELECT pg_current_wal_flush_lsn()")
+                    row = cur.fetchone()
+                    assert row is not None
+                    flush_lsn = Lsn(row[0])
+                    detail = http.timeline_detail(self.env.tenant, self.env.timeline)
+                    lag = max(0, flush_lsn - Lsn(detail["last_record_lsn"]))
+                    self.lag = lag
+                    self.max_lag = max(self.max_lag, lag)
+                except Exception as e:
+                    log.warning(f"failed to sample WAL lag: {e}")
+                self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class ReadProbe:
+    """
+    Run `queries` from `readers` threads until stopped. Each reader goes through
+    the queries round-robin, starting at a different one, and sleeps `interval`
+    seconds between queries.
+
+    Usage:
+
+        probe = ReadProbe(env, [point_lookup("t", "key", 100000), seqscan("t")])
+        with probe.running():
+            run_workload()
+        probe.record(env.zenbenchmark, "read_latency")
+    """
+
+    def __init__(
+        self,
+        env: PgCompare,
+        queries: Sequence[ProbeQuery],
+        readers: int = 4,
+        interval: float = 0.0,
+        lag_bands: Sequence[int] = DEFAULT_LAG_BANDS,
+        seed: int = 0,
+    ):
+        assert len(queries) > 0
+        self.env = env
+        self.queries = list(queries)
+        self.readers = readers
+        self.interval = interval
+        self.lag_bands = list(lag_bands)
+        self.seed = seed
+
+        self.lag_sampler = WalLagSampler(env) if isinstance(env, NeonCompare) else None
+
+        # (query name, lag band index or -1 if the lag is not known) -> latencies in ns
+        self.histograms: Dict[Tuple[str, int], LatencyHistogram] = {}
+        self.errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def _band(self, lag: Optional[int]) -> int:
+        if lag is None:
+            return -1
+        return bisect_right(self.lag_bands, lag) - 1
+
+    def _band_name(self, band: int) -> str:
+        lower = self.lag_bands[band] // MB
+        if band + 1 < len(self.lag_bands):
+            return f"lag_{lower}_{self.lag_bands[band + 1] // MB}MB"
+        return f"lag_{lower}MB_plus"
+
+    def _reader(self, reader_id: int, conn: PgConnection):
+        rng = random.Random(self.seed + reader_id)
+        histograms: Dict[Tuple[str, int], LatencyHistogram] = {}
+        errors: Dict[str, int] = {}
+        n = reader_id
+        with closing(conn), conn.cursor() as cur:
+            while not self._stop.is_set():
+                query = self.queries[n % len(self.queries)]
+                n += 1
+                params = query.params(rng) if query.params is not None else None
+                lag = self.lag_sampler.lag if self.lag_sampler is not None else None
+
+                start = time.perf_counter_ns()
+                try:
+                    cur.execute(query.sql, params)
+                    cur.fetchall()
+                except psycopg2.Error as e:
+                    log.error(f"Got error when executing read query {query.name}: {e}")
+                    errors[query.name] = errors.get(query.name, 0) + 1
+                    # don't spin if the connection is broken
+                    self._stop.wait(max(self.interval, 0.1))
+                    continue
+                elapsed = time.perf_counter_ns() - start
+
+                key = (query.name, self._band(lag))
+                histogram = histograms.get(key)
+                if histogram is None:
+                    histogram = histograms[key] = LatencyHistogram()
+                histogram.add(elapsed)
+
+                if self.interval > 0:
+                    self._stop.wait(self.interval)
+
+        with self._lock:
+            for key, histogram in histograms.items():
+                self.histograms.setdefault(key, LatencyHistogram()).merge(histogram)
+            for name, count in errors.items():
+                self.errors[name] = self.errors.get(name, 0) + count
+
+    def start(self):
+        assert not self._threads, "probe already started"
+        # Connect all readers before starting any of them, so that connection
+        # setup doesn't overlap with the measurements
+        conns = [self.env.pg.connect() for _ in range(self.readers)]
+        if self.lag_sampler is not None:
+            self.lag_sampler.start()
+        self._threads = [
+            threading.Thread(target=self._reader, args=(i, conn), name=f"read-probe-{i}")
+            for i, conn in enumerate(conns)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        if self.lag_sampler is not None:
+            self.lag_sampler.stop()
+
+    @contextmanager
+    def running(self) -> Iterator["ReadProbe"]:
+        self.start()
+        try:
+            yield self
+        finally:
+            self.stop()
+
+    def run_while(self, run_cond: Callable[[], bool], poll_interval: float = 0.1):
+        """Run the probe until `run_cond` returns False."""
+        with self.running():
+            while run_cond():
+                time.sleep(poll_interval)
+
+    def histogram(
+        self, query: Optional[str] = None, band: Optional[int] = None
+    ) -> LatencyHistogram:
+        """Merged latencies of one query and/or lag band, or of all samples."""
+        merged = LatencyHistogram()
+        for (name, b), histogram in self.histograms.items():
+            if (query is None or name == query) and (band is None or b == band):
+                merged.merge(histogram)
+        return merged
+
+    def record(self, zenbenchmark: NeonBenchmarker, prefix: str):
+        """
+        Record the latencies in seconds: of all samples as `{prefix}_avg`, `{prefix}_p99`
+        etc., per query as `{prefix}.{query}_...` if there is more than one, and per WAL
+        lag band as `{prefix}.lag_{lower}_{upper}MB_...`.
+        """
+        overall = self.histogram()
+        zenbenchmark.record_histogram(prefix, overall, "s", divisor=1e9)
+        zenbenchmark.record(
+            f"{prefix}_stdev", overall.stdev() / 1e9, "s", MetricReport.LOWER_IS_BETTER
+        )
+        zenbenchmark.record(
+            f"{prefix}_errors", sum(self.errors.values()), "", MetricReport.LOWER_IS_BETTER
+        )
+
+        if len(self.queries) > 1:
+            for query in self.queries:
+                zenbenchmark.record_histogram(
+                    f"{prefix}.{query.name}", self.histogram(query=query.name), "s", divisor=1e9
+                )
+
+        if self.lag_sampler is not None:
+            for band in sorted({b for _, b in self.histograms if b >= 0}):
+                zenbenchmark.record_histogram(
+                    f"{prefix}.{self._band_name(band)}",
+                    self.histogram(band=band),
+                    "s",
+                    divisor=1e9,
+                )
+            zenbenchmark.record(
+                f"{prefix}.max_wal_lag",
+                self.lag_sampler.max_lag / MB,
+                "MB",
+                MetricReport.LOWER_IS_BETTER,
+            )
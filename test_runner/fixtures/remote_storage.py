@@ -4,9 +4,11 @@ import json
 import os
 import re
 import subprocess
-from dataclasses import dataclass
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Union
+from typing import Dict, List, Optional, Set, Tuple, Union
 
 import boto3
 import toml
@@ -79,9 +81,59 @@ class MockS3Server:
         self.subprocess.kill()
 
 
+@dataclass
+class _RemoteTimelineListing:
+    """
+    Names in a LocalFsStorage timeline directory, indexed by generation. `None`
+    stands for objects uploaded without a generation suffix.
+    """
+
+    mtime_ns: int
+    listed_at_ns: int
+    index_part_generations: List[Optional[int]]
+    layer_generations: Dict[str, List[Optional[int]]]
+
+    @classmethod
+    def from_names(
+        cls, names: List[str], mtime_ns: int, listed_at_ns: int
+    ) -> "_RemoteTimelineListing":
+        index_part_generations: List[Optional[int]] = []
+        layer_generations: Dict[str, List[Optional[int]]] = {}
+        for name in names:
+            base, generation = _split_generation_suffix(name)
+            if base == TIMELINE_INDEX_PART_FILE_NAME:
+                index_part_generations.append(generation)
+            elif "__" in base:
+                layer_generations.setdefault(base, []).append(generation)
+
+        for generations in [index_part_generations, *layer_generations.values()]:
+            generations.sort(key=lambda g: -1 if g is None else g)
+
+        return cls(mtime_ns, listed_at_ns, index_part_generations, layer_generations)
+
+
+def _split_generation_suffix(name: str) -> Tuple[str, Optional[int]]:
+    """Split `name-0000000a` into `name` and generation 10. Generations are 8 hex digits."""
+    base, sep, suffix = name.rpartition("-")
+    if sep and len(suffix) == 8:
+        try:
+            return base, int(suffix, 16)
+        except ValueError:
+            pass
+    return name, None
+
+
+# Directory mtimes come from a coarse clock, so a listing taken within the same
+# tick as a modification could miss it. Such listings are never reused.
+_MTIME_RACE_WINDOW_NS = 100_000_000
+
+
 @dataclass
 class LocalFsStorage:
     root: Path
+    _listings: Dict[Path, _RemoteTimelineListing] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
 
     def tenant_path(self, tenant_id: TenantId) -> Path:
         return self.root / "tenants" / str(tenant_id)
@@ -89,23 +141,48 @@ class LocalFsStorage:
     def timeline_path(self, tenant_id: TenantId, timeline_id: TimelineId) -> Path:
         return self.tenant_path(tenant_id) / "timelines" / str(timeline_id)
 
-    def timeline_latest_generation(self, tenant_id, timeline_id):
-        timeline_files = os.listdir(self.timeline_path(tenant_id, timeline_id))
-        index_parts = [f for f in timeline_files if f.startswith("index_part")]
-
-        def parse_gen(filename):
-            log.info(f"parsing index_part '{filename}'")
-            parts = filename.split("-")
-            if len(parts) == 2:
-                return int(parts[1], 16)
-            else:
-                return None
+    def _timeline_listing(
+        self, tenant_id: TenantId, timeline_id: TimelineId
+    ) -> _RemoteTimelineListing:
+        """
+        List the timeline directory once and reuse the result for as long as the
+        directory's mtime doesn't change.
+        """
+        path = self.timeline_path(tenant_id, timeline_id)
+        mtime_ns = path.stat().st_mtime_ns
+
+        cached = self._listings.get(path)
+        if (
+            cached is not None
+            and cached.mtime_ns == mtime_ns
+            and cached.listed_at_ns - mtime_ns > _MTIME_RACE_WINDOW_NS
+        ):
+            return cached
+
+        listed_at_ns = time.time_ns()
+        listing = _RemoteTimelineListing.from_names(os.listdir(path), mtime_ns, listed_at_ns)
+        log.debug(
+            f"listed {path}: index_part generations {listing.index_part_generations}, {len(listing.layer_generations)} layers"
+        )
+        self._listings[path] = listing
+        return listing
 
-        generations = sorted([parse_gen(f) for f in index_parts])
+    def timeline_latest_generation(self, tenant_id, timeline_id) -> Optional[int]:
+        generations = self._timeline_listing(tenant_id, timeline_id).index_part_generations
         if len(generations) == 0:
             raise RuntimeError(f"No index_part found for {tenant_id}/{timeline_id}")
         return generations[-1]
 
+    def remote_layers(
+        self, tenant_id: TenantId, timeline_id: TimelineId
+    ) -> Dict[str, List[Optional[int]]]:
+        """
+        Layer file names in the timeline's remote directory, mapped to their
+        generations, oldest first. The result is a copy, the listing is cached.
+        """
+        layer_generations = self._timeline_listing(tenant_id, timeline_id).layer_generations
+        return {name: list(generations) for name, generations in layer_generations.items()}
+
     def index_path(self, tenant_id: TenantId, timeline_id: TimelineId) -> Path:
         latest_gen = self.timeline_latest_generation(tenant_id, timeline_id)
         if latest_gen is None:
@@ -122,13 +199,25 @@ class LocalFsStorage:
         local_name: str,
         generation: Optional[int] = None,
     ):
+        """
+        Path of the layer `local_name` in remote storage. Without `generation`,
+        this is the latest generation of the layer that exists, or if there is
+        none yet, the generation of the latest index_part.
+        """
+        timeline_path = self.timeline_path(tenant_id, timeline_id)
         if generation is None:
+            layer_generations = self._timeline_listing(tenant_id, timeline_id).layer_generations
+            if local_name in layer_generations:
+                latest = layer_generations[local_name][-1]
+                if latest is None:
+                    return timeline_path / local_name
+                return timeline_path / f"{local_name}-{latest:08x}"
             generation = self.timeline_latest_generation(tenant_id, timeline_id)
 
         assert generation is not None, "Cannot calculate remote layer path without generation"
 
         filename = f"{local_name}-{generation:08x}"
-        return self.timeline_path(tenant_id, timeline_id) / filename
+        return timeline_path / filename
 
     def index_content(self, tenant_id: TenantId, timeline_id: TimelineId):
         with self.index_path(tenant_id, timeline_id).open("r") as f:
@@ -156,6 +245,23 @@ class LocalFsStorage:
         return repo_dir / "local_fs_remote_storage" / str(user)
 
 
+@dataclass
+class S3CleanupStats:
+    objects: int = 0
+    bytes: int = 0
+    batches: int = 0
+    retries: int = 0
+    duration: float = 0.0
+
+    def __str__(self) -> str:
+        duration = max(self.duration, 1e-9)
+        return (
+            f"{self.objects} objects ({self.bytes / (1024 * 1024):.1f} MiB) in {self.batches} batches"
+            f" with {self.retries} retries, in {self.duration:.2f}s"
+            f" ({self.objects / duration:.0f} objects/s, {self.bytes / (1024 * 1024) / duration:.1f} MiB/s)"
+        )
+
+
 @dataclass
 class S3Storage:
     bucket_name: str
@@ -199,10 +305,16 @@ class S3Storage:
 
         return toml.TomlEncoder().dump_inline_table(rv)
 
-    def do_cleanup(self):
+    def do_cleanup(self, concurrency: int = 8) -> Optional[S3CleanupStats]:
+        """
+        Remove everything under `prefix_in_bucket`. Listing continues while
+        earlier pages are deleted by up to `concurrency` parallel
+        `delete_objects` calls, and keys reported in a response's `Errors` are
+        retried.
+        """
         if not self.cleanup:
             # handles previous keep_remote_storage_contents
-            return
+            return None
 
         log.info(
             "removing data from test s3 bucket %s by prefix %s",
@@ -213,35 +325,59 @@ class S3Storage:
         pages = paginator.paginate(
             Bucket=self.bucket_name,
             Prefix=self.prefix_in_bucket,
+            # aws limit for a single delete_objects call
+            PaginationConfig={"PageSize": 1000},
         )
 
-        # Using Any because DeleteTypeDef (from boto3-stubs) doesn't fit our case
-        objects_to_delete: Any = {"Objects": []}
-        cnt = 0
-        for item in pages.search("Contents"):
-            # weirdly when nothing is found it returns [None]
-            if item is None:
-                break
-
-            objects_to_delete["Objects"].append({"Key": item["Key"]})
-
-            # flush once aws limit reached
-            if len(objects_to_delete["Objects"]) >= 1000:
-                self.client.delete_objects(
-                    Bucket=self.bucket_name,
-                    Delete=objects_to_delete,
-                )
-                objects_to_delete = {"Objects": []}
-                cnt += 1
-
-        # flush rest
-        if len(objects_to_delete["Objects"]):
-            self.client.delete_objects(
+        stats = S3CleanupStats()
+        started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending: Set[Future[int]] = set()
+            for page in pages:
+                contents = page.get("Contents", [])
+                if not contents:
+                    continue
+
+                stats.objects += len(contents)
+                stats.bytes += sum(item.get("Size", 0) for item in contents)
+                keys = [item["Key"] for item in contents]
+                pending.add(executor.submit(self._delete_batch, keys))
+
+                # don't let listing run arbitrarily far ahead of deletion
+                if len(pending) >= concurrency * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        stats.batches += 1
+                        stats.retries += future.result()
+
+            for future in pending:
+                stats.batches += 1
+                stats.retries += future.result()
+        stats.duration = time.monotonic() - started_at
+
+        log.info(f"deleted {stats} from remote storage")
+        return stats
+
+    def _delete_batch(self, keys: List[str], max_attempts: int = 5) -> int:
+        """Delete up to 1000 keys, retrying the ones that failed. Returns the number of retries."""
+        retries = 0
+        for attempt in range(max_attempts):
+            response = self.client.delete_objects(
                 Bucket=self.bucket_name,
-                Delete=objects_to_delete,
+                Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+            )
+            errors = response.get("Errors", [])
+            if not errors:
+                return retries
+
+            keys = [error["Key"] for error in errors]
+            log.warning(
+                f"failed to delete {len(keys)} objects on attempt {attempt + 1}, first error: {errors[0]}"
             )
+            retries += 1
+            time.sleep(0.1 * 2**attempt)
 
-        log.info(f"deleted {cnt} objects from remote storage")
+        raise RuntimeError(f"failed to delete {len(keys)} objects after {max_attempts} attempts")
 
 
 RemoteStorage = Union[LocalFsStorage, S3Storage]
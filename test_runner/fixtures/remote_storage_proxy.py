@@ -0,0 +1,282 @@
+"""
+A throttling HTTP proxy in front of the mock S3 server.
+
+Mock S3 and local FS remote storage answer as fast as the local disk allows,
+so tests that exercise on-demand downloads say nothing about what a cold read
+costs against real object storage. `ThrottledStorageProxy` forwards the
+pageserver's S3 requests to the `MockS3Server` and can add a fixed latency to
+every request, cap the total bandwidth of the responses, and fail a fraction
+of the requests with a retryable S3 error.
+
+Local FS remote storage is read by the pageserver directly from disk, so it
+can't be proxied; use MOCK_S3 instead.
+
+Usage:
+
+    def test_foo(neon_env_builder: NeonEnvBuilder, remote_storage_proxy: ThrottledStorageProxy):
+        remote_storage_proxy.attach(neon_env_builder)
+        env = neon_env_builder.init_start()
+        ...
+        remote_storage_proxy.throttle = StorageThrottle(latency=0.03, bandwidth=50 * 1024 * 1024)
+"""
+
+import http.client
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+import pytest
+
+from fixtures.benchmark_fixture import LatencyHistogram, MetricReport, NeonBenchmarker
+from fixtures.log_helper import log
+from fixtures.neon_fixtures import NeonEnvBuilder
+from fixtures.port_distributor import PortDistributor
+from fixtures.remote_storage import MockS3Server, RemoteStorageKind, S3Storage
+
+MB = 1024 * 1024
+
+# Size of the pieces that throttled response bodies are sent in
+CHUNK_SIZE = 64 * 1024
+
+# Hop-by-hop headers, which are not forwarded
+HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "te", "trailer", "upgrade"}
+
+INJECTED_ERROR_BODY = (
+    b'<?xml version="1.0" encoding="UTF-8"?>\n'
+    b"<Error><Code>SlowDown</Code><Message>Injected by the test proxy</Message></Error>"
+)
+
+
+@dataclass
+class StorageThrottle:
+    # seconds added to every request, before it is forwarded
+    latency: float = 0.0
+    # bytes per second, shared by all response bodies
+    bandwidth: Optional[int] = None
+    # fraction of the requests that fail with 503 SlowDown without being forwarded
+    error_rate: float = 0.0
+    seed: int = 0
+
+
+@dataclass
+class ProxyStats:
+    # method -> requests
+    requests: Dict[str, int] = field(default_factory=dict)
+    # request and response body bytes
+    bytes_received: int = 0
+    bytes_sent: int = 0
+    injected_errors: int = 0
+    # time from the end of the request to the end of the response, in nanoseconds
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+    def record(self, zenbenchmark: NeonBenchmarker, prefix: str):
+        zenbenchmark.record(
+            f"{prefix}.requests", sum(self.requests.values()), "", MetricReport.TEST_PARAM
+        )
+        zenbenchmark.record(
+            f"{prefix}.get_requests", self.requests.get("GET", 0), "", MetricReport.TEST_PARAM
+        )
+        zenbenchmark.record(
+            f"{prefix}.bytes_sent", self.bytes_sent / MB, "MB", MetricReport.TEST_PARAM
+        )
+        zenbenchmark.record(
+            f"{prefix}.injected_errors", self.injected_errors, "", MetricReport.TEST_PARAM
+        )
+        if self.latency.count > 0:
+            zenbenchmark.record_histogram(f"{prefix}.request", self.latency, "ms", divisor=1e6)
+
+
+class ThrottledStorageProxy:
+    """Forward HTTP requests to `upstream`, throttled according to `throttle`."""
+
+    def __init__(self, port: int, upstream: str, throttle: Optional[StorageThrottle] = None):
+        self.port = port
+        parsed = urlparse(upstream)
+        assert parsed.hostname is not None and parsed.port is not None
+        self.upstream_host = parsed.hostname
+        self.upstream_port = parsed.port
+        self._throttle = throttle or StorageThrottle()
+        self._rng = random.Random(self._throttle.seed)
+        self._lock = threading.Lock()
+        # when the simulated link is done with everything that was sent so far
+        self._link_free_at = 0.0
+        self.stats = ProxyStats()
+
+        proxy = self
+
+        class Handler(_ProxyHandler):
+            pass
+
+        Handler.proxy = proxy
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        log.info(f"remote storage proxy on port {port}, forwarding to {upstream}")
+
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def throttle(self) -> StorageThrottle:
+        return self._throttle
+
+    @throttle.setter
+    def throttle(self, throttle: StorageThrottle):
+        with self._lock:
+            self._throttle = throttle
+            self._rng = random.Random(throttle.seed)
+            self._link_free_at = 0.0
+
+    def reset_stats(self) -> ProxyStats:
+        """Start counting from zero, and return the stats so far."""
+        with self._lock:
+            stats, self.stats = self.stats, ProxyStats()
+        return stats
+
+    def attach(self, neon_env_builder: NeonEnvBuilder):
+        """Make the pageservers of `neon_env_builder` use mock S3 through this proxy."""
+        neon_env_builder.enable_pageserver_remote_storage(RemoteStorageKind.MOCK_S3)
+        remote_storage = neon_env_builder.pageserver_remote_storage
+        assert isinstance(remote_storage, S3Storage)
+        # only the pageservers go through the proxy, the test's own S3 client
+        # talks to the mock server directly
+        remote_storage.endpoint = self.endpoint()
+
+    def _inject_error(self) -> bool:
+        with self._lock:
+            if self._rng.random() >= self._throttle.error_rate:
+                return False
+            self.stats.injected_errors += 1
+            return True
+
+    def _pace(self, nbytes: int):
+        """Wait until the simulated link has capacity for `nbytes` more bytes."""
+        bandwidth = self._throttle.bandwidth
+        if not bandwidth:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._link_free_at = max(self._link_free_at, now) + nbytes / bandwidth
+            wait = self._link_free_at - now
+        if wait > 0:
+            time.sleep(wait)
+
+    def _account(self, method: str, received: int, sent: int, elapsed_ns: int):
+        with self._lock:
+            self.stats.requests[method] = self.stats.requests.get(method, 0) + 1
+            self.stats.bytes_received += received
+            self.stats.bytes_sent += sent
+            self.stats.latency.add(elapsed_ns)
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    proxy: ThrottledStorageProxy
+    # keep connections alive, like S3 does
+    protocol_version = "HTTP/1.1"
+
+    _upstream: Optional[http.client.HTTPConnection] = None
+
+    def log_message(self, format, *args):
+        # every request would end up in the test log otherwise
+        pass
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks: List[bytes] = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    # trailers, up to the final empty line
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    return b"".join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length > 0 else b""
+
+    def _forward(self, body: bytes) -> http.client.HTTPResponse:
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_HEADERS}
+        if body or self.command in ("PUT", "POST"):
+            headers["Content-Length"] = str(len(body))
+        for attempt in range(2):
+            if self._upstream is None:
+                self._upstream = http.client.HTTPConnection(
+                    self.proxy.upstream_host, self.proxy.upstream_port, timeout=300
+                )
+            try:
+                self._upstream.request(self.command, self.path, body=body, headers=headers)
+                return self._upstream.getresponse()
+            except (http.client.HTTPException, ConnectionError):
+                # the upstream closed an idle keep-alive connection, reconnect once
+                self._upstream.close()
+                self._upstream = None
+                if attempt == 1:
+                    raise
+        raise RuntimeError("unreachable")
+
+    def _handle(self):
+        body = self._read_body()
+        start = time.perf_counter_ns()
+        throttle = self.proxy.throttle
+        if throttle.latency > 0:
+            time.sleep(throttle.latency)
+
+        if self.proxy._inject_error():
+            self.send_response(503)
+            self.send_header("Content-Type", "application/xml")
+            self.send_header("Content-Length", str(len(INJECTED_ERROR_BODY)))
+            self.end_headers()
+            self.wfile.write(INJECTED_ERROR_BODY)
+            self.proxy._account(self.command, len(body), 0, time.perf_counter_ns() - start)
+            return
+
+        response = self._forward(body)
+        data = response.read()
+        self.send_response(response.status, response.reason)
+        for k, v in response.getheaders():
+            if k.lower() not in HOP_HEADERS and k.lower() != "content-length":
+                self.send_header(k, v)
+        content_length = response.getheader("Content-Length")
+        if self.command == "HEAD" and content_length is not None:
+            self.send_header("Content-Length", content_length)
+        else:
+            self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+
+        if self.command != "HEAD":
+            for offset in range(0, len(data), CHUNK_SIZE):
+                chunk = data[offset : offset + CHUNK_SIZE]
+                self.proxy._pace(len(chunk))
+                self.wfile.write(chunk)
+        self.proxy._account(self.command, len(body), len(data), time.perf_counter_ns() - start)
+
+    do_GET = _handle
+    do_PUT = _handle
+    do_POST = _handle
+    do_DELETE = _handle
+    do_HEAD = _handle
+
+    def finish(self):
+        super().finish()
+        if self._upstream is not None:
+            self._upstream.close()
+
+
+@pytest.fixture(scope="function")
+def remote_storage_proxy(
+    port_distributor: PortDistributor, mock_s3_server: MockS3Server
+) -> Iterator[ThrottledStorageProxy]:
+    proxy = ThrottledStorageProxy(port_distributor.get_port(), mock_s3_server.endpoint())
+    yield proxy
+    proxy.stop()
@@ -0,0 +1,292 @@
+"""
+Per-component resource accounting for benchmarks.
+
+With `--resource-accounting`, every test that uses the `zenbenchmark` fixture
+samples the CPU time, RSS, IO and context switches of the Neon processes it
+runs, and records per-component totals and peaks as `resources.{component}.*`
+metrics in the benchmark results.
+
+Processes are found in two ways: processes that pytest started itself, like the
+storage broker and the proxy, and processes whose command line refers to the
+test's output directory or the shared repo, like the pageservers, safekeepers
+and computes that `neon_local` starts in the background. Children of those,
+e.g. postgres backends and walredo processes, are accounted to their parent's
+component.
+"""
+
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import psutil
+import pytest
+from _pytest.config import Config
+from _pytest.config.argparsing import Parser
+from _pytest.fixtures import FixtureRequest
+from _pytest.python import Function
+
+from fixtures.benchmark_fixture import MetricReport, NeonBenchmarker
+from fixtures.log_helper import log
+
+MB = 1024 * 1024
+
+# process name -> component
+COMPONENTS = {
+    "pageserver": "pageserver",
+    "safekeeper": "safekeeper",
+    "storage_broker": "broker",
+    "proxy": "proxy",
+    "compute_ctl": "compute",
+    "attachment_service": "attachment_service",
+}
+
+
+def _classify(proc: psutil.Process, parent: Optional[str]) -> Optional[str]:
+    name = proc.name()
+    if name in COMPONENTS:
+        return COMPONENTS[name]
+    if parent is not None:
+        return parent
+    if name == "postgres":
+        return "compute" if "/endpoints/" in " ".join(proc.cmdline()) else "postgres"
+    # e.g. pgbench, psql or neon_local itself
+    return None
+
+
+def find_test_processes(roots: Sequence[Path]) -> Iterator[Tuple[psutil.Process, str]]:
+    """
+    The processes of a test, with their component. `roots` are the directories
+    whose paths identify the test's processes on their command lines.
+    """
+    root_strs = [str(root) for root in roots]
+    tops = psutil.Process(os.getpid()).children()
+    for proc in psutil.process_iter(["cmdline"]):
+        cmdline = " ".join(proc.info["cmdline"] or [])
+        if any(root in cmdline for root in root_strs):
+            tops.append(proc)
+
+    seen = set()
+
+    def walk(proc: psutil.Process, parent: Optional[str]) -> Iterator[Tuple[psutil.Process, str]]:
+        if proc.pid in seen:
+            return
+        seen.add(proc.pid)
+        try:
+            component = _classify(proc, parent)
+            children = proc.children()
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            return
+        if component is not None:
+            yield proc, component
+        for child in children:
+            yield from walk(child, component)
+
+    for top in tops:
+        yield from walk(top, None)
+
+
+@dataclass
+class ProcessCounters:
+    cpu_user: float = 0.0
+    cpu_system: float = 0.0
+    read_bytes: int = 0
+    write_bytes: int = 0
+    # all bytes passed to read/write-like syscalls, including sockets and the page cache
+    read_chars: int = 0
+    write_chars: int = 0
+    voluntary_ctx_switches: int = 0
+    involuntary_ctx_switches: int = 0
+
+    @classmethod
+    def read(cls, proc: psutil.Process) -> "ProcessCounters":
+        cpu = proc.cpu_times()
+        ctx = proc.num_ctx_switches()
+        counters = cls(
+            cpu_user=cpu.user,
+            cpu_system=cpu.system,
+            voluntary_ctx_switches=ctx.voluntary,
+            involuntary_ctx_switches=ctx.involuntary,
+        )
+        try:
+            io = proc.io_counters()
+            counters.read_bytes = io.read_bytes
+            counters.write_bytes = io.write_bytes
+            counters.read_chars = getattr(io, "read_chars", 0)
+            counters.write_chars = getattr(io, "write_chars", 0)
+        except (psutil.AccessDenied, AttributeError):
+            # not available on all platforms
+            pass
+        return counters
+
+    def __sub__(self, other: "ProcessCounters") -> "ProcessCounters":
+        return ProcessCounters(
+            **{
+                name: getattr(self, name) - getattr(other, name)
+                for name in self.__dataclass_fields__
+            }
+        )
+
+    def __add__(self, other: "ProcessCounters") -> "ProcessCounters":
+        return ProcessCounters(
+            **{
+                name: getattr(self, name) + getattr(other, name)
+                for name in self.__dataclass_fields__
+            }
+        )
+
+
+@dataclass
+class _TrackedProcess:
+    component: str
+    # counters when the process was first seen, or zero if it started after the sampler
+    baseline: ProcessCounters
+    last: ProcessCounters
+
+
+@dataclass
+class ComponentUsage:
+    component: str
+    processes: int = 0
+    counters: ProcessCounters = field(default_factory=ProcessCounters)
+    peak_rss: int = 0
+
+    def record(self, zenbenchmark: NeonBenchmarker, prefix: str):
+        name = f"{prefix}.{self.component}"
+        lower = MetricReport.LOWER_IS_BETTER
+        c = self.counters
+        zenbenchmark.record(f"{name}.processes", self.processes, "", MetricReport.TEST_PARAM)
+        zenbenchmark.record(f"{name}.cpu_user", c.cpu_user, "s", lower)
+        zenbenchmark.record(f"{name}.cpu_system", c.cpu_system, "s", lower)
+        zenbenchmark.record(f"{name}.peak_rss", self.peak_rss / MB, "MB", lower)
+        zenbenchmark.record(f"{name}.read_bytes", c.read_bytes / MB, "MB", lower)
+        zenbenchmark.record(f"{name}.write_bytes", c.write_bytes / MB, "MB", lower)
+        zenbenchmark.record(f"{name}.read_chars", c.read_chars / MB, "MB", lower)
+        zenbenchmark.record(f"{name}.write_chars", c.write_chars / MB, "MB", lower)
+        zenbenchmark.record(f"{name}.voluntary_ctx_switches", c.voluntary_ctx_switches, "", lower)
+        zenbenchmark.record(
+            f"{name}.involuntary_ctx_switches", c.involuntary_ctx_switches, "", lower
+        )
+
+
+class ResourceSampler:
+    """
+    Sample the processes that belong to a test, see `find_test_processes`, every
+    `interval` seconds in a background thread.
+    """
+
+    def __init__(self, roots: Sequence[Path], interval: float = 1.0):
+        self.roots = roots
+        self.interval = interval
+        self.processes: Dict[Tuple[int, float], _TrackedProcess] = {}
+        self.peak_rss: Dict[str, int] = {}
+        self._first_sample = True
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        rss: Dict[str, int] = {}
+        for proc, component in find_test_processes(self.roots):
+            try:
+                with proc.oneshot():
+                    key = (proc.pid, proc.create_time())
+                    counters = ProcessCounters.read(proc)
+                    rss[component] = rss.get(component, 0) + proc.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+            tracked = self.processes.get(key)
+            if tracked is None:
+                # processes that were already running when sampling started only
+                # count from then on
+                baseline = counters if self._first_sample else ProcessCounters()
+                self.processes[key] = _TrackedProcess(component, baseline, counters)
+            else:
+                tracked.last = counters
+        for component, value in rss.items():
+            self.peak_rss[component] = max(self.peak_rss.get(component, 0), value)
+        self._first_sample = False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                log.warning(f"failed to sample process resources: {e}")
+
+    def start(self):
+        self.sample()
+        self._thread.start()
+
+    def stop(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        # a final sample, so that short tests and the end of the test are accounted for
+        self.sample()
+
+    def usage(self) -> List[ComponentUsage]:
+        usage: Dict[str, ComponentUsage] = {}
+        for tracked in self.processes.values():
+            u = usage.setdefault(tracked.component, ComponentUsage(tracked.component))
+            u.processes += 1
+            u.counters = u.counters + (tracked.last - tracked.baseline)
+        for component, peak in self.peak_rss.items():
+            usage.setdefault(component, ComponentUsage(component)).peak_rss = peak
+        return sorted(usage.values(), key=lambda u: u.component)
+
+    def record(self, zenbenchmark: NeonBenchmarker, prefix: str = "resources"):
+        for u in self.usage():
+            u.record(zenbenchmark, prefix)
+
+
+def pytest_addoption(parser: Parser):
+    parser.addoption(
+        "--resource-accounting",
+        action="store_true",
+        default=False,
+        help="Record CPU, memory and IO usage of the Neon processes in benchmarks",
+    )
+    parser.addoption(
+        "--resource-accounting-interval",
+        type=float,
+        default=1.0,
+        help="Seconds between samples of --resource-accounting",
+    )
+
+
+@pytest.fixture(scope="function", autouse=True)
+def resource_accounting(
+    request: FixtureRequest, pytestconfig: Config, top_output_dir: Path, test_output_dir: Path
+) -> Iterator[Optional[ResourceSampler]]:
+    if not pytestconfig.getoption("--resource-accounting") or (
+        "zenbenchmark" not in request.fixturenames
+    ):
+        yield None
+        return
+
+    sampler = ResourceSampler(
+        [test_output_dir, top_output_dir / "shared_repo"],
+        interval=pytestconfig.getoption("--resource-accounting-interval"),
+    )
+    sampler.start()
+    request.node._resource_sampler = sampler
+    try:
+        yield sampler
+    finally:
+        sampler.stop()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item: Function) -> Iterator[None]:
+    yield
+    # Record at the end of the test itself, while the env is still running, so
+    # that the metrics end up in the test's results
+    sampler: Optional[ResourceSampler] = getattr(item, "_resource_sampler", None)
+    if sampler is None:
+        return
+    sampler.stop()
+    zenbenchmark = item.funcargs["zenbenchmark"]
+    assert isinstance(zenbenchmark, NeonBenchmarker)
+    sampler.record(zenbenchmark)
@@ -1,10 +1,11 @@
-import contextlib
 import json
 import os
 import re
 import subprocess
 import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, fields
 from pathlib import Path
 from typing import (
     TYPE_CHECKING,
@@ -15,6 +16,7 @@ from typing import (
     Optional,
     Tuple,
     TypeVar,
+    Union,
 )
 from urllib.parse import urlencode
 
@@ -23,14 +25,10 @@ import zstandard
 from psycopg2.extensions import cursor
 
 from fixtures.log_helper import log
-from fixtures.pageserver.types import (
-    parse_delta_layer,
-    parse_image_layer,
-)
 
 if TYPE_CHECKING:
     from fixtures.neon_fixtures import PgBin
-from fixtures.types import TimelineId
+from fixtures.types import KEY_MAX, KEY_MIN, TimelineId
 
 Fn = TypeVar("Fn", bound=Callable[..., Any])
 
@@ -188,35 +186,143 @@ def query_scalar(cur: cursor, query: str) -> Any:
     return var[0]
 
 
-# Traverse directory to get total size.
-def get_dir_size(path: str) -> int:
-    """Return size in bytes."""
-    totalbytes = 0
-    for root, _dirs, files in os.walk(path):
-        for name in files:
-            try:
-                totalbytes += os.path.getsize(os.path.join(root, name))
-            except FileNotFoundError:
-                pass  # file could be concurrently removed
+@dataclass
+class DiskUsage:
+    """
+    Result of a `scan_dir_size` pass: total bytes and file count of a directory
+    tree, with layer files broken down by kind. L0 layers are counted both as
+    delta layers and in the `l0_*` fields.
+    """
+
+    total_bytes: int = 0
+    file_count: int = 0
+    image_layers: int = 0
+    image_bytes: int = 0
+    delta_layers: int = 0
+    delta_bytes: int = 0
+    l0_layers: int = 0
+    l0_bytes: int = 0
+    temp_files: int = 0
+    temp_bytes: int = 0
+
+    @property
+    def layer_files(self) -> int:
+        return self.image_layers + self.delta_layers
+
+    @property
+    def layer_bytes(self) -> int:
+        return self.image_bytes + self.delta_bytes
+
+    def __add__(self, other: "DiskUsage") -> "DiskUsage":
+        return DiskUsage(
+            **{f.name: getattr(self, f.name) + getattr(other, f.name) for f in fields(self)}
+        )
+
+    def add_file(self, name: str, size: int):
+        self.total_bytes += size
+        self.file_count += 1
+
+        kind = _classify_layer_file_name(name)
+        if kind is None:
+            return
+        elif kind == "image":
+            self.image_layers += 1
+            self.image_bytes += size
+        elif kind == "temp":
+            self.temp_files += 1
+            self.temp_bytes += size
+        else:
+            self.delta_layers += 1
+            self.delta_bytes += size
+            if kind == "l0":
+                self.l0_layers += 1
+                self.l0_bytes += size
+
+
+# Lengths of the `<key start>-<key end>` and `<lsn>` parts of a layer file name, as
+# formatted by the pageserver: keys are 36 hex digits and LSNs 16 hex digits.
+_LAYER_KEY_RANGE_LEN = 36 * 2 + 1
+_IMAGE_LSN_LEN = 16
+_DELTA_LSN_RANGE_LEN = 16 * 2 + 1
+_L0_KEY_RANGE = f"{KEY_MIN.as_int():036X}-{KEY_MAX.as_int():036X}"
+_TEMP_FILE_SUFFIX = "___temp"
+
+
+def _classify_layer_file_name(name: str) -> Optional[str]:
+    """
+    Return "image", "delta", "l0" or "temp" for a file in a timeline directory,
+    or None if it is not a layer file. This only looks at the shape of the name,
+    it doesn't convert the keys and LSNs.
+    """
+    if name.endswith(_TEMP_FILE_SUFFIX):
+        return "temp"
+    key_range, sep, lsn_part = name.partition("__")
+    if not sep or len(key_range) != _LAYER_KEY_RANGE_LEN or key_range[36] != "-":
+        return None
+    if len(lsn_part) == _IMAGE_LSN_LEN:
+        return "image"
+    if len(lsn_part) == _DELTA_LSN_RANGE_LEN and lsn_part[16] == "-":
+        return "l0" if key_range == _L0_KEY_RANGE else "delta"
+    return None
+
+
+def _scan_one_dir(path: str) -> Tuple[DiskUsage, List[str]]:
+    """Size the files directly in `path`, return the stats and the subdirectories to visit."""
+    usage = DiskUsage()
+    subdirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    else:
+                        usage.add_file(entry.name, entry.stat(follow_symlinks=False).st_size)
+                except FileNotFoundError:
+                    pass  # file could be concurrently removed
+    except FileNotFoundError:
+        pass  # directory could be concurrently removed
+    return usage, subdirs
+
+
+def scan_dir_size(path: Union[str, Path], concurrency: int = 1) -> DiskUsage:
+    """
+    Walk a directory tree with `os.scandir` and sum up file sizes, classifying
+    layer files by kind in the same pass.
 
-    return totalbytes
+    With `concurrency > 1`, every subdirectory is scanned as a separate task in
+    a thread pool, so e.g. pointing this at a pageserver's `tenants` directory
+    sizes tenants and timelines in parallel.
+    """
+    if concurrency <= 1:
+        total = DiskUsage()
+        stack = [str(path)]
+        while stack:
+            usage, subdirs = _scan_one_dir(stack.pop())
+            total += usage
+            stack.extend(subdirs)
+        return total
+
+    total = DiskUsage()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = {executor.submit(_scan_one_dir, str(path))}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                usage, subdirs = future.result()
+                total += usage
+                pending.update(executor.submit(_scan_one_dir, subdir) for subdir in subdirs)
+    return total
+
+
+def get_dir_size(path: Union[str, Path]) -> int:
+    """Return size in bytes."""
+    return scan_dir_size(path).total_bytes
 
 
 def get_timeline_dir_size(path: Path) -> int:
     """Get the timeline directory's total size, which only counts the layer files' size."""
-    sz = 0
-    for dir_entry in path.iterdir():
-        with contextlib.suppress(Exception):
-            # file is an image layer
-            _ = parse_image_layer(dir_entry.name)
-            sz += dir_entry.stat().st_size
-            continue
-
-        with contextlib.suppress(Exception):
-            # file is a delta layer
-            _ = parse_delta_layer(dir_entry.name)
-            sz += dir_entry.stat().st_size
-    return sz
+    return scan_dir_size(path).layer_bytes
 
 
 def get_scale_for_db(size_mb: int) -> int:
@@ -229,7 +335,7 @@ def get_scale_for_db(size_mb: int) -> int:
 
 
 ATTACHMENT_NAME_REGEX: re.Pattern = re.compile(  # type: ignore[type-arg]
-    r"regression\.diffs|.+\.(?:log|stderr|stdout|filediff|metrics|html|walredo)"
+    r"regression\.diffs|.+\.(?:log|stderr|stdout|filediff|metrics|html|walredo|svg)"
 )
 
 
@@ -3,15 +3,18 @@ import statistics
 import threading
 import time
 import timeit
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from contextlib import closing
-from typing import List
+from typing import Dict, List, Tuple
 
 import pytest
-from fixtures.benchmark_fixture import MetricReport
+from fixtures.benchmark_fixture import LatencyHistogram, MetricReport
 from fixtures.compare_fixtures import NeonCompare
 from fixtures.log_helper import log
+from fixtures.pageserver.http import PageserverHttpClient
 from fixtures.pageserver.utils import wait_for_last_record_lsn
-from fixtures.types import Lsn
+from fixtures.types import Lsn, TimelineId
 
 
 def _record_branch_creation_durations(neon_compare: NeonCompare, durs: List[float]):
@@ -150,3 +153,124 @@ def test_branch_creation_many_relations(neon_compare: NeonCompare):
         env.neon_cli.create_branch("child_busy", "root")
 
     thread.join()
+
+
+def _branch_parents(topology: str, n_branches: int, rng: random.Random) -> List[int]:
+    """
+    The parent of every branch, by index: branch 0 is the root and branches
+    1..n_branches are created. A parent always has a lower index than its children.
+    """
+    parents = [0]
+    for i in range(1, n_branches + 1):
+        if topology == "chain":
+            parents.append(i - 1)
+        elif topology == "fan":
+            parents.append(0)
+        elif topology == "random":
+            parents.append(rng.randint(0, i - 1))
+        else:
+            raise ValueError(f"unknown branching topology {topology}")
+    return parents
+
+
+@pytest.mark.timeout(1000)
+@pytest.mark.parametrize("n_branches", [512])
+@pytest.mark.parametrize("parallelism", [1, 16])
+@pytest.mark.parametrize("topology", ["chain", "fan", "random"])
+# Test measures branch creation throughput when many branches are created at once
+# through the pageserver API, bypassing neon_local. A branch is created as soon as
+# its parent exists, with up to `parallelism` requests in flight, so chains are
+# created one by one whatever the parallelism.
+#
+# The branches are created in steps, and after each one the pageserver RSS and
+# the total number of layers of all the timelines are recorded.
+def test_branch_creation_storm(
+    neon_compare: NeonCompare, topology: str, parallelism: int, n_branches: int
+):
+    env = neon_compare.env
+    tenant = neon_compare.tenant
+    steps = 4
+
+    neon_compare.pg_bin.run_capture(["pgbench", "-i", "-s10", neon_compare.pg.connstr()])
+    neon_compare.flush()
+
+    parents = _branch_parents(topology, n_branches, random.Random(0))
+    children: Dict[int, List[int]] = defaultdict(list)
+    for i in range(1, n_branches + 1):
+        children[parents[i]].append(i)
+    timelines = [neon_compare.timeline] + [TimelineId.generate() for _ in range(n_branches)]
+
+    # one client, and so one HTTP connection, per worker thread
+    local = threading.local()
+
+    def http_client() -> PageserverHttpClient:
+        if not hasattr(local, "client"):
+            local.client = env.pageserver.http_client()
+        client: PageserverHttpClient = local.client
+        return client
+
+    def create_branch(i: int) -> Tuple[int, int]:
+        start = time.perf_counter_ns()
+        http_client().timeline_create(
+            env.pg_version, tenant, timelines[i], ancestor_timeline_id=timelines[parents[i]]
+        )
+        return i, time.perf_counter_ns() - start
+
+    def layer_count(timeline: TimelineId) -> int:
+        info = http_client().layer_map_info(tenant, timeline)
+        return len(info.historic_layers) + len(info.in_memory_layers)
+
+    latencies = LatencyHistogram()
+    created = {0}
+    total_duration = 0.0
+    with ThreadPoolExecutor(max_workers=parallelism) as pool:
+        for step in range(1, steps + 1):
+            last = n_branches * step // steps
+            step_branches = [i for i in range(1, last + 1) if i not in created]
+            ready = [i for i in step_branches if parents[i] in created]
+
+            started = time.perf_counter()
+            pending = {pool.submit(create_branch, i) for i in ready}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i, elapsed = future.result()
+                    latencies.add(elapsed)
+                    created.add(i)
+                    pending |= {
+                        pool.submit(create_branch, child) for child in children[i] if child <= last
+                    }
+            duration = time.perf_counter() - started
+            total_duration += duration
+            log.info(f"Created {len(step_branches)} branches in {duration:.2f}s")
+
+            count = len(created) - 1
+            neon_compare.zenbenchmark.record(
+                f"at_{count}.branches_per_second",
+                len(step_branches) / duration,
+                "branches/s",
+                MetricReport.HIGHER_IS_BETTER,
+            )
+            rss = env.pageserver.http_client().get_metric_value("process_resident_memory_bytes")
+            assert rss is not None
+            neon_compare.zenbenchmark.record(
+                f"at_{count}.pageserver_rss",
+                rss / (1024 * 1024),
+                "MB",
+                MetricReport.LOWER_IS_BETTER,
+            )
+            layers = sum(pool.map(layer_count, timelines[: count + 1]))
+            neon_compare.zenbenchmark.record(
+                f"at_{count}.layers", layers, "", MetricReport.LOWER_IS_BETTER
+            )
+
+    neon_compare.zenbenchmark.record(
+        "branches_per_second",
+        n_branches / total_duration,
+        "branches/s",
+        MetricReport.HIGHER_IS_BETTER,
+    )
+    neon_compare.zenbenchmark.record_histogram(
+        "branch_creation_latency", latencies, "s", divisor=1e9
+    )
+    neon_compare.report_peak_memory_use()
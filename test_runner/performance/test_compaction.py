@@ -3,6 +3,8 @@ from contextlib import closing
 import pytest
 from fixtures.compare_fixtures import NeonCompare
 from fixtures.neon_fixtures import wait_for_last_flush_lsn
+from fixtures.pageserver.layer_accounting import LayerAccounting
+from fixtures.pageserver.layer_coverage import analyze_layer_map
 
 
 #
@@ -31,6 +33,10 @@ def test_compaction(neon_compare: NeonCompare):
     neon_compare.tenant = tenant_id
     neon_compare.timeline = timeline_id
 
+    # Take the baseline before any WAL is ingested, so that write amplification is
+    # relative to all the WAL that the workload below generates
+    accounting = LayerAccounting(pageserver_http, tenant_id, timeline_id)
+
     # Create some tables, and run a bunch of INSERTs and UPDATes on them,
     # to generate WAL and layers
     endpoint = env.endpoints.create_start(
@@ -46,13 +52,27 @@ def test_compaction(neon_compare: NeonCompare):
                     cur.execute(f"update tbl{i} set j = {j};")
 
     wait_for_last_flush_lsn(env, endpoint, tenant_id, timeline_id)
+    analyze_layer_map(pageserver_http, tenant_id, timeline_id).record(
+        neon_compare.zenbenchmark, "before_compaction"
+    )
 
     # First compaction generates L1 layers
-    with neon_compare.zenbenchmark.record_duration("compaction"):
-        pageserver_http.timeline_compact(tenant_id, timeline_id)
+    with accounting.phase("compaction"):
+        with neon_compare.zenbenchmark.record_duration("compaction"):
+            pageserver_http.timeline_compact(tenant_id, timeline_id)
+    analyze_layer_map(pageserver_http, tenant_id, timeline_id).record(
+        neon_compare.zenbenchmark, "after_compaction"
+    )
 
     # And second compaction triggers image layer creation
-    with neon_compare.zenbenchmark.record_duration("image_creation"):
-        pageserver_http.timeline_compact(tenant_id, timeline_id)
+    with accounting.phase("image_creation"):
+        with neon_compare.zenbenchmark.record_duration("image_creation"):
+            pageserver_http.timeline_compact(tenant_id, timeline_id)
+    analyze_layer_map(pageserver_http, tenant_id, timeline_id).record(
+        neon_compare.zenbenchmark, "after_image_creation"
+    )
+
+    # Layers and bytes created and removed by each compaction
+    accounting.record(neon_compare.zenbenchmark, "layer_accounting")
 
     neon_compare.report_size()
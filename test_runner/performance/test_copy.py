@@ -1,58 +1,42 @@
+import time
 from contextlib import closing
-from io import BufferedReader, RawIOBase
-from typing import Optional
 
+from fixtures.bulk_copy import CopyDataSource, CopyFormat
 from fixtures.compare_fixtures import PgCompare
 
 
-class CopyTestData(RawIOBase):
-    def __init__(self, rows: int):
-        self.rows = rows
-        self.rownum = 0
-        self.linebuf: Optional[bytes] = None
-        self.ptr = 0
-
-    def readable(self):
-        return True
-
-    def readinto(self, b):
-        if self.linebuf is None or self.ptr == len(self.linebuf):
-            if self.rownum >= self.rows:
-                # No more rows, return EOF
-                return 0
-            self.linebuf = f"{self.rownum}\tSomewhat long string to consume some space.\n".encode()
-            self.ptr = 0
-            self.rownum += 1
-
-        # Number of bytes to read in this call
-        l = min(len(self.linebuf) - self.ptr, len(b))  # noqa: E741
-
-        b[:l] = self.linebuf[self.ptr : (self.ptr + l)]
-        self.ptr += l
-        return l
-
-
-def copy_test_data(rows: int):
-    return BufferedReader(CopyTestData(rows))
-
-
 #
 # COPY performance tests.
 #
 def test_copy(neon_with_baseline: PgCompare):
-    env = neon_with_baseline
+    run_copy(neon_with_baseline, CopyFormat.TEXT)
+
+
+# The same, in COPY binary format
+def test_copy_binary(neon_with_baseline: PgCompare):
+    run_copy(neon_with_baseline, CopyFormat.BINARY)
+
+
+def run_copy(env: PgCompare, copy_format: CopyFormat):
+    # One million distinct rows, rendered upfront so that COPY isn't bound by the client
+    source = CopyDataSource(1000000, format=copy_format, distinct_blocks=100)
+    source.record_client_throughput(env.zenbenchmark, "copy")
 
     # Get the timeline ID of our branch. We need it for the pageserver 'checkpoint' command
     with closing(env.pg.connect()) as conn:
         with conn.cursor() as cur:
-            cur.execute("create table copytest (i int, t text);")
+            cur.execute(source.create_table_sql("copytest"))
 
             # Load data with COPY, recording the time and I/O it takes.
             #
             # Since there's no data in the table previously, this extends it.
             with env.record_pageserver_writes("copy_extend_pageserver_writes"):
                 with env.record_duration("copy_extend"):
-                    cur.copy_from(copy_test_data(1000000), "copytest")
+                    start = time.perf_counter()
+                    cur.copy_expert(source.copy_sql("copytest"), source.reader())
+                    source.record_throughput(
+                        env.zenbenchmark, "copy_extend", time.perf_counter() - start
+                    )
                     env.flush()
 
             # Delete most rows, and VACUUM to make the space available for reuse.
@@ -72,7 +56,11 @@ def test_copy(neon_with_baseline: PgCompare):
             # This will also clear all the VM bits.
             with env.record_pageserver_writes("copy_reuse_pageserver_writes"):
                 with env.record_duration("copy_reuse"):
-                    cur.copy_from(copy_test_data(1000000), "copytest")
+                    start = time.perf_counter()
+                    cur.copy_expert(source.copy_sql("copytest"), source.reader())
+                    source.record_throughput(
+                        env.zenbenchmark, "copy_reuse", time.perf_counter() - start
+                    )
                     env.flush()
 
             env.report_peak_memory_use()
@@ -0,0 +1,346 @@
+import random
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import pytest
+from _pytest.fixtures import FixtureRequest
+from fixtures.benchmark_fixture import LatencyHistogram, MetricReport, NeonBenchmarker
+from fixtures.log_helper import log
+from fixtures.metrics import PrometheusHistogram
+from fixtures.neon_fixtures import NeonEnvBuilder, NeonPageserver, PgBin
+from fixtures.pageserver.eviction import EvictionEnv, EvictionOrder, create_eviction_env
+from fixtures.pageserver.http import PageserverHttpClient
+
+MB = 1024 * 1024
+
+PRESSURE_LOG_LINE = "running disk usage based eviction due to pressure"
+RELIEVED_LOG_LINE = "disk usage pressure relieved"
+
+# filter for the remote storage download histogram, which on-demand downloads go through
+LAYER_DOWNLOADS = {"file_kind": "layer", "op_kind": "download", "status": "success"}
+
+
+def tenant_scales(n_tenants: int) -> List[int]:
+    """pgbench scales for `n_tenants` tenants, alternating between a smaller and a larger one."""
+    return [(4, 6)[i % 2] for i in range(n_tenants)]
+
+
+def resident_bytes(pageserver_http: PageserverHttpClient) -> int:
+    """Resident layer bytes of all timelines, from the metrics instead of walking directories."""
+    return sum(resident_bytes_by_timeline(pageserver_http))
+
+
+def resident_bytes_by_timeline(pageserver_http: PageserverHttpClient) -> List[int]:
+    metrics = pageserver_http.get_metrics()
+    return [int(s.value) for s in metrics.query_all("pageserver_resident_physical_size")]
+
+
+def evictions_total(pageserver_http: PageserverHttpClient) -> int:
+    metrics = pageserver_http.get_metrics()
+    return int(sum(s.value for s in metrics.query_all("pageserver_evictions_total")))
+
+
+def _log_timestamp(line: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(line.split()[0], "%Y-%m-%dT%H:%M:%S.%fZ")
+    except (IndexError, ValueError):
+        return None
+
+
+def eviction_iteration_seconds(pageserver: NeonPageserver) -> Optional[float]:
+    """
+    How long the eviction iteration that relieved the pressure took, from the
+    pageserver log: the time between the first "relieved" line and the last
+    "due to pressure" line before it.
+    """
+    started = None
+    with (pageserver.workdir / "pageserver.log").open("r") as f:
+        for line in f:
+            if PRESSURE_LOG_LINE in line:
+                started = _log_timestamp(line)
+            elif RELIEVED_LOG_LINE in line:
+                finished = _log_timestamp(line)
+                if started is None or finished is None:
+                    return None
+                return (finished - started).total_seconds()
+    return None
+
+
+def eviction_env_for(
+    request: FixtureRequest,
+    neon_env_builder: NeonEnvBuilder,
+    pg_bin: PgBin,
+    n_tenants: int,
+) -> EvictionEnv:
+    return create_eviction_env(
+        request.node.name,
+        neon_env_builder,
+        pg_bin,
+        num_pageservers=1,
+        pgbench_scales=tenant_scales(n_tenants),
+    )
+
+
+ORDERS = [
+    EvictionOrder.ABSOLUTE_ORDER,
+    EvictionOrder.RELATIVE_ORDER_EQUAL,
+    EvictionOrder.RELATIVE_ORDER_SPARE,
+]
+
+
+#
+# Measure how fast a single eviction run, like the one the background task does
+# under pressure, evicts half of the resident layers.
+#
+@pytest.mark.timeout(1200)
+@pytest.mark.parametrize("n_tenants", [2, 8])
+@pytest.mark.parametrize("order", ORDERS)
+def test_eviction_throughput(
+    request: FixtureRequest,
+    neon_env_builder: NeonEnvBuilder,
+    pg_bin: PgBin,
+    zenbenchmark: NeonBenchmarker,
+    order: EvictionOrder,
+    n_tenants: int,
+):
+    env = eviction_env_for(request, neon_env_builder, pg_bin, n_tenants)
+    pageserver_http = env.pageserver_http
+
+    resident_before = resident_bytes(pageserver_http)
+    evictions_before = evictions_total(pageserver_http)
+    target = resident_before // 2
+
+    start = time.perf_counter()
+    response = pageserver_http.disk_usage_eviction_run(
+        {"evict_bytes": target, "eviction_order": order.config()}
+    )
+    elapsed = time.perf_counter() - start
+    log.info(f"{response}")
+
+    evicted = resident_before - resident_bytes(pageserver_http)
+    layers = evictions_total(pageserver_http) - evictions_before
+    assert evicted >= target, "must evict at least the requested bytes"
+
+    zenbenchmark.record("tenants", n_tenants, "", MetricReport.TEST_PARAM)
+    zenbenchmark.record("resident_before", resident_before / MB, "MB", MetricReport.TEST_PARAM)
+    zenbenchmark.record("evicted", evicted / MB, "MB", MetricReport.TEST_PARAM)
+    zenbenchmark.record("evicted_layers", layers, "", MetricReport.TEST_PARAM)
+    zenbenchmark.record("eviction_run", elapsed, "s", MetricReport.LOWER_IS_BETTER)
+    zenbenchmark.record(
+        "eviction_throughput", evicted / MB / elapsed, "MB/s", MetricReport.HIGHER_IS_BETTER
+    )
+    zenbenchmark.record(
+        "evicted_layers_per_second", layers / elapsed, "", MetricReport.HIGHER_IS_BETTER
+    )
+    zenbenchmark.record(
+        "eviction_failures",
+        response["Finished"]["assumed"]["failed"]["count"],
+        "",
+        MetricReport.LOWER_IS_BETTER,
+    )
+
+
+#
+# Measure how long the background eviction task takes to get disk usage below
+# max_usage_pct, when the pageserver starts up with the (mocked) disk full.
+#
+@pytest.mark.timeout(1200)
+@pytest.mark.parametrize("n_tenants", [2, 8])
+@pytest.mark.parametrize("order", ORDERS)
+def test_eviction_pressure_relief(
+    request: FixtureRequest,
+    neon_env_builder: NeonEnvBuilder,
+    pg_bin: PgBin,
+    zenbenchmark: NeonBenchmarker,
+    order: EvictionOrder,
+    n_tenants: int,
+):
+    max_usage_pct = 33
+    env = eviction_env_for(request, neon_env_builder, pg_bin, n_tenants)
+    pageserver = env.pageserver
+    pageserver_http = env.pageserver_http
+
+    pageserver.stop()
+
+    # make it seem like we're at 100% utilization by setting total bytes to the used bytes
+    total_size, _, _ = env.timelines_du(pageserver)
+    blocksize = 512
+    total_blocks = (total_size + (blocksize - 1)) // blocksize
+    target_size = total_size * max_usage_pct // 100
+
+    start = time.perf_counter()
+    env.pageserver_start_with_disk_usage_eviction(
+        pageserver,
+        period="1s",
+        max_usage_pct=max_usage_pct,
+        min_avail_bytes=0,
+        mock_behavior={
+            "type": "Success",
+            "blocksize": blocksize,
+            "total_blocks": total_blocks,
+            # Only count layer files towards used bytes in the mock_statvfs.
+            "name_filter": ".*__.*",
+        },
+        eviction_order=order,
+    )
+
+    # Sample the resident size from the metrics rather than walking the
+    # timeline directories, which is slow enough to skew the measurement
+    deadline = start + 120
+    while True:
+        # until all timelines are loaded and the task has started evicting, the
+        # metrics don't show the full picture yet
+        by_timeline = resident_bytes_by_timeline(pageserver_http)
+        resident = sum(by_timeline)
+        if (
+            len(by_timeline) == len(env.timelines)
+            and evictions_total(pageserver_http) > 0
+            and resident <= target_size
+        ):
+            break
+        assert time.perf_counter() < deadline, "eviction did not relieve the pressure in time"
+        time.sleep(0.05)
+    time_to_relieve = time.perf_counter() - start
+
+    zenbenchmark.record("tenants", n_tenants, "", MetricReport.TEST_PARAM)
+    zenbenchmark.record("max_usage_pct", max_usage_pct, "%", MetricReport.TEST_PARAM)
+    zenbenchmark.record("resident_before", total_size / MB, "MB", MetricReport.TEST_PARAM)
+    zenbenchmark.record("resident_after", resident / MB, "MB", MetricReport.TEST_PARAM)
+    # includes pageserver startup and waiting for the first iteration of the task
+    zenbenchmark.record("time_to_relieve", time_to_relieve, "s", MetricReport.LOWER_IS_BETTER)
+
+    # the log may lag behind the metrics a bit
+    time.sleep(1)
+    iteration = eviction_iteration_seconds(pageserver)
+    if iteration is None:
+        log.warning("no eviction iteration found in the pageserver log")
+        return
+    zenbenchmark.record("eviction_iteration", iteration, "s", MetricReport.LOWER_IS_BETTER)
+    if iteration > 0:
+        zenbenchmark.record(
+            "eviction_throughput",
+            (total_size - resident) / MB / iteration,
+            "MB/s",
+            MetricReport.HIGHER_IS_BETTER,
+        )
+
+
+#
+# Measure what eviction costs readers: evict everything, then read the
+# just-evicted data back, so that every layer has to be downloaded on demand.
+#
+@pytest.mark.timeout(1200)
+@pytest.mark.parametrize("workload", ["seqscan", "point_lookup"])
+def test_read_after_eviction(
+    request: FixtureRequest,
+    neon_env_builder: NeonEnvBuilder,
+    pg_bin: PgBin,
+    zenbenchmark: NeonBenchmarker,
+    workload: str,
+):
+    n_lookups = 1000
+    env = eviction_env_for(request, neon_env_builder, pg_bin, 2)
+    pageserver_http = env.pageserver_http
+    tenant_id, _ = env.timelines[1]
+    scale = tenant_scales(2)[1]
+
+    resident_before = resident_bytes(pageserver_http)
+    response = pageserver_http.disk_usage_eviction_run(
+        {
+            "evict_bytes": resident_before,
+            "eviction_order": EvictionOrder.ABSOLUTE_ORDER.config(),
+        }
+    )
+    log.info(f"{response}")
+    resident_evicted = resident_bytes(pageserver_http)
+
+    downloads_before = PrometheusHistogram.from_metrics(
+        pageserver_http.get_metrics(), "pageserver_remote_operation_seconds", LAYER_DOWNLOADS
+    )
+    reads = LatencyHistogram()
+    first_query = None
+    rng = random.Random(0)
+
+    # safekeepers are stopped, so read at the LSN after pgbench -i, like warm_up_tenant
+    lsn = env.pgbench_init_lsns[tenant_id]
+    with env.neon_env.endpoints.create_start("main", tenant_id=tenant_id, lsn=lsn) as endpoint:
+        # The queries are measured from here on, without the basebackup's downloads
+        downloads_started = PrometheusHistogram.from_metrics(
+            pageserver_http.get_metrics(), "pageserver_remote_operation_seconds", LAYER_DOWNLOADS
+        )
+        start_downloads = downloads_started - downloads_before
+        downloads_before = downloads_started
+        resident_started = resident_bytes(pageserver_http)
+
+        with endpoint.connect() as conn:
+            cur = conn.cursor()
+            queries: List[Tuple[str, Optional[Tuple[int]]]]
+            if workload == "seqscan":
+                queries = [
+                    (f"select avg({column}) from {table}", None)
+                    for table, column in [
+                        ("pgbench_accounts", "abalance"),
+                        ("pgbench_tellers", "tbalance"),
+                        ("pgbench_branches", "bbalance"),
+                        ("pgbench_history", "delta"),
+                    ]
+                ]
+            else:
+                max_aid = scale * 100000
+                queries = [
+                    (
+                        "select abalance from pgbench_accounts where aid = %s",
+                        (rng.randint(1, max_aid),),
+                    )
+                    for _ in range(n_lookups)
+                ]
+
+            start = time.perf_counter()
+            for sql, params in queries:
+                start_ns = time.perf_counter_ns()
+                cur.execute(sql, params)
+                cur.fetchall()
+                elapsed_ns = time.perf_counter_ns() - start_ns
+                if first_query is None:
+                    first_query = elapsed_ns / 1e9
+                reads.add(elapsed_ns)
+            total_elapsed = time.perf_counter() - start
+
+    downloads = (
+        PrometheusHistogram.from_metrics(
+            pageserver_http.get_metrics(), "pageserver_remote_operation_seconds", LAYER_DOWNLOADS
+        )
+        - downloads_before
+    )
+    redownloaded = resident_bytes(pageserver_http) - resident_started
+
+    zenbenchmark.record(
+        "evicted", (resident_before - resident_evicted) / MB, "MB", MetricReport.TEST_PARAM
+    )
+    zenbenchmark.record("queries", len(queries), "", MetricReport.TEST_PARAM)
+    zenbenchmark.record(
+        "endpoint_start_layers_downloaded",
+        start_downloads.count,
+        "",
+        MetricReport.LOWER_IS_BETTER,
+    )
+    zenbenchmark.record(
+        "endpoint_start_bytes_downloaded",
+        (resident_started - resident_evicted) / MB,
+        "MB",
+        MetricReport.LOWER_IS_BETTER,
+    )
+    assert first_query is not None
+    zenbenchmark.record("first_query", first_query, "s", MetricReport.LOWER_IS_BETTER)
+    zenbenchmark.record("total_read_time", total_elapsed, "s", MetricReport.LOWER_IS_BETTER)
+    zenbenchmark.record_histogram("read", reads, "ms", divisor=1e6)
+    zenbenchmark.record("redownloaded", redownloaded / MB, "MB", MetricReport.LOWER_IS_BETTER)
+    zenbenchmark.record(
+        "redownload_throughput",
+        redownloaded / MB / total_elapsed,
+        "MB/s",
+        MetricReport.HIGHER_IS_BETTER,
+    )
+    # On-demand downloads, as seen by the pageserver
+    zenbenchmark.record_prometheus_histogram("layer_download", downloads)
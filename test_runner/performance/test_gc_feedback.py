@@ -2,6 +2,8 @@ import pytest
 from fixtures.benchmark_fixture import MetricReport, NeonBenchmarker
 from fixtures.log_helper import log
 from fixtures.neon_fixtures import NeonEnvBuilder
+from fixtures.pageserver.layer_accounting import LayerAccounting
+from fixtures.types import TimelineId
 
 
 @pytest.mark.timeout(10000)
@@ -32,7 +34,8 @@ def test_gc_feedback(neon_env_builder: NeonEnvBuilder, zenbenchmark: NeonBenchma
         }
     )
     endpoint = env.endpoints.create_start("main", tenant_id=tenant_id)
-    timeline_id = endpoint.safe_psql("show neon.timeline_id")[0][0]
+    timeline_id = TimelineId(endpoint.safe_psql("show neon.timeline_id")[0][0])
+    accounting = LayerAccounting(client, tenant_id, timeline_id)
     n_steps = 10
     n_update_iters = 100
     step_size = 10000
@@ -56,14 +59,14 @@ def test_gc_feedback(neon_env_builder: NeonEnvBuilder, zenbenchmark: NeonBenchma
             logical_size = client.timeline_detail(tenant_id, timeline_id)["current_logical_size"]
             log.info(f"Logical storage size  {logical_size}")
 
-            client.timeline_checkpoint(tenant_id, timeline_id)
+            accounting.checkpoint()
 
             # Do compaction and GC
-            client.timeline_gc(tenant_id, timeline_id, 0)
-            client.timeline_compact(tenant_id, timeline_id)
+            accounting.gc(0)
+            accounting.compact()
             # One more iteration to check that no excessive image layers are generated
-            client.timeline_gc(tenant_id, timeline_id, 0)
-            client.timeline_compact(tenant_id, timeline_id)
+            accounting.gc(0)
+            accounting.compact()
 
             physical_size = client.timeline_detail(tenant_id, timeline_id)["current_physical_size"]
             log.info(f"Physical storage size {physical_size}")
@@ -74,3 +77,6 @@ def test_gc_feedback(neon_env_builder: NeonEnvBuilder, zenbenchmark: NeonBenchma
     zenbenchmark.record(
         "physical/logical ratio", physical_size / logical_size, "", MetricReport.LOWER_IS_BETTER
     )
+    # Per-phase timeline of layers created and deleted, and bytes written, by
+    # checkpoint, GC and compaction
+    accounting.record(zenbenchmark, "layer_accounting")
@@ -1,10 +1,41 @@
+import time
 from contextlib import closing
 
 import pytest
-from fixtures.compare_fixtures import PgCompare
+from fixtures.benchmark_fixture import LatencyHistogram, MetricReport
+from fixtures.compare_fixtures import NeonCompare, PgCompare
+from fixtures.metrics import Metrics, PrometheusHistogram
+from fixtures.neon_fixtures import wait_for_last_flush_lsn
+from fixtures.types import Lsn
+from psycopg2.extensions import cursor
 from pytest_lazyfixture import lazy_fixture
 
 
+def hot_updates(cur: cursor, table: str, n_updates: int, commit_every: int = 1):
+    """
+    Run `UPDATE {table} SET i = i + 1` `n_updates` times in a server-side loop, committing
+    every `commit_every` updates, so that the update rate isn't bound by client round-trips.
+    Every update of a row writes a WAL record for the page the row is on.
+
+    The cursor's connection must be in autocommit mode, COMMIT isn't allowed in a DO block
+    that runs inside a transaction block.
+    """
+    cur.execute(
+        f"""
+        DO $$
+        BEGIN
+            FOR n IN 1..{n_updates} LOOP
+                UPDATE {table} SET i = i + 1;
+                IF n % {commit_every} = 0 THEN
+                    COMMIT;
+                END IF;
+            END LOOP;
+        END
+        $$;
+        """
+    )
+
+
 @pytest.mark.parametrize(
     "env",
     [
@@ -18,7 +49,8 @@ def test_hot_page(env: PgCompare):
     # Update the same page many times, then measure read performance
     num_writes = 1000000
 
-    with closing(env.pg.connect()) as conn:
+    # All the updates run in one statement, which takes longer than the default timeout
+    with closing(env.pg.connect(options="-cstatement_timeout=0")) as conn:
         with conn.cursor() as cur:
             cur.execute("drop table if exists t, f;")
 
@@ -26,8 +58,9 @@ def test_hot_page(env: PgCompare):
             with env.record_duration("write"):
                 cur.execute("create table t (i integer);")
                 cur.execute("insert into t values (0);")
-                for i in range(num_writes):
-                    cur.execute(f"update t set i = {i};")
+                # One commit per update, as with the earlier client-side loop, so that the
+                # WAL written stays comparable with earlier runs
+                hot_updates(cur, "t", num_writes, commit_every=1)
 
             # Write 3-4 MB to evict t from compute cache
             cur.execute("create table f (i integer);")
@@ -37,3 +70,118 @@ def test_hot_page(env: PgCompare):
             with env.record_duration("read"):
                 cur.execute("select * from t;")
                 cur.fetchall()
+
+
+#
+# Measure getpage latency as a function of the number of WAL records that have
+# to be replayed to reconstruct a page.
+#
+# For each depth, this creates a table with one row per page, updates every row
+# `depth` times, flushes the WAL to delta layers and then reads each page once
+# from the pageserver. Compaction and GC are disabled, so that no image layers
+# cut the delta chains short. The metrics of all depths together form a curve:
+# `depth_{depth}.reconstruct_*` comes from the pageserver's reconstruct-time
+# histogram, `depth_{depth}.getpage_*` from its smgr request histogram, and
+# `depth_{depth}.read_*` is measured by the client.
+#
+@pytest.mark.timeout(1800)
+def test_hot_page_reconstruct_curve(neon_compare: NeonCompare):
+    pages = 32
+    depths = [1, 10, 100, 1000, 4000]
+
+    env = neon_compare.env
+    zenbenchmark = neon_compare.zenbenchmark
+    pageserver_http = env.pageserver.http_client()
+
+    tenant_id, timeline_id = env.neon_cli.create_tenant(
+        conf={
+            # Disable background GC and compaction, so that the delta chains stay intact
+            "gc_period": "0s",
+            "compaction_period": "0s",
+        }
+    )
+    endpoint = env.endpoints.create_start("main", tenant_id=tenant_id)
+    getpage_filter = {
+        "smgr_query_type": "get_page_at_lsn",
+        "tenant_id": str(tenant_id),
+        "timeline_id": str(timeline_id),
+    }
+
+    def histograms(metrics: Metrics):
+        return (
+            PrometheusHistogram.from_metrics(
+                metrics, "pageserver_getpage_reconstruct_seconds", {"result": "ok"}
+            ),
+            PrometheusHistogram.from_metrics(
+                metrics, "pageserver_smgr_query_seconds", getpage_filter
+            ),
+            PrometheusHistogram.from_metrics(metrics, "pageserver_read_num_fs_layers"),
+        )
+
+    with closing(endpoint.connect()) as conn, conn.cursor() as cur:
+        cur.execute("CREATE EXTENSION neon_test_utils")
+
+        for depth in depths:
+            table = f"hot_{depth}"
+            # With fillfactor=10, a ~450 byte row takes up more than half of the space
+            # that inserts may use, so each row gets a page of its own. Updates are HOT
+            # and stay on the same page.
+            cur.execute(
+                f"CREATE TABLE {table} (id int, i int, pad text) WITH (fillfactor = 10, autovacuum_enabled = false)"
+            )
+            cur.execute(
+                f"INSERT INTO {table} SELECT g, 0, repeat('x', 420) FROM generate_series(1, {pages}) g"
+            )
+            cur.execute(f"SELECT count(DISTINCT (ctid::text::point)[0]) FROM {table}")
+            row = cur.fetchone()
+            assert row is not None and row[0] == pages, "expected one row per page"
+
+            cur.execute("SELECT pg_current_wal_insert_lsn()")
+            row = cur.fetchone()
+            assert row is not None
+            start_lsn = Lsn(row[0])
+            start = time.perf_counter()
+            # Keep the number of row versions between commits small enough to fit on the page
+            hot_updates(cur, table, depth, commit_every=min(depth, 8))
+            write_elapsed = time.perf_counter() - start
+            cur.execute("SELECT pg_current_wal_insert_lsn()")
+            row = cur.fetchone()
+            assert row is not None
+            wal_bytes = Lsn(row[0]) - start_lsn
+
+            wait_for_last_flush_lsn(env, endpoint, tenant_id, timeline_id)
+            pageserver_http.timeline_checkpoint(tenant_id, timeline_id)
+
+            cur.execute("SELECT clear_buffer_cache()")
+            before = histograms(pageserver_http.get_metrics())
+            reads = LatencyHistogram()
+            for blkno in range(pages):
+                start_ns = time.perf_counter_ns()
+                cur.execute(
+                    f"SELECT i FROM {table} WHERE ctid >= '({blkno},0)' AND ctid < '({blkno + 1},0)'"
+                )
+                row = cur.fetchone()
+                reads.add(time.perf_counter_ns() - start_ns)
+                assert row is not None and row[0] == depth
+            after = histograms(pageserver_http.get_metrics())
+            reconstruct, getpage, layers = (a - b for a, b in zip(after, before))
+
+            prefix = f"depth_{depth}"
+            zenbenchmark.record(f"{prefix}.updates_per_page", depth, "", MetricReport.TEST_PARAM)
+            zenbenchmark.record(
+                f"{prefix}.wal_bytes_per_page", wal_bytes / pages, "B", MetricReport.TEST_PARAM
+            )
+            zenbenchmark.record(
+                f"{prefix}.updates_per_second",
+                depth * pages / write_elapsed,
+                "",
+                MetricReport.HIGHER_IS_BETTER,
+            )
+            zenbenchmark.record_prometheus_histogram(f"{prefix}.reconstruct", reconstruct)
+            zenbenchmark.record_prometheus_histogram(f"{prefix}.getpage", getpage)
+            zenbenchmark.record(
+                f"{prefix}.layers_visited_avg", layers.mean(), "", MetricReport.LOWER_IS_BETTER
+            )
+            zenbenchmark.record_histogram(f"{prefix}.read", reads, "ms", divisor=1e6)
+
+            cur.execute(f"DROP TABLE {table}")
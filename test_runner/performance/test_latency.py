@@ -3,6 +3,7 @@ import threading
 import pytest
 from fixtures.compare_fixtures import PgCompare
 from fixtures.neon_fixtures import PgProtocol
+from fixtures.read_probe import index_range, point_lookup, seqscan
 
 from performance.test_perf_pgbench import get_scales_matrix
 from performance.test_wal_backpressure import record_read_latency
@@ -21,10 +22,24 @@ def test_measure_read_latency_heavy_write_workload(neon_with_baseline: PgCompare
     env = neon_with_baseline
     pg = env.pg
 
+    rows = scale * 100_000
     with pg.connect().cursor() as cur:
-        cur.execute(f"create table small as select generate_series(1,{scale*100_000})")
+        cur.execute(f"create table small as select generate_series(1,{rows})")
+        cur.execute("create index on small (generate_series)")
 
     write_thread = threading.Thread(target=start_write_workload, args=(pg, scale * 100))
     write_thread.start()
 
-    record_read_latency(env, lambda: write_thread.is_alive(), "SELECT count(*) from small")
+    # Several readers with different access patterns. On Neon, the latencies are
+    # also broken down by how far behind the pageserver is when the read starts.
+    record_read_latency(
+        env,
+        lambda: write_thread.is_alive(),
+        [
+            seqscan("small"),
+            point_lookup("small", "generate_series", rows),
+            index_range("small", "generate_series", rows),
+        ],
+        read_interval=0.1,
+        readers=4,
+    )
@@ -1,6 +1,7 @@
 import time
 
 from fixtures.neon_fixtures import NeonEnvBuilder
+from fixtures.pageserver.layer_coverage import analyze_layer_map
 
 
 #
@@ -24,7 +25,7 @@ def test_layer_map(neon_env_builder: NeonEnvBuilder, zenbenchmark):
         }
     )
 
-    env.neon_cli.create_timeline("test_layer_map", tenant_id=tenant)
+    timeline = env.neon_cli.create_timeline("test_layer_map", tenant_id=tenant)
     endpoint = env.endpoints.create_start("test_layer_map", tenant_id=tenant)
     cur = endpoint.connect().cursor()
     cur.execute("create table t(x integer)")
@@ -36,3 +37,8 @@ def test_layer_map(neon_env_builder: NeonEnvBuilder, zenbenchmark):
     with zenbenchmark.record_duration("test_query"):
         cur.execute("SELECT count(*) from t")
         assert cur.fetchone() == (n_iters * n_records,)
+
+    # Explain the query time by how many layers reads have to visit
+    analyze_layer_map(env.pageserver.http_client(), tenant, timeline).record(
+        zenbenchmark, "layer_map"
+    )
@@ -0,0 +1,149 @@
+import time
+
+import pytest
+from fixtures.availability_probe import AvailabilityProbe
+from fixtures.benchmark_fixture import MetricReport, NeonBenchmarker
+from fixtures.log_helper import log
+from fixtures.neon_fixtures import NeonEnvBuilder, PgBin, wait_for_last_flush_lsn
+from fixtures.pageserver.http import PageserverHttpClient
+from fixtures.pageserver.utils import wait_for_upload_queue_empty
+from fixtures.remote_storage import RemoteStorageKind
+from fixtures.types import Lsn, TenantId, TenantShardId, TimelineId
+
+# How long the probe runs before and after the migration
+SETTLE_SECONDS = 5
+
+
+def wait_for_catchup(
+    http: PageserverHttpClient,
+    tenant_id: TenantId,
+    timeline_id: TimelineId,
+    lsn: Lsn,
+    timeout: float = 120,
+) -> float:
+    """Poll until the timeline's last_record_lsn reaches `lsn`, and return how long it took."""
+    start = time.perf_counter()
+    while True:
+        last_record_lsn = Lsn(http.timeline_detail(tenant_id, timeline_id)["last_record_lsn"])
+        if last_record_lsn >= lsn:
+            return time.perf_counter() - start
+        assert (
+            time.perf_counter() - start < timeout
+        ), f"stuck at {last_record_lsn}, waiting for {lsn}"
+        time.sleep(0.02)
+
+
+#
+# Measure the client-visible downtime of moving a tenant to another pageserver,
+# while a probe keeps writing and reading through the endpoint:
+#
+# - attachment_service: `tenant_shard_migrate`, which does the whole live
+#   migration and notifies the compute; `neon_local tenant migrate` goes
+#   through the same API
+# - live_migration: the sequence of location configurations of
+#   test_live_migration, through a warm secondary location
+# - cold_attach: like live_migration, but without a secondary location, so
+#   the destination starts with no layers on local disk
+#
+@pytest.mark.timeout(900)
+@pytest.mark.parametrize("method", ["attachment_service", "live_migration", "cold_attach"])
+def test_live_migration_downtime(
+    neon_env_builder: NeonEnvBuilder, pg_bin: PgBin, zenbenchmark: NeonBenchmarker, method: str
+):
+    neon_env_builder.num_pageservers = 2
+    neon_env_builder.enable_pageserver_remote_storage(RemoteStorageKind.MOCK_S3)
+    env = neon_env_builder.init_start(
+        initial_tenant_conf={
+            "gc_period": "0s",
+            "compaction_period": "0s",
+            "heatmap_period": "0s",
+        }
+    )
+    tenant_id = env.initial_tenant
+    timeline_id = env.initial_timeline
+    attachment = env.attachment_service.inspect(tenant_id)
+    assert attachment is not None
+    origin_generation, origin_id = attachment
+    origin = env.get_pageserver(origin_id)
+    dest = next(ps for ps in env.pageservers if ps.id != origin.id)
+    origin_http = origin.http_client()
+    dest_http = dest.http_client()
+
+    endpoint = env.endpoints.create_start("main", tenant_id=tenant_id)
+    pg_bin.run(["pgbench", "-i", "-s10", endpoint.connstr()])
+    probe = AvailabilityProbe(endpoint)
+    probe.setup()
+    wait_for_last_flush_lsn(env, endpoint, tenant_id, timeline_id, pageserver_id=origin.id)
+    origin_http.timeline_checkpoint(tenant_id, timeline_id)
+    wait_for_upload_queue_empty(origin_http, tenant_id, timeline_id)
+
+    if method == "live_migration":
+        with zenbenchmark.record_duration("secondary_warmup"):
+            dest.tenant_location_configure(
+                tenant_id,
+                {"mode": "Secondary", "secondary_conf": {"warm": True}, "tenant_conf": {}},
+            )
+            origin_http.tenant_heatmap_upload(tenant_id)
+            dest_http.tenant_secondary_download(tenant_id)
+
+    probe.start()
+    try:
+        time.sleep(SETTLE_SECONDS)
+        probe.mark("during")
+        start = time.perf_counter()
+        if method == "attachment_service":
+            env.attachment_service.tenant_shard_migrate(TenantShardId(tenant_id, 0, 0), dest.id)
+        else:
+            origin.tenant_location_configure(
+                tenant_id,
+                {
+                    "mode": "AttachedStale",
+                    "secondary_conf": None,
+                    "tenant_conf": {},
+                    "generation": origin_generation,
+                },
+                flush_ms=5000,
+            )
+            generation = env.attachment_service.attach_hook_issue(tenant_id, dest.id)
+            dest.tenant_location_configure(
+                tenant_id,
+                {
+                    "mode": "AttachedMulti",
+                    "secondary_conf": None,
+                    "tenant_conf": {},
+                    "generation": generation,
+                },
+            )
+            endpoint.reconfigure(pageserver_id=dest.id)
+            origin.tenant_location_configure(
+                tenant_id,
+                {
+                    "mode": "Secondary" if method == "live_migration" else "Detached",
+                    "secondary_conf": {"warm": True} if method == "live_migration" else None,
+                    "tenant_conf": {},
+                },
+            )
+            dest.tenant_location_configure(
+                tenant_id,
+                {
+                    "mode": "AttachedSingle",
+                    "secondary_conf": None,
+                    "tenant_conf": {},
+                    "generation": generation,
+                },
+            )
+        migration = time.perf_counter() - start
+        probe.mark("after")
+
+        # How long until the destination has ingested all the WAL that the
+        # compute had written when the migration finished
+        flush_lsn = Lsn(endpoint.safe_psql("SELECT pg_current_wal_flush_lsn()")[0][0])
+        catchup = wait_for_catchup(dest_http, tenant_id, timeline_id, flush_lsn)
+        time.sleep(SETTLE_SECONDS)
+    finally:
+        probe.stop()
+
+    log.info(f"migration took {migration:.3f}s, catch-up {catchup:.3f}s")
+    zenbenchmark.record("migration", migration, "s", MetricReport.LOWER_IS_BETTER)
+    zenbenchmark.record("catchup", catchup, "s", MetricReport.LOWER_IS_BETTER)
+    probe.record(zenbenchmark, "probe")
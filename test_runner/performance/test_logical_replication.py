@@ -1,12 +1,142 @@
+import csv
+import threading
 import time
+import timeit
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
 
 import pytest
+from fixtures.benchmark_fixture import MetricReport, NeonBenchmarker, PgBenchRunResult
 from fixtures.log_helper import log
-from fixtures.neon_fixtures import NeonEnv, PgBin, logical_replication_sync
+from fixtures.neon_fixtures import (
+    Endpoint,
+    NeonEnv,
+    PgBin,
+    VanillaPostgres,
+    logical_replication_sync,
+)
+from fixtures.types import Lsn
+
+from performance.test_perf_pgbench import utc_now_timestamp
+
+MB = 1024 * 1024
+
+
+@dataclass
+class ReplicationSample:
+    # seconds since the sampler was started
+    elapsed: float
+    publisher_lsn: Lsn
+    # None until the subscription has reported its position
+    subscriber_lsn: Optional[Lsn]
+
+    @property
+    def lag(self) -> Optional[int]:
+        if self.subscriber_lsn is None:
+            return None
+        return max(0, self.publisher_lsn - self.subscriber_lsn)
+
+
+class ReplicationLagSampler:
+    """
+    Sample the publisher's flush LSN and the subscriber's `latest_end_lsn` every
+    `interval` seconds in a background thread, over connections that are opened
+    once.
+    """
+
+    def __init__(self, subscriber: VanillaPostgres, publisher: Endpoint, interval: float = 0.2):
+        self.subscriber = subscriber
+        self.publisher = publisher
+        self.interval = interval
+        self.samples: List[ReplicationSample] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        start = time.monotonic()
+        with closing(self.publisher.connect()) as pub_conn, closing(
+            self.subscriber.connect()
+        ) as sub_conn:
+            pub_cur = pub_conn.cursor()
+            sub_cur = sub_conn.cursor()
+            while not self._stop.is_set():
+                pub_cur.execute("SELECT pg_current_wal_flush_lsn()")
+                pub_row = pub_cur.fetchone()
+                assert pub_row is not None
+                sub_cur.execute(
+                    "SELECT (SELECT latest_end_lsn FROM pg_stat_subscription WHERE relid IS NULL LIMIT 1)"
+                )
+                sub_row = sub_cur.fetchone()
+                assert sub_row is not None
+                self.samples.append(
+                    ReplicationSample(
+                        elapsed=time.monotonic() - start,
+                        publisher_lsn=Lsn(pub_row[0]),
+                        subscriber_lsn=Lsn(sub_row[0]) if sub_row[0] is not None else None,
+                    )
+                )
+                self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def lag_seconds(self) -> List[float]:
+        """
+        For each sample, how long ago the publisher had flushed the WAL that the
+        subscriber has applied now, i.e. the replication lag in time.
+        """
+        lags = []
+        first = 0
+        for sample in self.samples:
+            if sample.subscriber_lsn is None:
+                continue
+            # publisher LSNs only grow, so the first sample that has reached the
+            # subscriber LSN only moves forward
+            while (
+                first < len(self.samples)
+                and self.samples[first].publisher_lsn < sample.subscriber_lsn
+            ):
+                first += 1
+            if first < len(self.samples):
+                lags.append(max(0.0, sample.elapsed - self.samples[first].elapsed))
+        return lags
+
+    def save_csv(self, path: Path):
+        with path.open("w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["elapsed", "publisher_lsn", "subscriber_lsn", "lag_bytes"])
+            for s in self.samples:
+                writer.writerow(
+                    [
+                        f"{s.elapsed:.3f}",
+                        s.publisher_lsn,
+                        s.subscriber_lsn or "",
+                        s.lag if s.lag is not None else "",
+                    ]
+                )
+
+    def record(self, zenbenchmark: NeonBenchmarker, prefix: str):
+        lags = [s.lag for s in self.samples if s.lag is not None]
+        zenbenchmark.record_distribution(
+            f"{prefix}.lag_bytes", [lag / MB for lag in lags], "MB", percentiles=(50, 90, 99)
+        )
+        zenbenchmark.record_distribution(f"{prefix}.lag_time", self.lag_seconds(), "s")
 
 
 @pytest.mark.timeout(1000)
-def test_logical_replication(neon_simple_env: NeonEnv, pg_bin: PgBin, vanilla_pg):
+def test_logical_replication(
+    neon_simple_env: NeonEnv,
+    pg_bin: PgBin,
+    vanilla_pg: VanillaPostgres,
+    zenbenchmark: NeonBenchmarker,
+    test_output_dir: Path,
+):
     env = neon_simple_env
 
     env.neon_cli.create_branch("test_logical_replication", "empty")
@@ -25,18 +155,63 @@ def test_logical_replication(neon_simple_env: NeonEnv, pg_bin: PgBin, vanilla_pg
     vanilla_pg.safe_psql("truncate table pgbench_history")
 
     connstr = endpoint.connstr().replace("'", "''")
-    print(f"connstr='{connstr}'")
-    vanilla_pg.safe_psql(f"create subscription sub1 connection '{connstr}' publication pub1")
+    log.info(f"connstr='{connstr}'")
+    with zenbenchmark.record_duration("initial_sync"):
+        vanilla_pg.safe_psql(f"create subscription sub1 connection '{connstr}' publication pub1")
+
+        # Wait logical replication channel to be established
+        logical_replication_sync(vanilla_pg, endpoint, timeout=300, min_interval=0.01)
+
+    sampler = ReplicationLagSampler(vanilla_pg, endpoint)
+    sampler.start()
+    try:
+        run_start_timestamp = utc_now_timestamp()
+        t0 = timeit.default_timer()
+        out = pg_bin.run_capture(["pgbench", "-c10", "-T100", "-Mprepared", endpoint.connstr()])
+        run_duration = timeit.default_timer() - t0
+        run_end_timestamp = utc_now_timestamp()
 
-    # Wait logical replication channel to be established
-    logical_replication_sync(vanilla_pg, endpoint)
+        # Wait logical replication to sync
+        start = timeit.default_timer()
+        end_lsn = logical_replication_sync(vanilla_pg, endpoint, timeout=300, min_interval=0.01)
+        catchup = timeit.default_timer() - start
+        log.info(f"Sync with master took {catchup} seconds")
+    finally:
+        sampler.stop()
 
-    pg_bin.run_capture(["pgbench", "-c10", "-T100", "-Mprepared", endpoint.connstr()])
+    res = PgBenchRunResult.parse_from_stdout(
+        stdout=Path(f"{out}.stdout").read_text(),
+        run_duration=run_duration,
+        run_start_timestamp=run_start_timestamp,
+        run_end_timestamp=run_end_timestamp,
+    )
+    zenbenchmark.record_pg_bench_result("publisher", res)
+    zenbenchmark.record("catchup_time", catchup, "s", MetricReport.LOWER_IS_BETTER)
 
-    # Wait logical replication to sync
-    start = time.time()
-    logical_replication_sync(vanilla_pg, endpoint)
-    log.info(f"Sync with master took {time.time() - start} seconds")
+    # Apply throughput over the pgbench run plus the catch-up
+    applied = [s for s in sampler.samples if s.subscriber_lsn is not None]
+    assert len(applied) >= 1, "no samples of the subscriber position"
+    first = applied[0]
+    assert first.subscriber_lsn is not None
+    elapsed = run_duration + catchup
+    zenbenchmark.record(
+        "apply_throughput",
+        (end_lsn - first.subscriber_lsn) / MB / elapsed,
+        "MB/s",
+        MetricReport.HIGHER_IS_BETTER,
+    )
+    # Every pgbench transaction inserts one row into pgbench_history, which starts out
+    # empty on the subscriber, so its rows are the transactions applied since pgbench
+    # started
+    applied_txns = vanilla_pg.safe_psql("select count(*) from pgbench_history")[0][0]
+    zenbenchmark.record(
+        "apply_tps",
+        applied_txns / elapsed,
+        "",
+        MetricReport.HIGHER_IS_BETTER,
+    )
+    sampler.record(zenbenchmark, "replication")
+    sampler.save_csv(test_output_dir / "logical_replication_lag.csv")
 
     sum_master = endpoint.safe_psql("select sum(abalance) from pgbench_accounts")[0][0]
     sum_replica = vanilla_pg.safe_psql("select sum(abalance) from pgbench_accounts")[0][0]
@@ -0,0 +1,157 @@
+import random
+import time
+from typing import Dict
+
+import pytest
+from fixtures.benchmark_fixture import LatencyHistogram, MetricReport, NeonBenchmarker
+from fixtures.log_helper import log
+from fixtures.metrics import PrometheusHistogram
+from fixtures.neon_fixtures import NeonEnvBuilder, wait_for_last_flush_lsn
+from fixtures.pageserver.http import PageserverHttpClient
+from fixtures.pageserver.utils import wait_for_upload_queue_empty
+from fixtures.remote_storage_proxy import StorageThrottle, ThrottledStorageProxy
+
+MB = 1024 * 1024
+
+LAYER_DOWNLOADS = {"file_kind": "layer", "op_kind": "download", "status": "success"}
+
+THROTTLES: Dict[str, StorageThrottle] = {
+    "unthrottled": StorageThrottle(),
+    # roughly S3 from within the same region
+    "s3_like": StorageThrottle(latency=0.03, bandwidth=100 * MB),
+    "slow": StorageThrottle(latency=0.1, bandwidth=20 * MB),
+    "flaky": StorageThrottle(latency=0.03, bandwidth=100 * MB, error_rate=0.05),
+}
+
+
+def layer_downloads(pageserver_http: PageserverHttpClient) -> PrometheusHistogram:
+    return PrometheusHistogram.from_metrics(
+        pageserver_http.get_metrics(), "pageserver_remote_operation_seconds", LAYER_DOWNLOADS
+    )
+
+
+#
+# Measure the cost of cold reads: load a table, evict all layers, and read the
+# table back through a remote storage that behaves more like S3 than the local
+# mock does, so that every layer that is needed has to be downloaded on demand.
+#
+@pytest.mark.timeout(1200)
+@pytest.mark.parametrize("workload", ["seqscan", "point_lookup"])
+@pytest.mark.parametrize("throttle", list(THROTTLES.keys()))
+def test_ondemand_download(
+    neon_env_builder: NeonEnvBuilder,
+    remote_storage_proxy: ThrottledStorageProxy,
+    zenbenchmark: NeonBenchmarker,
+    throttle: str,
+    workload: str,
+):
+    num_rows = 2000000
+    n_lookups = 200
+
+    remote_storage_proxy.attach(neon_env_builder)
+    env = neon_env_builder.init_start(
+        initial_tenant_conf={
+            "gc_period": "0s",
+            "compaction_period": "0s",
+            # small layers, so that point lookups only need a few of them
+            "checkpoint_distance": f"{10 * MB}",
+            "compaction_target_size": f"{10 * MB}",
+        }
+    )
+    tenant_id = env.initial_tenant
+    timeline_id = env.initial_timeline
+    pageserver_http = env.pageserver.http_client()
+    env.pageserver.allowed_errors.append(".*SlowDown.*")
+    env.pageserver.allowed_errors.append(".*failed to download.*")
+
+    endpoint = env.endpoints.create_start("main")
+    with endpoint.cursor() as cur:
+        cur.execute("SET statement_timeout='300s'")
+        cur.execute(
+            f"CREATE TABLE tbl AS SELECT g AS id, 'long string to consume some space' || g AS t "
+            f"FROM generate_series(1, {num_rows}) g"
+        )
+        cur.execute("CREATE INDEX ON tbl (id)")
+    wait_for_last_flush_lsn(env, endpoint, tenant_id, timeline_id)
+    endpoint.stop()
+
+    pageserver_http.timeline_checkpoint(tenant_id, timeline_id)
+    wait_for_upload_queue_empty(pageserver_http, tenant_id, timeline_id)
+    evicted = pageserver_http.evict_all_layers(tenant_id, timeline_id)
+    log.info(f"evicted {evicted.layers} layers, {evicted.bytes} bytes")
+
+    remote_storage_proxy.throttle = THROTTLES[throttle]
+    remote_storage_proxy.reset_stats()
+    downloads_before = layer_downloads(pageserver_http)
+
+    # Compute startup needs a basebackup, which is the first cold read
+    with zenbenchmark.record_duration("endpoint_start"):
+        endpoint.start()
+
+    # The queries are measured from here on, without the basebackup's downloads
+    start_downloads = layer_downloads(pageserver_http) - downloads_before
+    start_stats = remote_storage_proxy.reset_stats()
+    downloads_before = layer_downloads(pageserver_http)
+
+    rng = random.Random(0)
+    if workload == "seqscan":
+        queries = ["SELECT count(*), max(t) FROM tbl"]
+    else:
+        queries = [
+            f"SELECT t FROM tbl WHERE id = {rng.randint(1, num_rows)}" for _ in range(n_lookups)
+        ]
+
+    reads = LatencyHistogram()
+    first_query = 0.0
+    first_query_downloads = 0.0
+    with endpoint.cursor() as cur:
+        cur.execute("SET statement_timeout='600s'")
+        start = time.perf_counter()
+        for i, sql in enumerate(queries):
+            start_ns = time.perf_counter_ns()
+            cur.execute(sql)
+            cur.fetchall()
+            elapsed_ns = time.perf_counter_ns() - start_ns
+            reads.add(elapsed_ns)
+            if i == 0:
+                first_query = elapsed_ns / 1e9
+                first_query_downloads = (layer_downloads(pageserver_http) - downloads_before).count
+        total_elapsed = time.perf_counter() - start
+
+    downloads = layer_downloads(pageserver_http) - downloads_before
+    stats = remote_storage_proxy.reset_stats()
+
+    zenbenchmark.record("table_size", evicted.bytes / MB, "MB", MetricReport.TEST_PARAM)
+    zenbenchmark.record("queries", len(queries), "", MetricReport.TEST_PARAM)
+    zenbenchmark.record(
+        "endpoint_start_layers_downloaded",
+        start_downloads.count,
+        "",
+        MetricReport.LOWER_IS_BETTER,
+    )
+    zenbenchmark.record(
+        "endpoint_start_bytes_downloaded",
+        start_stats.bytes_sent / MB,
+        "MB",
+        MetricReport.LOWER_IS_BETTER,
+    )
+    zenbenchmark.record("first_query", first_query, "s", MetricReport.LOWER_IS_BETTER)
+    zenbenchmark.record(
+        "first_query_layers_downloaded", first_query_downloads, "", MetricReport.LOWER_IS_BETTER
+    )
+    zenbenchmark.record("total_read_time", total_elapsed, "s", MetricReport.LOWER_IS_BETTER)
+    zenbenchmark.record_histogram("read", reads, "ms", divisor=1e6)
+    zenbenchmark.record(
+        "layers_downloaded_per_query",
+        downloads.count / len(queries),
+        "",
+        MetricReport.LOWER_IS_BETTER,
+    )
+    zenbenchmark.record(
+        "download_throughput",
+        stats.bytes_sent / MB / total_elapsed,
+        "MB/s",
+        MetricReport.HIGHER_IS_BETTER,
+    )
+    zenbenchmark.record_prometheus_histogram("layer_download", downloads)
+    stats.record(zenbenchmark, "remote_storage")
@@ -0,0 +1,123 @@
+import time
+from typing import List
+
+import psutil
+import pytest
+from fixtures.benchmark_fixture import LatencyHistogram, MetricReport, NeonBenchmarker
+from fixtures.log_helper import log
+from fixtures.neon_fixtures import NeonEnvBuilder, NeonPageserver, wait_for_last_flush_lsn
+from fixtures.pageserver.many_tenants import attach_many_tenants, wait_until_all_active
+from fixtures.pageserver.utils import wait_for_upload_queue_empty
+from fixtures.remote_storage import LocalFsStorage, RemoteStorageKind
+from fixtures.types import TenantId
+
+MB = 1024 * 1024
+
+# Total number of tenants at each step of the benchmark
+TENANT_STEPS = [1000, 2500, 5000, 10000]
+
+# How long the pageserver is left alone to measure its background CPU usage
+IDLE_SECONDS = 30
+
+# How many times /metrics is scraped at each step
+SCRAPES = 5
+
+
+def pageserver_process(pageserver: NeonPageserver) -> psutil.Process:
+    pid = int((pageserver.workdir / "pageserver.pid").read_text().strip())
+    return psutil.Process(pid)
+
+
+def record_footprint(zenbenchmark: NeonBenchmarker, pageserver: NeonPageserver, prefix: str):
+    """Record the RSS and open file descriptors of the pageserver process."""
+    proc = pageserver_process(pageserver)
+    zenbenchmark.record(
+        f"{prefix}.rss", proc.memory_info().rss / MB, "MB", MetricReport.LOWER_IS_BETTER
+    )
+    zenbenchmark.record(f"{prefix}.open_files", proc.num_fds(), "", MetricReport.LOWER_IS_BETTER)
+
+
+#
+# Measure how the pageserver's footprint grows with the number of tenants it
+# holds: attach tenants in steps of up to 10k, and at each step record the
+# memory and file descriptors used, the CPU used by background tasks while
+# nothing else happens, the size and latency of a /metrics scrape, and how
+# long a restart takes until all tenants are active again.
+#
+# The tenants are duplicates of one small template tenant, see
+# `fixtures.pageserver.many_tenants`, so there is no compute or initdb per
+# tenant.
+#
+@pytest.mark.timeout(14400)
+def test_pageserver_density(neon_env_builder: NeonEnvBuilder, zenbenchmark: NeonBenchmarker):
+    neon_env_builder.enable_pageserver_remote_storage(RemoteStorageKind.LOCAL_FS)
+    env = neon_env_builder.init_start(
+        initial_tenant_conf={"gc_period": "0s", "compaction_period": "0s"}
+    )
+    remote_storage = env.pageserver_remote_storage
+    assert isinstance(remote_storage, LocalFsStorage)
+    pageserver = env.pageserver
+    pageserver_http = pageserver.http_client()
+    template = env.initial_tenant
+    timeline_id = env.initial_timeline
+
+    with env.endpoints.create_start("main", tenant_id=template) as endpoint:
+        endpoint.safe_psql_many(
+            [
+                "CREATE TABLE t (id int PRIMARY KEY, payload text)",
+                "INSERT INTO t SELECT g, 'payload ' || g FROM generate_series(1, 10000) g",
+            ]
+        )
+        wait_for_last_flush_lsn(env, endpoint, template, timeline_id)
+    pageserver_http.timeline_checkpoint(template, timeline_id)
+    wait_for_upload_queue_empty(pageserver_http, template, timeline_id)
+
+    tenants: List[TenantId] = [template]
+    for n_tenants in TENANT_STEPS:
+        prefix = f"tenants_{n_tenants}"
+        new_tenants = n_tenants - len(tenants)
+        start = time.perf_counter()
+        tenants += attach_many_tenants(pageserver, remote_storage, template, new_tenants)
+        wait_until_all_active(pageserver)
+        attach = time.perf_counter() - start
+        log.info(f"attached {new_tenants} tenants in {attach:.3f}s")
+        zenbenchmark.record(
+            f"{prefix}.attach_rate",
+            new_tenants / attach,
+            "tenants/s",
+            MetricReport.HIGHER_IS_BETTER,
+        )
+        record_footprint(zenbenchmark, pageserver, prefix)
+
+        proc = pageserver_process(pageserver)
+        cpu_before = proc.cpu_times()
+        time.sleep(IDLE_SECONDS)
+        cpu_after = proc.cpu_times()
+        cpu = (cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system)
+        zenbenchmark.record(
+            f"{prefix}.background_cpu",
+            cpu / IDLE_SECONDS * 100,
+            "%",
+            MetricReport.LOWER_IS_BETTER,
+        )
+
+        scrapes = LatencyHistogram()
+        size = 0
+        for _ in range(SCRAPES):
+            start_ns = time.perf_counter_ns()
+            size = len(pageserver_http.get_metrics_str().encode())
+            scrapes.add(time.perf_counter_ns() - start_ns)
+        zenbenchmark.record(
+            f"{prefix}.metrics_size", size / 1024, "KB", MetricReport.LOWER_IS_BETTER
+        )
+        zenbenchmark.record_histogram(f"{prefix}.metrics_scrape", scrapes, "ms", divisor=1e6)
+
+        pageserver.stop()
+        start = time.perf_counter()
+        pageserver.start()
+        startup = time.perf_counter() - start
+        ready = wait_until_all_active(pageserver)
+        log.info(f"restart with {n_tenants} tenants: startup {startup:.3f}s, ready {ready:.3f}s")
+        zenbenchmark.record(f"{prefix}.startup", startup, "s", MetricReport.LOWER_IS_BETTER)
+        zenbenchmark.record(f"{prefix}.quiesce_tenants", ready, "s", MetricReport.LOWER_IS_BETTER)
+        record_footprint(zenbenchmark, pageserver, f"{prefix}.after_restart")
@@ -1,33 +1,47 @@
 import asyncio
-from io import BytesIO
+import time
+from typing import List
 
+from fixtures.bulk_copy import CopyColumn, CopyDataSource
 from fixtures.compare_fixtures import PgCompare
 from fixtures.neon_fixtures import PgProtocol
 
-
-async def repeat_bytes(buf, repetitions: int):
-    for _ in range(repetitions):
-        yield buf
-
-
-async def copy_test_data_to_table(pg: PgProtocol, worker_id: int, table_name: str):
-    buf = BytesIO()
-    for i in range(1000):
-        buf.write(
-            f"{i}\tLoaded by worker {worker_id}. Long string to consume some space.\n".encode()
+ROWS_PER_WORKER = 5000000
+
+
+def worker_data(n_parallel: int) -> List[CopyDataSource]:
+    # The same 1000 rows, repeated, rendered once per worker before the load starts
+    return [
+        CopyDataSource(
+            ROWS_PER_WORKER,
+            columns=[
+                CopyColumn("i", "int4"),
+                CopyColumn(
+                    "t",
+                    "text",
+                    fill=f"Loaded by worker {worker_id}. Long string to consume some space.",
+                ),
+            ],
+            block_rows=1000,
         )
-    buf.seek(0)
+        for worker_id in range(n_parallel)
+    ]
 
-    copy_input = repeat_bytes(buf.read(), 5000)
 
+async def copy_test_data_to_table(source: CopyDataSource, pg: PgProtocol, table_name: str):
     pg_conn = await pg.connect_async()
-    await pg_conn.copy_to_table(table_name, source=copy_input)
+    await pg_conn.copy_to_table(
+        table_name,
+        source=source.async_chunks(),
+        columns=[c.name for c in source.columns],
+        format=source.format.value,
+    )
 
 
-async def parallel_load_different_tables(pg: PgProtocol, n_parallel: int):
+async def parallel_load_different_tables(pg: PgProtocol, sources: List[CopyDataSource]):
     workers = []
-    for worker_id in range(n_parallel):
-        worker = copy_test_data_to_table(pg, worker_id, f"copytest_{worker_id}")
+    for worker_id, source in enumerate(sources):
+        worker = copy_test_data_to_table(source, pg, f"copytest_{worker_id}")
         workers.append(asyncio.create_task(worker))
 
     # await all workers
@@ -43,19 +57,25 @@ def test_parallel_copy_different_tables(neon_with_baseline: PgCompare, n_paralle
     for worker_id in range(n_parallel):
         cur.execute(f"CREATE TABLE copytest_{worker_id} (i int, t text)")
 
+    sources = worker_data(n_parallel)
+    sources[0].record_client_throughput(env.zenbenchmark, "load")
     with env.record_pageserver_writes("pageserver_writes"):
         with env.record_duration("load"):
-            asyncio.run(parallel_load_different_tables(env.pg, n_parallel))
+            start = time.perf_counter()
+            asyncio.run(parallel_load_different_tables(env.pg, sources))
+            sources[0].record_throughput(
+                env.zenbenchmark, "load", time.perf_counter() - start, copies=n_parallel
+            )
             env.flush()
 
     env.report_peak_memory_use()
     env.report_size()
 
 
-async def parallel_load_same_table(pg: PgProtocol, n_parallel: int):
+async def parallel_load_same_table(pg: PgProtocol, sources: List[CopyDataSource]):
     workers = []
-    for worker_id in range(n_parallel):
-        worker = copy_test_data_to_table(pg, worker_id, "copytest")
+    for source in sources:
+        worker = copy_test_data_to_table(source, pg, "copytest")
         workers.append(asyncio.create_task(worker))
 
     # await all workers
@@ -70,9 +90,15 @@ def test_parallel_copy_same_table(neon_with_baseline: PgCompare, n_parallel=5):
 
     cur.execute("CREATE TABLE copytest (i int, t text)")
 
+    sources = worker_data(n_parallel)
+    sources[0].record_client_throughput(env.zenbenchmark, "load")
     with env.record_pageserver_writes("pageserver_writes"):
         with env.record_duration("load"):
-            asyncio.run(parallel_load_same_table(env.pg, n_parallel))
+            start = time.perf_counter()
+            asyncio.run(parallel_load_same_table(env.pg, sources))
+            sources[0].record_throughput(
+                env.zenbenchmark, "load", time.perf_counter() - start, copies=n_parallel
+            )
             env.flush()
 
     env.report_peak_memory_use()
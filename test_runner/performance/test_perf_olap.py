@@ -1,11 +1,33 @@
+import json
 import os
+import re
+import shutil
+from contextlib import closing
 from dataclasses import dataclass
-from typing import Dict, List, Tuple
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
 
 import pytest
+from _pytest.fixtures import FixtureRequest
 from _pytest.mark import ParameterSet
-from fixtures.compare_fixtures import RemoteCompare
+from fixtures.benchmark_fixture import MetricReport, NeonBenchmarker
+from fixtures.compare_fixtures import NeonCompare, PgCompare, RemoteCompare, VanillaCompare
 from fixtures.log_helper import log
+from fixtures.neon_fixtures import (
+    NeonEnvBuilder,
+    PgBin,
+    VanillaPostgres,
+    last_flush_lsn_upload,
+)
+from fixtures.olap_datagen import (
+    OlapDataset,
+    clickbench_dataset,
+    load_olap_dataset,
+    olap_dataset_fingerprint,
+    tpch_dataset,
+)
+from fixtures.pg_version import PgVersion
+from fixtures.remote_storage import RemoteStorageKind
 from fixtures.utils import get_self_dir
 
 
@@ -32,10 +54,10 @@ def test_clickbench_create_pg_stat_statements(remote_compare: RemoteCompare):
     query = LabelledQuery(
         "Q_CREATE_EXTENSION", r"CREATE EXTENSION IF NOT EXISTS pg_stat_statements;"
     )
-    run_psql(remote_compare, query, times=1, explain=False)
+    run_query(remote_compare, query, times=1, explain=False)
     log.info("Reset pg_stat_statements")
     query = LabelledQuery("Q_RESET", r"SELECT pg_stat_statements_reset();")
-    run_psql(remote_compare, query, times=1, explain=False)
+    run_query(remote_compare, query, times=1, explain=False)
 
 
 # A list of queries to run.
@@ -112,36 +134,144 @@ def get_scale() -> List[str]:
     return [scale]
 
 
-# run the query times times plus once with EXPLAIN VERBOSE if explain is requestd
-def run_psql(
-    env: RemoteCompare, labelled_query: LabelledQuery, times: int, explain: bool = False
-) -> None:
-    # prepare connstr:
-    # - cut out password from connstr to pass it via env
-    # - add options to connstr
-    password = env.pg.default_options.get("password", None)
-    options = f"-cstatement_timeout=0 {env.pg.default_options.get('options', '')}"
-    connstr = env.pg.connstr(password=None, options=options)
+@dataclass
+class ExplainStats:
+    """
+    Timings and buffer usage of one `EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)` run.
 
-    environ: Dict[str, str] = {}
-    if password is not None:
-        environ["PGPASSWORD"] = password
+    Buffer counters of the top plan node include those of all its children and of
+    parallel workers, so they cover the whole query. I/O times are only reported
+    with `track_io_timing` on, and are zero otherwise.
+    """
 
+    planning_time_ms: float
+    execution_time_ms: float
+    shared_hit_blocks: int
+    shared_read_blocks: int
+    shared_dirtied_blocks: int
+    shared_written_blocks: int
+    temp_read_blocks: int
+    temp_written_blocks: int
+    io_read_time_ms: float
+    io_write_time_ms: float
+
+    @classmethod
+    def from_json(cls, explain: Any) -> "ExplainStats":
+        if isinstance(explain, str):
+            explain = json.loads(explain)
+        top = explain[0]
+        plan = top["Plan"]
+
+        def io_time(kind: str) -> float:
+            # Postgres 17 splits I/O times into shared/local and temp ones
+            return float(plan.get(f"I/O {kind} Time", plan.get(f"Shared I/O {kind} Time", 0.0)))
+
+        return cls(
+            planning_time_ms=float(top.get("Planning Time", 0.0)),
+            execution_time_ms=float(top.get("Execution Time", 0.0)),
+            shared_hit_blocks=int(plan.get("Shared Hit Blocks", 0)),
+            shared_read_blocks=int(plan.get("Shared Read Blocks", 0)),
+            shared_dirtied_blocks=int(plan.get("Shared Dirtied Blocks", 0)),
+            shared_written_blocks=int(plan.get("Shared Written Blocks", 0)),
+            temp_read_blocks=int(plan.get("Temp Read Blocks", 0)),
+            temp_written_blocks=int(plan.get("Temp Written Blocks", 0)),
+            io_read_time_ms=io_time("Read"),
+            io_write_time_ms=io_time("Write"),
+        )
+
+    def record(self, zenbenchmark: NeonBenchmarker, label: str):
+        for name, value in (
+            ("planning_time", self.planning_time_ms),
+            ("execution_time", self.execution_time_ms),
+            ("io_read_time", self.io_read_time_ms),
+            ("io_write_time", self.io_write_time_ms),
+        ):
+            zenbenchmark.record(
+                f"{label}/EXPLAIN/{name}", value, "ms", MetricReport.LOWER_IS_BETTER
+            )
+        for name, blocks in (
+            ("shared_hit_blocks", self.shared_hit_blocks),
+            ("shared_read_blocks", self.shared_read_blocks),
+            ("shared_dirtied_blocks", self.shared_dirtied_blocks),
+            ("shared_written_blocks", self.shared_written_blocks),
+            ("temp_read_blocks", self.temp_read_blocks),
+            ("temp_written_blocks", self.temp_written_blocks),
+        ):
+            zenbenchmark.record(f"{label}/EXPLAIN/{name}", blocks, "", MetricReport.TEST_PARAM)
+
+
+def is_plannable(query: str) -> bool:
+    """Only DML queries can be EXPLAINed, utility statements like CREATE EXTENSION can't."""
+    # skip the leading comments, like the ones in the TPC-H queries
+    query = re.sub(r"^(\s*--[^\n]*\n)*", "", query)
+    return query.lstrip().upper().startswith(("SELECT", "WITH", "TABLE", "VALUES"))
+
+
+def run_query(
+    env: PgCompare,
+    labelled_query: LabelledQuery,
+    times: int,
+    explain: bool = False,
+    output_file: Optional[str] = None,
+) -> None:
+    """
+    Run the query `times` times, plus once with EXPLAIN ANALYZE if `explain` is requested.
+
+    All runs share one connection, and the time to set it up is recorded separately
+    as `{label}/connect`. Queries that can be planned are prepared on that connection
+    once, and planned once with `EXPLAIN EXECUTE`, which caches the plan and reports
+    the planning time as `{label}/planning`. Every run then only executes the cached
+    plan, and `{label}/{run}` is the client-side time for that. Result rows are left in
+    libpq's buffer and never converted to Python objects, unless `output_file` is
+    given: then the rows of the last run are written to that file in the test output
+    directory.
+    """
     label, query = labelled_query.label, labelled_query.query
 
-    log.info(f"Running query {label} {times} times")
-    for i in range(times):
-        run = i + 1
-        log.info(f"Run {run}/{times}")
-        with env.zenbenchmark.record_duration(f"{label}/{run}"):
-            env.pg_bin.run_capture(["psql", connstr, "-c", query], env=environ)
-    if explain:
-        log.info(f"Explaining query {label}")
-        run += 1
-        with env.zenbenchmark.record_duration(f"{label}/EXPLAIN"):
-            env.pg_bin.run_capture(
-                ["psql", connstr, "-c", f"{EXPLAIN_STRING} {query}"], env=environ
+    options = f"-cstatement_timeout=0 {env.pg.default_options.get('options', '')}"
+    with env.zenbenchmark.record_duration(f"{label}/connect"):
+        conn = env.pg.connect(options=options)
+
+    with closing(conn), conn.cursor() as cur:
+        statement = query
+        if is_plannable(query):
+            # A statement without parameters always uses a generic plan, which is
+            # built and cached by the first EXECUTE, here the EXPLAIN
+            cur.execute(f"PREPARE olap_query AS {query}")
+            cur.execute("EXPLAIN (SUMMARY, FORMAT JSON) EXECUTE olap_query")
+            row = cur.fetchone()
+            assert row is not None
+            env.zenbenchmark.record(
+                f"{label}/planning",
+                ExplainStats.from_json(row[0]).planning_time_ms,
+                "ms",
+                MetricReport.LOWER_IS_BETTER,
             )
+            statement = "EXECUTE olap_query"
+
+        log.info(f"Running query {label} {times} times")
+        for i in range(times):
+            run = i + 1
+            log.info(f"Run {run}/{times}")
+            with env.zenbenchmark.record_duration(f"{label}/{run}"):
+                cur.execute(statement)
+
+        if output_file is not None and cur.description is not None:
+            with open(env.pg_bin.log_dir / output_file, "w") as f:
+                f.write("\t".join(column.name for column in cur.description) + "\n")
+                for row in cur:
+                    f.write("\t".join(str(value) for value in row) + "\n")
+
+        if explain:
+            log.info(f"Explaining query {label}")
+            with env.zenbenchmark.record_duration(f"{label}/EXPLAIN"):
+                cur.execute(f"{EXPLAIN_STRING} {query}")
+            row = cur.fetchone()
+            assert row is not None
+            explain_json = json.loads(row[0]) if isinstance(row[0], str) else row[0]
+            with open(env.pg_bin.log_dir / f"{label}_explain.json", "w") as f:
+                json.dump(explain_json, f, indent=2)
+            ExplainStats.from_json(explain_json).record(env.zenbenchmark, label)
 
 
 @pytest.mark.parametrize("scale", get_scale())
@@ -158,7 +288,7 @@ def test_clickbench(query: LabelledQuery, remote_compare: RemoteCompare, scale:
     """
     explain: bool = os.getenv("TEST_OLAP_COLLECT_EXPLAIN", "false").lower() == "true"
 
-    run_psql(remote_compare, query, times=3, explain=explain)
+    run_query(remote_compare, query, times=3, explain=explain)
 
 
 def tpch_queuies() -> Tuple[ParameterSet, ...]:
@@ -192,7 +322,149 @@ def test_tpch(query: LabelledQuery, remote_compare: RemoteCompare, scale: str):
     For query generation `1669822882` is used as a seed to the RNG
     """
 
-    run_psql(remote_compare, query, times=1)
+    run_query(remote_compare, query, times=1)
+
+
+#
+# Local mode: instead of a database prepared in advance, run the ClickBench and
+# TPC-H queries against synthetic data on local Neon and vanilla Postgres.
+#
+# The data is generated once per dataset, scale and Postgres version, and kept as
+# a template in the output directory: a copy of the vanilla data directory, and a
+# snapshot of the Neon repo dir that is restored with `from_repo_dir`.
+#
+local_mode = pytest.mark.skipif(
+    os.getenv("TEST_OLAP_LOCAL", "false").lower() == "false",
+    reason="Skipping - local OLAP runs are enabled with TEST_OLAP_LOCAL=true",
+)
+
+
+def get_local_scale() -> List[float]:
+    # Scale factor of the generated data, see fixtures/olap_datagen.py
+    return [float(os.getenv("TEST_OLAP_LOCAL_SCALE", "0.01"))]
+
+
+def olap_template_dir(request: FixtureRequest, dataset: OlapDataset, scale: float) -> Path:
+    top_output_dir: Path = request.getfixturevalue("top_output_dir")
+    pg_version: PgVersion = request.getfixturevalue("pg_version")
+    fingerprint = olap_dataset_fingerprint(dataset, scale)
+    return (
+        top_output_dir
+        / "olap_templates"
+        / f"{dataset.name}-{scale}-{pg_version.v_prefixed}-{fingerprint}"
+    )
+
+
+def save_template(src: Path, dst: Path):
+    """
+    Copy `src` to `dst` through a temporary directory, so that a partially copied
+    template is never used. If another test has saved the same template in the
+    meantime, keep that one.
+    """
+    tmp = dst.with_name(f"{dst.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copytree(src, tmp, ignore=shutil.ignore_patterns("*.log", "*.pid"))
+    try:
+        tmp.rename(dst)
+    except OSError:
+        assert dst.exists()
+        shutil.rmtree(tmp)
+
+
+def local_vanilla_compare(
+    request: FixtureRequest, dataset: OlapDataset, scale: float
+) -> VanillaCompare:
+    zenbenchmark: NeonBenchmarker = request.getfixturevalue("zenbenchmark")
+    vanilla_pg: VanillaPostgres = request.getfixturevalue("vanilla_pg")
+    template = olap_template_dir(request, dataset, scale) / "vanilla"
+
+    if template.exists():
+        log.info(f"Restoring {dataset.name} data from template {template}")
+        shutil.rmtree(vanilla_pg.pgdatadir)
+        shutil.copytree(template, vanilla_pg.pgdatadir)
+        vanilla_pg.configure([f"port = {vanilla_pg.default_options['port']}\n"])
+    else:
+        log.info(f"Generating {dataset.name} data at scale {scale}")
+        vanilla_pg.start()
+        load_olap_dataset(vanilla_pg, dataset, scale, options="-cstatement_timeout=0")
+        vanilla_pg.safe_psql("CHECKPOINT")
+        vanilla_pg.stop()
+        save_template(vanilla_pg.pgdatadir, template)
+
+    return VanillaCompare(zenbenchmark, vanilla_pg)
+
+
+def local_neon_compare(request: FixtureRequest, dataset: OlapDataset, scale: float) -> NeonCompare:
+    zenbenchmark: NeonBenchmarker = request.getfixturevalue("zenbenchmark")
+    pg_bin: PgBin = request.getfixturevalue("pg_bin")
+    neon_env_builder: NeonEnvBuilder = request.getfixturevalue("neon_env_builder")
+    neon_env_builder.enable_pageserver_remote_storage(RemoteStorageKind.LOCAL_FS)
+    template = olap_template_dir(request, dataset, scale) / "neon"
+
+    if template.exists():
+        log.info(f"Restoring {dataset.name} data from template {template}")
+        env = neon_env_builder.from_repo_dir(template / "repo")
+        neon_env_builder.start()
+    else:
+        log.info(f"Generating {dataset.name} data at scale {scale}")
+        env = neon_env_builder.init_start()
+        endpoint = env.endpoints.create_start("main", endpoint_id="olap-load")
+        load_olap_dataset(endpoint, dataset, scale, options="-cstatement_timeout=0")
+        last_flush_lsn_upload(env, endpoint, env.initial_tenant, env.initial_timeline)
+        endpoint.stop_and_destroy()
+
+        # Like test_create_snapshot, stop the storage but not the shared broker
+        for sk in env.safekeepers:
+            sk.stop()
+        env.pageserver.stop()
+        save_template(env.repo_dir, template / "repo")
+        env.pageserver.start()
+        for sk in env.safekeepers:
+            sk.start()
+
+    return NeonCompare(zenbenchmark, env, pg_bin, "main", tenant_id=env.initial_tenant)
+
+
+def local_olap_compare(
+    request: FixtureRequest, flavor: str, dataset: OlapDataset, scale: float
+) -> PgCompare:
+    if flavor == "vanilla":
+        return local_vanilla_compare(request, dataset, scale)
+    return local_neon_compare(request, dataset, scale)
+
+
+@local_mode
+@pytest.mark.parametrize("scale", get_local_scale())
+@pytest.mark.parametrize("query", QUERIES)
+@pytest.mark.parametrize("flavor", ["vanilla", "neon"])
+def test_clickbench_local(request: FixtureRequest, flavor: str, query: LabelledQuery, scale: float):
+    """
+    ClickBench queries against a generated `hits` table, see `clickbench_dataset`.
+
+    Set TEST_OLAP_LOCAL=true to run, and TEST_OLAP_LOCAL_SCALE to change the size
+    of the data: scale 1 is 10M rows.
+    """
+    env = local_olap_compare(request, flavor, clickbench_dataset(), scale)
+    explain: bool = os.getenv("TEST_OLAP_COLLECT_EXPLAIN", "false").lower() == "true"
+
+    run_query(env, query, times=3, explain=explain)
+
+
+@local_mode
+@pytest.mark.parametrize("scale", get_local_scale())
+@pytest.mark.parametrize("query", tpch_queuies())
+@pytest.mark.parametrize("flavor", ["vanilla", "neon"])
+def test_tpch_local(request: FixtureRequest, flavor: str, query: LabelledQuery, scale: float):
+    """
+    TPC-H queries against generated data, see `tpch_dataset`.
+
+    Set TEST_OLAP_LOCAL=true to run, and TEST_OLAP_LOCAL_SCALE to change the size
+    of the data: scale 1 is TPC-H scale factor 1.
+    """
+    env = local_olap_compare(request, flavor, tpch_dataset(), scale)
+
+    run_query(env, query, times=1)
 
 
 @pytest.mark.remote_cluster
@@ -231,7 +503,7 @@ def test_user_examples(remote_compare: RemoteCompare):
         LIMIT 199;
         """,
     )
-    run_psql(remote_compare, query, times=3)
+    run_query(remote_compare, query, times=3)
 
 
 # This must run after all tests in this module
@@ -244,4 +516,4 @@ def test_user_examples(remote_compare: RemoteCompare):
 def test_clickbench_collect_pg_stat_statements(remote_compare: RemoteCompare):
     log.info("Collecting pg_stat_statements")
     query = LabelledQuery("Q_COLLECT_PG_STAT_STATEMENTS", r"SELECT * from pg_stat_statements;")
-    run_psql(remote_compare, query, times=1, explain=False)
+    run_query(remote_compare, query, times=1, output_file="pg_stat_statements.tsv")
@@ -0,0 +1,188 @@
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+import pytest
+from fixtures.benchmark_fixture import LatencyHistogram, MetricReport, NeonBenchmarker
+from fixtures.log_helper import log
+from fixtures.metrics import PrometheusHistogram
+from fixtures.neon_fixtures import NeonEnvBuilder, NeonPageserver, PgBin, wait_for_last_flush_lsn
+from fixtures.pageserver.http import PageserverHttpClient
+from fixtures.pageserver.many_tenants import attach_many_tenants, wait_until_all_active
+from fixtures.pageserver.utils import wait_for_upload_queue_empty
+from fixtures.remote_storage import LocalFsStorage, RemoteStorageKind
+from fixtures.types import TenantId
+
+# Logged by every tenant when it is done activating, see `Tenant::activate`
+ACTIVATION_LOG_LINE = "activation attempt finished"
+ACTIVATION_RE = re.compile(
+    r"since_creation_millis=(?P<millis>\d+).*tenant_id=(?P<tenant_id>[0-9a-f]{32}).*post_state=(?P<state>\w+)"
+)
+
+
+@dataclass
+class TenantActivation:
+    tenant_id: TenantId
+    # seconds since the restart began, when the tenant object was created
+    # (Attaching) and when its activation finished
+    created: float
+    activated: float
+    state: str
+
+
+def _log_timestamp(line: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(line.split()[0], "%Y-%m-%dT%H:%M:%S.%fZ")
+    except (IndexError, ValueError):
+        return None
+
+
+def activation_timeline(
+    pageserver: NeonPageserver, log_offset: int, restart_at: datetime
+) -> List[TenantActivation]:
+    """
+    The activations that the pageserver logged after `log_offset` in its log,
+    with times relative to `restart_at`, a naive UTC datetime like the log's.
+    """
+    activations = []
+    with (pageserver.workdir / "pageserver.log").open("r") as f:
+        f.seek(log_offset)
+        for line in f:
+            if ACTIVATION_LOG_LINE not in line:
+                continue
+            match = ACTIVATION_RE.search(line)
+            timestamp = _log_timestamp(line)
+            if match is None or timestamp is None:
+                continue
+            activated = (timestamp - restart_at).total_seconds()
+            activations.append(
+                TenantActivation(
+                    TenantId(match.group("tenant_id")),
+                    activated - int(match.group("millis")) / 1000,
+                    activated,
+                    match.group("state"),
+                )
+            )
+    return sorted(activations, key=lambda a: a.activated)
+
+
+def wait_for_initial_logical_sizes(
+    pageserver_http: PageserverHttpClient, n_timelines: int, timeout: float = 600
+) -> float:
+    """Poll until `n_timelines` initial logical size calculations have finished."""
+    start = time.perf_counter()
+    while True:
+        finished = pageserver_http.get_metric_value(
+            "pageserver_initial_logical_size_finish_calculation_total"
+        )
+        elapsed = time.perf_counter() - start
+        if (finished or 0) >= n_timelines:
+            return elapsed
+        assert elapsed < timeout, f"only {finished} of {n_timelines} logical sizes after {timeout}s"
+        time.sleep(0.05)
+
+
+def write_timeline(path: Path, activations: List[TenantActivation]):
+    with path.open("w") as f:
+        f.write("tenant_id,created,activated,state\n")
+        for a in activations:
+            f.write(f"{a.tenant_id},{a.created:.3f},{a.activated:.3f},{a.state}\n")
+
+
+#
+# Measure how long a pageserver restart takes until the tenants are ready to
+# serve, per tenant: the pageserver logs when each tenant finishes activating,
+# and how long after its creation, which gives a timeline of activations from
+# the moment the restart began. The timeline is written to
+# `activation_timeline.csv` in the test output directory.
+#
+# The tenants are duplicates of a template tenant of pgbench data at `scale`,
+# see `fixtures.pageserver.many_tenants`.
+#
+@pytest.mark.timeout(3600)
+@pytest.mark.parametrize("scale", [1, 20])
+@pytest.mark.parametrize("n_tenants", [1, 100, 1000])
+def test_restart_to_ready(
+    neon_env_builder: NeonEnvBuilder,
+    pg_bin: PgBin,
+    zenbenchmark: NeonBenchmarker,
+    test_output_dir: Path,
+    n_tenants: int,
+    scale: int,
+):
+    neon_env_builder.enable_pageserver_remote_storage(RemoteStorageKind.LOCAL_FS)
+    env = neon_env_builder.init_start(
+        initial_tenant_conf={"gc_period": "0s", "compaction_period": "0s"}
+    )
+    remote_storage = env.pageserver_remote_storage
+    assert isinstance(remote_storage, LocalFsStorage)
+    pageserver = env.pageserver
+    pageserver_http = pageserver.http_client()
+    template = env.initial_tenant
+    timeline_id = env.initial_timeline
+
+    with env.endpoints.create_start("main", tenant_id=template) as endpoint:
+        pg_bin.run(["pgbench", "-i", f"-s{scale}", endpoint.connstr()])
+        wait_for_last_flush_lsn(env, endpoint, template, timeline_id)
+    pageserver_http.timeline_checkpoint(template, timeline_id)
+    wait_for_upload_queue_empty(pageserver_http, template, timeline_id)
+
+    attach_many_tenants(pageserver, remote_storage, template, n_tenants - 1)
+    wait_until_all_active(pageserver)
+
+    pageserver.stop()
+    log_offset = (pageserver.workdir / "pageserver.log").stat().st_size
+    restart_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    start = time.perf_counter()
+    pageserver.start()
+    startup = time.perf_counter() - start
+    wait_until_all_active(pageserver)
+    ready = time.perf_counter() - start
+    wait_for_initial_logical_sizes(pageserver_http, n_tenants)
+    logical_sizes = time.perf_counter() - start
+
+    activations = activation_timeline(pageserver, log_offset, restart_at)
+    write_timeline(test_output_dir / "activation_timeline.csv", activations)
+    active = [a for a in activations if a.state == "Active"]
+    assert len(active) == n_tenants, f"{len(active)} of {n_tenants} tenants logged activation"
+
+    activation = LatencyHistogram()
+    for a in active:
+        activation.add(int((a.activated - a.created) * 1e9))
+    log.info(
+        f"restart with {n_tenants} tenants: first active at {active[0].activated:.3f}s, "
+        f"all active at {active[-1].activated:.3f}s"
+    )
+
+    zenbenchmark.record("tenants", n_tenants, "", MetricReport.TEST_PARAM)
+    zenbenchmark.record("scale", scale, "", MetricReport.TEST_PARAM)
+    zenbenchmark.record("startup", startup, "s", MetricReport.LOWER_IS_BETTER)
+    zenbenchmark.record(
+        "time_to_first_active", active[0].activated, "s", MetricReport.LOWER_IS_BETTER
+    )
+    zenbenchmark.record(
+        "time_to_all_active", active[-1].activated, "s", MetricReport.LOWER_IS_BETTER
+    )
+    zenbenchmark.record("time_to_ready", ready, "s", MetricReport.LOWER_IS_BETTER)
+    zenbenchmark.record_histogram("activation", activation, "ms", divisor=1e6)
+    zenbenchmark.record(
+        "time_to_all_logical_sizes", logical_sizes, "s", MetricReport.LOWER_IS_BETTER
+    )
+
+    metrics = pageserver_http.get_metrics()
+    zenbenchmark.record_prometheus_histogram(
+        "initial_logical_size",
+        PrometheusHistogram.from_metrics(
+            metrics, "pageserver_storage_operations_seconds_global", {"operation": "logical size"}
+        ),
+    )
+    for sample in metrics.query_all("pageserver_startup_duration_seconds"):
+        zenbenchmark.record(
+            f"startup_phase.{sample.labels['phase']}",
+            sample.value,
+            "s",
+            MetricReport.LOWER_IS_BETTER,
+        )
@@ -0,0 +1,209 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import List
+
+import pytest
+from fixtures.benchmark_fixture import LatencyHistogram, MetricReport, NeonBenchmarker
+from fixtures.log_helper import log
+from fixtures.metrics import PrometheusHistogram, parse_metrics
+from fixtures.neon_fixtures import Endpoint, NeonEnv, NeonEnvBuilder
+from fixtures.types import Lsn, TenantId, TimelineId
+
+MB = 1024 * 1024
+
+# How long the workload runs
+DURATION_SECONDS = 30
+
+
+@dataclass
+class WalSample:
+    # seconds since the sampler started
+    elapsed: float
+    # per safekeeper
+    flush_lsns: List[Lsn]
+    commit_lsns: List[Lsn]
+    last_record_lsn: Lsn
+
+    @property
+    def lag(self) -> int:
+        """Bytes of committed WAL that the pageserver hasn't received yet."""
+        return max(0, max(self.commit_lsns) - self.last_record_lsn)
+
+
+class WalSampler:
+    """
+    Sample the flush and commit LSNs of a timeline on every safekeeper, and the
+    pageserver's last_record_lsn, every `interval` seconds.
+    """
+
+    def __init__(
+        self, env: NeonEnv, tenant_id: TenantId, timeline_id: TimelineId, interval: float = 0.1
+    ):
+        self.safekeeper_clients = [sk.http_client() for sk in env.safekeepers]
+        self.pageserver_http = env.pageserver.http_client()
+        self.tenant_id = tenant_id
+        self.timeline_id = timeline_id
+        self.interval = interval
+        self.samples: List[WalSample] = []
+        self._start = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        statuses = [
+            client.timeline_status(self.tenant_id, self.timeline_id)
+            for client in self.safekeeper_clients
+        ]
+        detail = self.pageserver_http.timeline_detail(self.tenant_id, self.timeline_id)
+        self.samples.append(
+            WalSample(
+                time.monotonic() - self._start,
+                [s.flush_lsn for s in statuses],
+                [s.commit_lsn for s in statuses],
+                Lsn(detail["last_record_lsn"]),
+            )
+        )
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._start = time.monotonic()
+        self._sample()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    def flush_rate(self, safekeeper: int) -> float:
+        """Bytes per second that safekeeper number `safekeeper` flushed."""
+        first, last = self.samples[0], self.samples[-1]
+        return (last.flush_lsns[safekeeper] - first.flush_lsns[safekeeper]) / (
+            last.elapsed - first.elapsed
+        )
+
+
+def safekeeper_histogram(env: NeonEnv, name: str) -> PrometheusHistogram:
+    """`name` summed over all safekeepers."""
+    histogram = PrometheusHistogram(buckets={}, sum=0.0, count=0.0)
+    for sk in env.safekeepers:
+        metrics = parse_metrics(sk.http_client().get_metrics_str(), f"safekeeper_{sk.id}")
+        histogram = histogram + PrometheusHistogram.from_metrics(metrics, name)
+    return histogram
+
+
+def run_workload(endpoint: Endpoint, workload: str, clients: int) -> LatencyHistogram:
+    """
+    Run `clients` connections of `workload` for `DURATION_SECONDS`, and return
+    the latencies of their commits:
+
+    - small_txns: single-row INSERTs in autocommit mode, so that every commit
+      waits for the safekeepers to flush a little WAL
+    - bulk: INSERTs of 10k rows each, so that the safekeepers mostly stream WAL
+    """
+    latencies: List[LatencyHistogram] = []
+
+    def client(i: int):
+        histogram = LatencyHistogram()
+        latencies.append(histogram)
+        deadline = time.monotonic() + DURATION_SECONDS
+        with endpoint.cursor() as cur:
+            if workload == "small_txns":
+                sql = "INSERT INTO wal_load (client, payload) VALUES (%s, repeat('x', 100))"
+            else:
+                sql = "INSERT INTO wal_load (client, payload) SELECT %s, repeat('x', 100) FROM generate_series(1, 10000)"
+            while time.monotonic() < deadline:
+                start_ns = time.perf_counter_ns()
+                cur.execute(sql, (i,))
+                histogram.add(time.perf_counter_ns() - start_ns)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    merged = LatencyHistogram()
+    for histogram in latencies:
+        merged.merge(histogram)
+    return merged
+
+
+#
+# Drive a WAL-heavy workload through 1 or 3 safekeepers, with and without
+# fsync, and measure the commit latency that clients see, how fast the
+# safekeepers flush WAL, and how far the pageserver lags behind the commit_lsn.
+#
+@pytest.mark.timeout(900)
+@pytest.mark.parametrize("workload", ["small_txns", "bulk"])
+@pytest.mark.parametrize("fsync", [False, True])
+@pytest.mark.parametrize("n_safekeepers", [1, 3])
+def test_safekeeper_throughput(
+    neon_env_builder: NeonEnvBuilder,
+    zenbenchmark: NeonBenchmarker,
+    n_safekeepers: int,
+    fsync: bool,
+    workload: str,
+):
+    clients = 8 if workload == "small_txns" else 4
+
+    neon_env_builder.num_safekeepers = n_safekeepers
+    neon_env_builder.safekeepers_enable_fsync = fsync
+    env = neon_env_builder.init_start()
+    tenant_id = env.initial_tenant
+    timeline_id = env.initial_timeline
+
+    endpoint = env.endpoints.create_start("main")
+    endpoint.safe_psql("CREATE TABLE wal_load (id bigserial PRIMARY KEY, client int, payload text)")
+
+    write_before = safekeeper_histogram(env, "safekeeper_write_wal_seconds")
+    flush_before = safekeeper_histogram(env, "safekeeper_flush_wal_seconds")
+    lsn_before = Lsn(endpoint.safe_psql("SELECT pg_current_wal_flush_lsn()")[0][0])
+    sampler = WalSampler(env, tenant_id, timeline_id)
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        commits = run_workload(endpoint, workload, clients)
+    finally:
+        sampler.stop()
+    elapsed = time.perf_counter() - start
+    lsn_after = Lsn(endpoint.safe_psql("SELECT pg_current_wal_flush_lsn()")[0][0])
+    writes = safekeeper_histogram(env, "safekeeper_write_wal_seconds") - write_before
+    flushes = safekeeper_histogram(env, "safekeeper_flush_wal_seconds") - flush_before
+
+    wal_bytes = lsn_after - lsn_before
+    flush_rates = [sampler.flush_rate(i) for i in range(n_safekeepers)]
+    lags = LatencyHistogram()
+    for sample in sampler.samples:
+        lags.add(sample.lag)
+    log.info(
+        f"{wal_bytes / MB:.1f} MB of WAL in {elapsed:.1f}s, "
+        f"safekeeper flush rates {[round(r / MB, 1) for r in flush_rates]} MB/s"
+    )
+
+    zenbenchmark.record("safekeepers", n_safekeepers, "", MetricReport.TEST_PARAM)
+    zenbenchmark.record("fsync", int(fsync), "", MetricReport.TEST_PARAM)
+    zenbenchmark.record("clients", clients, "", MetricReport.TEST_PARAM)
+    zenbenchmark.record(
+        "commits_per_second", commits.count / elapsed, "", MetricReport.HIGHER_IS_BETTER
+    )
+    zenbenchmark.record_histogram("commit", commits, "ms", divisor=1e6)
+    zenbenchmark.record(
+        "wal_throughput", wal_bytes / MB / elapsed, "MB/s", MetricReport.HIGHER_IS_BETTER
+    )
+    zenbenchmark.record(
+        "flush_lsn_rate_min", min(flush_rates) / MB, "MB/s", MetricReport.HIGHER_IS_BETTER
+    )
+    zenbenchmark.record(
+        "flush_lsn_rate_avg",
+        sum(flush_rates) / len(flush_rates) / MB,
+        "MB/s",
+        MetricReport.HIGHER_IS_BETTER,
+    )
+    zenbenchmark.record_histogram("pageserver_lag", lags, "MB", divisor=MB)
+    zenbenchmark.record_prometheus_histogram("safekeeper_write_wal", writes)
+    zenbenchmark.record_prometheus_histogram("safekeeper_flush_wal", flushes)
@@ -0,0 +1,252 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import pytest
+from fixtures.benchmark_fixture import LatencyHistogram, MetricReport, NeonBenchmarker
+from fixtures.log_helper import log
+from fixtures.metrics import PrometheusHistogram
+from fixtures.neon_fixtures import NeonEnvBuilder, NeonPageserver, PgBin, wait_for_last_flush_lsn
+from fixtures.pageserver.utils import wait_for_upload_queue_empty
+from fixtures.remote_storage_proxy import ThrottledStorageProxy
+from fixtures.types import TenantId, TimelineId
+
+from performance.test_ondemand_download import LAYER_DOWNLOADS, THROTTLES
+
+MB = 1024 * 1024
+
+TENANT_CONF = {
+    # small layers, so that a secondary has many of them to download
+    "checkpoint_distance": f"{2 * MB}",
+    "compaction_target_size": f"{2 * MB}",
+    "gc_period": "0s",
+    "compaction_period": "0s",
+    # heatmaps are uploaded explicitly by the test
+    "heatmap_period": "0s",
+}
+
+
+class ResidencySampler:
+    """
+    Sample the number of layers that secondary locations on a pageserver have
+    downloaded, from `pageserver_secondary_download_layer`, every `interval` seconds.
+    """
+
+    def __init__(self, pageserver: NeonPageserver, interval: float = 0.1):
+        self.http = pageserver.http_client()
+        self.interval = interval
+        # (seconds since start, layers downloaded since start)
+        self.samples: List[Tuple[float, int]] = []
+        self._baseline = self._downloaded_layers()
+        self._start = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _downloaded_layers(self) -> int:
+        value = self.http.get_metric_value("pageserver_secondary_download_layer_total")
+        return int(value or 0)
+
+    def _sample(self):
+        self.samples.append(
+            (time.monotonic() - self._start, self._downloaded_layers() - self._baseline)
+        )
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._start = time.monotonic()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    def time_to(self, layers: int) -> Optional[float]:
+        """When the secondaries had downloaded `layers` layers."""
+        for elapsed, downloaded in self.samples:
+            if downloaded >= layers:
+                return elapsed
+        return None
+
+
+#
+# Measure how long it takes to warm up secondary locations of many tenants on
+# another pageserver, and what a live migration to a warm (or cold) secondary
+# costs the first reads afterwards.
+#
+# Remote storage goes through a throttled proxy, so that downloads cost about
+# as much as they would from S3.
+#
+@pytest.mark.timeout(1800)
+@pytest.mark.parametrize("warm", [True, False])
+@pytest.mark.parametrize("n_tenants", [1, 8, 32])
+def test_secondary_warmup(
+    neon_env_builder: NeonEnvBuilder,
+    remote_storage_proxy: ThrottledStorageProxy,
+    pg_bin: PgBin,
+    zenbenchmark: NeonBenchmarker,
+    n_tenants: int,
+    warm: bool,
+):
+    parallelism = 8
+    n_lookups = 100
+
+    neon_env_builder.num_pageservers = 2
+    remote_storage_proxy.attach(neon_env_builder)
+    env = neon_env_builder.init_start(initial_tenant_conf=TENANT_CONF)
+    ps_attached = env.pageservers[0]
+    ps_secondary = env.pageservers[1]
+    attached_http = ps_attached.http_client()
+    secondary_http = ps_secondary.http_client()
+
+    tenants: List[Tuple[TenantId, TimelineId]] = [(env.initial_tenant, env.initial_timeline)]
+    for _ in range(n_tenants - 1):
+        tenants.append(env.neon_cli.create_tenant(conf=TENANT_CONF))
+
+    for tenant_id, timeline_id in tenants:
+        with env.endpoints.create_start("main", tenant_id=tenant_id) as endpoint:
+            pg_bin.run(["pgbench", "-i", "-s1", endpoint.connstr()])
+            wait_for_last_flush_lsn(env, endpoint, tenant_id, timeline_id)
+        attached_http.timeline_checkpoint(tenant_id, timeline_id)
+        wait_for_upload_queue_empty(attached_http, tenant_id, timeline_id)
+
+    # What the secondaries are expected to download: everything that is resident
+    # on the attached pageserver, which is what the heatmaps list
+    expect_layers = 0
+    expect_bytes = 0
+    for tenant_id, timeline_id in tenants:
+        for layer in attached_http.layer_map_info(tenant_id, timeline_id).historic_layers:
+            if not layer.remote:
+                expect_layers += 1
+                expect_bytes += layer.layer_file_size or 0
+
+    # Cold secondaries don't download anything in the background, so that
+    # nothing is resident on the destination before the cutover
+    for tenant_id, _ in tenants:
+        ps_secondary.tenant_location_configure(
+            tenant_id,
+            {"mode": "Secondary", "secondary_conf": {"warm": warm}, "tenant_conf": {}},
+        )
+
+    remote_storage_proxy.throttle = THROTTLES["s3_like"]
+
+    upload_before = PrometheusHistogram.from_metrics(
+        attached_http.get_metrics(), "pageserver_secondary_upload_heatmap_duration"
+    )
+    with zenbenchmark.record_duration("heatmap_upload"):
+        for tenant_id, _ in tenants:
+            attached_http.tenant_heatmap_upload(tenant_id)
+    uploads = (
+        PrometheusHistogram.from_metrics(
+            attached_http.get_metrics(), "pageserver_secondary_upload_heatmap_duration"
+        )
+        - upload_before
+    )
+
+    zenbenchmark.record("tenants", n_tenants, "", MetricReport.TEST_PARAM)
+    zenbenchmark.record("layers", expect_layers, "", MetricReport.TEST_PARAM)
+    zenbenchmark.record("resident_size", expect_bytes / MB, "MB", MetricReport.TEST_PARAM)
+    zenbenchmark.record_prometheus_histogram("heatmap_upload_per_tenant", uploads)
+
+    if warm:
+        remote_storage_proxy.reset_stats()
+        sampler = ResidencySampler(ps_secondary)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=parallelism) as executor:
+                # a client per download, sessions aren't safe to share between threads
+                futures = [
+                    executor.submit(ps_secondary.http_client().tenant_secondary_download, tenant_id)
+                    for tenant_id, _ in tenants
+                ]
+                for future in futures:
+                    future.result()
+        finally:
+            sampler.stop()
+        warmup = time.perf_counter() - start
+        stats = remote_storage_proxy.reset_stats()
+
+        downloaded = sampler.samples[-1][1]
+        log.info(f"secondaries downloaded {downloaded} of {expect_layers} layers in {warmup:.3f}s")
+        zenbenchmark.record("warmup_time", warmup, "s", MetricReport.LOWER_IS_BETTER)
+        zenbenchmark.record("layers_downloaded", downloaded, "", MetricReport.TEST_PARAM)
+        zenbenchmark.record(
+            "bytes_moved", stats.bytes_sent / MB, "MB", MetricReport.LOWER_IS_BETTER
+        )
+        zenbenchmark.record(
+            "warmup_throughput",
+            stats.bytes_sent / MB / warmup,
+            "MB/s",
+            MetricReport.HIGHER_IS_BETTER,
+        )
+        for pct in (50, 90, 100):
+            reached = sampler.time_to(expect_layers * pct // 100)
+            if reached is not None:
+                zenbenchmark.record(
+                    f"time_to_{pct}pct_resident", reached, "s", MetricReport.LOWER_IS_BETTER
+                )
+        stats.record(zenbenchmark, "remote_storage")
+
+    # Live migration of the first tenant to its secondary location, like in
+    # test_live_migration, with a compute that stays up throughout
+    tenant_id, timeline_id = tenants[0]
+    endpoint = env.endpoints.create_start(
+        "main", tenant_id=tenant_id, pageserver_id=ps_attached.id, endpoint_id="ep-cutover"
+    )
+    ps_attached.tenant_location_configure(
+        tenant_id,
+        {"mode": "AttachedStale", "secondary_conf": None, "tenant_conf": {}, "generation": 1},
+        flush_ms=5000,
+    )
+    generation = env.attachment_service.attach_hook_issue(tenant_id, ps_secondary.id)
+    downloads_before = PrometheusHistogram.from_metrics(
+        secondary_http.get_metrics(), "pageserver_remote_operation_seconds", LAYER_DOWNLOADS
+    )
+    with zenbenchmark.record_duration("cutover"):
+        ps_secondary.tenant_location_configure(
+            tenant_id,
+            {
+                "mode": "AttachedMulti",
+                "secondary_conf": None,
+                "tenant_conf": {},
+                "generation": generation,
+            },
+        )
+        endpoint.reconfigure(pageserver_id=ps_secondary.id)
+
+    reads = LatencyHistogram()
+    with endpoint.cursor() as cur:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS neon_test_utils")
+        cur.execute("SELECT clear_buffer_cache()")
+        queries = ["SELECT count(*) FROM pgbench_accounts"] + [
+            f"SELECT abalance FROM pgbench_accounts WHERE aid = {i * 997 % 100000 + 1}"
+            for i in range(n_lookups)
+        ]
+        for i, sql in enumerate(queries):
+            start_ns = time.perf_counter_ns()
+            cur.execute(sql)
+            cur.fetchall()
+            elapsed_ns = time.perf_counter_ns() - start_ns
+            if i == 0:
+                zenbenchmark.record(
+                    "cutover_first_query", elapsed_ns / 1e9, "s", MetricReport.LOWER_IS_BETTER
+                )
+            else:
+                reads.add(elapsed_ns)
+    endpoint.stop()
+
+    ondemand = (
+        PrometheusHistogram.from_metrics(
+            secondary_http.get_metrics(), "pageserver_remote_operation_seconds", LAYER_DOWNLOADS
+        )
+        - downloads_before
+    )
+    zenbenchmark.record_histogram("cutover_read", reads, "ms", divisor=1e6)
+    zenbenchmark.record(
+        "cutover_ondemand_downloads", ondemand.count, "", MetricReport.LOWER_IS_BETTER
+    )
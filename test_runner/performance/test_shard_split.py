@@ -0,0 +1,171 @@
+import time
+from typing import Dict, List
+
+import pytest
+from fixtures.availability_probe import AvailabilityProbe
+from fixtures.benchmark_fixture import MetricReport, NeonBenchmarker
+from fixtures.log_helper import log
+from fixtures.neon_fixtures import NeonEnv, NeonEnvBuilder, PgBin, tenant_get_shards
+from fixtures.types import TenantId
+
+MB = 1024 * 1024
+
+# How long the probe runs before and after the split
+SETTLE_SECONDS = 5
+
+# How long the read-only pgbench runs after the split
+READ_SECONDS = 20
+
+LAYER_UPLOADS = {"file_kind": "layer", "op_kind": "upload"}
+
+
+def tenant_metric_sum(env: NeonEnv, tenant_id: TenantId, name: str, filter: Dict[str, str]) -> int:
+    """Sum of a per-timeline metric of `tenant_id` over all shards on all pageservers."""
+    total = 0.0
+    for pageserver in env.pageservers:
+        metrics = pageserver.http_client().get_metrics()
+        total += sum(
+            s.value for s in metrics.query_all(name, {**filter, "tenant_id": str(tenant_id)})
+        )
+    return int(total)
+
+
+def getpage_requests(env: NeonEnv, tenant_id: TenantId) -> Dict[int, int]:
+    """Pageserver id -> getpage requests for `tenant_id`, over all shards on that pageserver."""
+    requests_by_pageserver = {}
+    for pageserver in env.pageservers:
+        metrics = pageserver.http_client().get_metrics()
+        requests_by_pageserver[pageserver.id] = int(
+            sum(
+                s.value
+                for s in metrics.query_all(
+                    "pageserver_smgr_query_seconds_count",
+                    {"smgr_query_type": "get_page_at_lsn", "tenant_id": str(tenant_id)},
+                )
+            )
+        )
+    return requests_by_pageserver
+
+
+#
+# Measure what it costs to split a loaded tenant into `shard_count` shards
+# while a probe keeps writing and reading through the endpoint, and how getpage
+# throughput scales with the number of shards afterwards:
+#
+# - split: create an unsharded tenant, load it, and split it with
+#   `tenant_shard_split`
+# - create: create the tenant with `shard_count` shards to begin with, as the
+#   baseline for the post-split throughput
+#
+# There is a pageserver per shard, so that the smgr metrics, which are not
+# labelled by shard, can be attributed to shards.
+#
+# TODO: add the "split" method once the attachment service has a shard_split
+# route, until then it could only fail after loading the tenant.
+#
+@pytest.mark.timeout(1800)
+@pytest.mark.parametrize("method", ["create"])
+@pytest.mark.parametrize("shard_count", [2, 4, 8])
+def test_shard_split(
+    neon_env_builder: NeonEnvBuilder,
+    pg_bin: PgBin,
+    zenbenchmark: NeonBenchmarker,
+    shard_count: int,
+    method: str,
+):
+    scale = 20
+
+    neon_env_builder.num_pageservers = shard_count
+    env = neon_env_builder.init_start(
+        initial_tenant_conf={
+            "gc_period": "0s",
+            "compaction_period": "0s",
+            "checkpoint_distance": f"{16 * MB}",
+            "compaction_target_size": f"{16 * MB}",
+        },
+        initial_tenant_shard_count=shard_count if method == "create" else None,
+    )
+    tenant_id = env.initial_tenant
+    timeline_id = env.initial_timeline
+
+    endpoint = env.endpoints.create_start("main", tenant_id=tenant_id)
+    with zenbenchmark.record_duration("load"):
+        pg_bin.run(["pgbench", "-i", f"-s{scale}", endpoint.connstr()])
+    probe = AvailabilityProbe(endpoint, workers=8)
+    probe.setup()
+    for shard, pageserver in tenant_get_shards(env, tenant_id, None):
+        pageserver.http_client().timeline_checkpoint(shard, timeline_id)
+
+    uploaded_before = tenant_metric_sum(
+        env, tenant_id, "pageserver_remote_timeline_client_bytes_finished_total", LAYER_UPLOADS
+    )
+    resident_before = tenant_metric_sum(env, tenant_id, "pageserver_resident_physical_size", {})
+
+    probe.start()
+    try:
+        time.sleep(SETTLE_SECONDS)
+        if method == "split":
+            probe.mark("during")
+            start = time.perf_counter()
+            env.attachment_service.tenant_shard_split(tenant_id, shard_count)
+            split = time.perf_counter() - start
+            probe.mark("after")
+            time.sleep(SETTLE_SECONDS)
+    finally:
+        probe.stop()
+
+    shards = tenant_get_shards(env, tenant_id, None)
+    assert len(shards) == shard_count
+    for shard, pageserver in shards:
+        pageserver.http_client().timeline_checkpoint(shard, timeline_id)
+
+    uploaded = (
+        tenant_metric_sum(
+            env, tenant_id, "pageserver_remote_timeline_client_bytes_finished_total", LAYER_UPLOADS
+        )
+        - uploaded_before
+    )
+    resident = (
+        tenant_metric_sum(env, tenant_id, "pageserver_resident_physical_size", {}) - resident_before
+    )
+
+    zenbenchmark.record("shard_count", shard_count, "", MetricReport.TEST_PARAM)
+    zenbenchmark.record("resident_size", resident_before / MB, "MB", MetricReport.TEST_PARAM)
+    if method == "split":
+        log.info(f"split into {shard_count} shards took {split:.3f}s")
+        zenbenchmark.record("split", split, "s", MetricReport.LOWER_IS_BETTER)
+        zenbenchmark.record("bytes_uploaded", uploaded / MB, "MB", MetricReport.LOWER_IS_BETTER)
+        zenbenchmark.record("bytes_copied", resident / MB, "MB", MetricReport.LOWER_IS_BETTER)
+    probe.record(zenbenchmark, "probe")
+
+    # Read-only load on the (new) shards, with as little of it as possible
+    # served from the compute's own caches
+    with endpoint.cursor() as cur:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS neon_test_utils")
+        cur.execute("SELECT clear_buffer_cache()")
+    getpage_before = getpage_requests(env, tenant_id)
+    start = time.perf_counter()
+    pg_bin.run(["pgbench", "-S", "-c8", "-j8", f"-T{READ_SECONDS}", endpoint.connstr()])
+    elapsed = time.perf_counter() - start
+    getpage_after = getpage_requests(env, tenant_id)
+
+    shards_per_pageserver: Dict[int, int] = {}
+    for _, pageserver in shards:
+        shards_per_pageserver[pageserver.id] = shards_per_pageserver.get(pageserver.id, 0) + 1
+    per_shard: List[float] = []
+    for pageserver_id, n_shards in shards_per_pageserver.items():
+        rate = (getpage_after[pageserver_id] - getpage_before[pageserver_id]) / elapsed
+        per_shard += [rate / n_shards] * n_shards
+
+    total = sum(per_shard)
+    log.info(f"getpage/s per shard: {[round(r) for r in per_shard]}")
+    zenbenchmark.record("getpage_throughput", total, "req/s", MetricReport.HIGHER_IS_BETTER)
+    zenbenchmark.record(
+        "getpage_throughput_per_shard", total / shard_count, "req/s", MetricReport.HIGHER_IS_BETTER
+    )
+    zenbenchmark.record(
+        "getpage_throughput_min_shard", min(per_shard), "req/s", MetricReport.HIGHER_IS_BETTER
+    )
+    zenbenchmark.record(
+        "getpage_throughput_max_shard", max(per_shard), "req/s", MetricReport.TEST_PARAM
+    )
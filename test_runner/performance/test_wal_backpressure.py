@@ -1,14 +1,14 @@
 import statistics
 import threading
 import time
-import timeit
-from typing import Any, Callable, List
+from typing import Any, Callable, List, Sequence, Union
 
 import pytest
 from fixtures.benchmark_fixture import MetricReport, NeonBenchmarker
 from fixtures.compare_fixtures import NeonCompare, PgCompare, VanillaCompare
 from fixtures.log_helper import log
 from fixtures.neon_fixtures import DEFAULT_BRANCH_NAME, NeonEnvBuilder, PgBin
+from fixtures.read_probe import ProbeQuery, ReadProbe
 from fixtures.types import Lsn
 
 from performance.test_perf_pgbench import get_durations_matrix, get_scales_matrix
@@ -254,32 +254,19 @@ def record_lsn_write_lag(env: PgCompare, run_cond: Callable[[], bool], pool_inte
 
 
 def record_read_latency(
-    env: PgCompare, run_cond: Callable[[], bool], read_query: str, read_interval: float = 1.0
+    env: PgCompare,
+    run_cond: Callable[[], bool],
+    read_queries: Union[str, Sequence[ProbeQuery]],
+    read_interval: float = 1.0,
+    readers: int = 1,
 ):
-    read_latencies = []
-
-    with env.pg.connect().cursor() as cur:
-        while run_cond():
-            try:
-                t1 = timeit.default_timer()
-                cur.execute(read_query)
-                t2 = timeit.default_timer()
-
-                log.info(
-                    f"Executed read query {read_query}, got {cur.fetchall()}, read time {t2-t1:.2f}s"
-                )
-                read_latencies.append(t2 - t1)
-            except Exception as err:
-                log.error(f"Got error when executing the read query: {err}")
-
-            time.sleep(read_interval)
-
-    env.zenbenchmark.record(
-        "read_latency_max", max(read_latencies), "s", MetricReport.LOWER_IS_BETTER
-    )
-    env.zenbenchmark.record(
-        "read_latency_avg", statistics.mean(read_latencies), "s", MetricReport.LOWER_IS_BETTER
-    )
-    env.zenbenchmark.record(
-        "read_latency_stdev", statistics.stdev(read_latencies), "s", MetricReport.LOWER_IS_BETTER
-    )
+    """
+    Run read queries while `run_cond()` holds and record their latencies as
+    `read_latency_*` metrics, see `ReadProbe`. A plain SQL string is run as is.
+    """
+    if isinstance(read_queries, str):
+        read_queries = [ProbeQuery("read", read_queries)]
+
+    probe = ReadProbe(env, read_queries, readers=readers, interval=read_interval)
+    probe.run_while(run_cond)
+    probe.record(env.zenbenchmark, "read_latency")
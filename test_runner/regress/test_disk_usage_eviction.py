@@ -1,22 +1,16 @@
-import enum
 import time
-from dataclasses import dataclass
-from typing import Any, Dict, Tuple
 
 import pytest
-import toml
 from fixtures.log_helper import log
-from fixtures.neon_fixtures import (
-    NeonEnv,
-    NeonEnvBuilder,
-    NeonPageserver,
-    PgBin,
-    wait_for_last_flush_lsn,
+from fixtures.neon_fixtures import NeonEnvBuilder, PgBin
+from fixtures.pageserver.eviction import (
+    EvictionEnv,
+    EvictionOrder,
+    create_eviction_env,
+    human_bytes,
+    poor_mans_du,
 )
-from fixtures.pageserver.http import PageserverHttpClient
-from fixtures.pageserver.utils import wait_for_upload_queue_empty
-from fixtures.remote_storage import RemoteStorageKind
-from fixtures.types import Lsn, TenantId, TenantShardId, TimelineId
+from fixtures.types import TenantShardId
 from fixtures.utils import wait_until
 
 GLOBAL_LRU_LOG_LINE = "tenant_min_resident_size-respecting LRU would not relieve pressure, evicting more following global LRU policy"
@@ -66,222 +60,9 @@ def test_min_resident_size_override_handling(
     assert_config(tenant_id, None, config_level_override)
 
 
-@enum.unique
-class EvictionOrder(str, enum.Enum):
-    ABSOLUTE_ORDER = "absolute"
-    RELATIVE_ORDER_EQUAL = "relative_equal"
-    RELATIVE_ORDER_SPARE = "relative_spare"
-
-    def config(self) -> Dict[str, Any]:
-        if self == EvictionOrder.ABSOLUTE_ORDER:
-            return {"type": "AbsoluteAccessed"}
-        elif self == EvictionOrder.RELATIVE_ORDER_EQUAL:
-            return {
-                "type": "RelativeAccessed",
-                "args": {"highest_layer_count_loses_first": False},
-            }
-        elif self == EvictionOrder.RELATIVE_ORDER_SPARE:
-            return {
-                "type": "RelativeAccessed",
-                "args": {"highest_layer_count_loses_first": True},
-            }
-        else:
-            raise RuntimeError(f"not implemented: {self}")
-
-
-@dataclass
-class EvictionEnv:
-    timelines: list[Tuple[TenantId, TimelineId]]
-    neon_env: NeonEnv
-    pg_bin: PgBin
-    pageserver_http: PageserverHttpClient
-    layer_size: int
-    pgbench_init_lsns: Dict[TenantId, Lsn]
-
-    @property
-    def pageserver(self):
-        """
-        Shortcut for tests that only use one pageserver.
-        """
-        return self.neon_env.pageserver
-
-    def timelines_du(self, pageserver: NeonPageserver) -> Tuple[int, int, int]:
-        return poor_mans_du(
-            self.neon_env,
-            [(tid, tlid) for tid, tlid in self.timelines],
-            pageserver,
-            verbose=False,
-        )
-
-    def du_by_timeline(self, pageserver: NeonPageserver) -> Dict[Tuple[TenantId, TimelineId], int]:
-        return {
-            (tid, tlid): poor_mans_du(self.neon_env, [(tid, tlid)], pageserver, verbose=True)[0]
-            for tid, tlid in self.timelines
-        }
-
-    def warm_up_tenant(self, tenant_id: TenantId):
-        """
-        Start a read-only compute at the LSN after pgbench -i, and run pgbench -S against it.
-        This assumes that the tenant is still at the state after pbench -i.
-        """
-        lsn = self.pgbench_init_lsns[tenant_id]
-        with self.neon_env.endpoints.create_start("main", tenant_id=tenant_id, lsn=lsn) as endpoint:
-            # instead of using pgbench --select-only which does point selects,
-            # run full table scans for all tables
-            with endpoint.connect() as conn:
-                cur = conn.cursor()
-
-                tables_cols = {
-                    "pgbench_accounts": "abalance",
-                    "pgbench_tellers": "tbalance",
-                    "pgbench_branches": "bbalance",
-                    "pgbench_history": "delta",
-                }
-
-                for table, column in tables_cols.items():
-                    cur.execute(f"select avg({column}) from {table}")
-                    _avg = cur.fetchone()
-
-    def pageserver_start_with_disk_usage_eviction(
-        self,
-        pageserver: NeonPageserver,
-        period,
-        max_usage_pct,
-        min_avail_bytes,
-        mock_behavior,
-        eviction_order: EvictionOrder,
-    ):
-        disk_usage_config = {
-            "period": period,
-            "max_usage_pct": max_usage_pct,
-            "min_avail_bytes": min_avail_bytes,
-            "mock_statvfs": mock_behavior,
-            "eviction_order": eviction_order.config(),
-        }
-
-        enc = toml.TomlEncoder()
-
-        # these can sometimes happen during startup before any tenants have been
-        # loaded, so nothing can be evicted, we just wait for next iteration which
-        # is able to evict.
-        pageserver.allowed_errors.append(".*WARN.* disk usage still high.*")
-
-        pageserver.start(
-            overrides=(
-                "--pageserver-config-override=disk_usage_based_eviction="
-                + enc.dump_inline_table(disk_usage_config).replace("\n", " "),
-                # Disk usage based eviction runs as a background task.
-                # But pageserver startup delays launch of background tasks for some time, to prioritize initial logical size calculations during startup.
-                # But, initial logical size calculation may not be triggered if safekeepers don't publish new broker messages.
-                # But, we only have a 10-second-timeout in this test.
-                # So, disable the delay for this test.
-                "--pageserver-config-override=background_task_maximum_delay='0s'",
-            ),
-        )
-
-        def statvfs_called():
-            assert pageserver.log_contains(".*running mocked statvfs.*")
-
-        wait_until(10, 1, statvfs_called)
-
-
-def human_bytes(amt: float) -> str:
-    suffixes = ["", "Ki", "Mi", "Gi"]
-
-    last = suffixes[-1]
-
-    for name in suffixes:
-        if amt < 1024 or name == last:
-            return f"{int(round(amt))} {name}B"
-        amt = amt / 1024
-
-    raise RuntimeError("unreachable")
-
-
-def _eviction_env(
-    request, neon_env_builder: NeonEnvBuilder, pg_bin: PgBin, num_pageservers: int
-) -> EvictionEnv:
-    """
-    Creates two tenants, one somewhat larger than the other.
-    """
-
-    log.info(f"setting up eviction_env for test {request.node.name}")
-
-    neon_env_builder.num_pageservers = num_pageservers
-    neon_env_builder.enable_pageserver_remote_storage(RemoteStorageKind.LOCAL_FS)
-
-    # initial tenant will not be present on this pageserver
-    env = neon_env_builder.init_configs()
-    env.start()
-
-    # allow because we are invoking this manually; we always warn on executing disk based eviction
-    for ps in env.pageservers:
-        ps.allowed_errors.append(r".* running disk usage based eviction due to pressure.*")
-
-    # Choose small layer_size so that we can use low pgbench_scales and still get a large count of layers.
-    # Large count of layers and small layer size is good for testing because it makes evictions predictable.
-    # Predictable in the sense that many layer evictions will be required to reach the eviction target, because
-    # each eviction only makes small progress. That means little overshoot, and thereby stable asserts.
-    pgbench_scales = [4, 6]
-    layer_size = 5 * 1024**2
-
-    pgbench_init_lsns = {}
-
-    timelines = []
-    for scale in pgbench_scales:
-        tenant_id, timeline_id = env.neon_cli.create_tenant(
-            conf={
-                "gc_period": "0s",
-                "compaction_period": "0s",
-                "checkpoint_distance": f"{layer_size}",
-                "image_creation_threshold": "100",
-                "compaction_target_size": f"{layer_size}",
-            }
-        )
-
-        with env.endpoints.create_start("main", tenant_id=tenant_id) as endpoint:
-            pg_bin.run(["pgbench", "-i", f"-s{scale}", endpoint.connstr()])
-            wait_for_last_flush_lsn(env, endpoint, tenant_id, timeline_id)
-
-        timelines.append((tenant_id, timeline_id))
-
-    # stop the safekeepers to avoid on-demand downloads caused by
-    # initial logical size calculation triggered by walreceiver connection status
-    # when we restart the pageserver process in any of the tests
-    env.neon_cli.safekeeper_stop()
-
-    # after stopping the safekeepers, we know that no new WAL will be coming in
-    for tenant_id, timeline_id in timelines:
-        pageserver_http = env.get_tenant_pageserver(tenant_id).http_client()
-
-        pageserver_http.timeline_checkpoint(tenant_id, timeline_id)
-        wait_for_upload_queue_empty(pageserver_http, tenant_id, timeline_id)
-        tl_info = pageserver_http.timeline_detail(tenant_id, timeline_id)
-        assert tl_info["last_record_lsn"] == tl_info["disk_consistent_lsn"]
-        assert tl_info["disk_consistent_lsn"] == tl_info["remote_consistent_lsn"]
-        pgbench_init_lsns[tenant_id] = Lsn(tl_info["last_record_lsn"])
-
-        layers = pageserver_http.layer_map_info(tenant_id, timeline_id)
-        log.info(f"{layers}")
-        assert (
-            len(layers.historic_layers) >= 10
-        ), "evictions happen at layer granularity, but we often assert at byte-granularity"
-
-    eviction_env = EvictionEnv(
-        timelines=timelines,
-        neon_env=env,
-        pageserver_http=pageserver_http,
-        layer_size=layer_size,
-        pg_bin=pg_bin,
-        pgbench_init_lsns=pgbench_init_lsns,
-    )
-
-    return eviction_env
-
-
 @pytest.fixture
 def eviction_env(request, neon_env_builder: NeonEnvBuilder, pg_bin: PgBin) -> EvictionEnv:
-    return _eviction_env(request, neon_env_builder, pg_bin, num_pageservers=1)
+    return create_eviction_env(request.node.name, neon_env_builder, pg_bin, num_pageservers=1)
 
 
 @pytest.fixture
@@ -290,7 +71,7 @@ def eviction_env_ha(request, neon_env_builder: NeonEnvBuilder, pg_bin: PgBin) ->
     Variant of the eviction environment with two pageservers for testing eviction on
     HA configurations with a secondary location.
     """
-    return _eviction_env(request, neon_env_builder, pg_bin, num_pageservers=2)
+    return create_eviction_env(request.node.name, neon_env_builder, pg_bin, num_pageservers=2)
 
 
 def test_broken_tenants_are_skipped(eviction_env: EvictionEnv):
@@ -560,44 +341,6 @@ def test_partial_evict_tenant(eviction_env: EvictionEnv, order: EvictionOrder):
         pass
 
 
-def poor_mans_du(
-    env: NeonEnv,
-    timelines: list[Tuple[TenantId, TimelineId]],
-    pageserver: NeonPageserver,
-    verbose: bool = False,
-) -> Tuple[int, int, int]:
-    """
-    Disk usage, largest, smallest layer for layer files over the given (tenant, timeline) tuples;
-    this could be done over layers endpoint just as well.
-    """
-    total_on_disk = 0
-    largest_layer = 0
-    smallest_layer = None
-    for tenant_id, timeline_id in timelines:
-        timeline_dir = pageserver.timeline_dir(tenant_id, timeline_id)
-        assert timeline_dir.exists(), f"timeline dir does not exist: {timeline_dir}"
-        total = 0
-        for file in timeline_dir.iterdir():
-            if "__" not in file.name:
-                continue
-            size = file.stat().st_size
-            total += size
-            largest_layer = max(largest_layer, size)
-            if smallest_layer:
-                smallest_layer = min(smallest_layer, size)
-            else:
-                smallest_layer = size
-            if verbose:
-                log.info(f"{tenant_id}/{timeline_id} => {file.name} {size} ({human_bytes(size)})")
-
-        if verbose:
-            log.info(f"{tenant_id}/{timeline_id}: sum {total} ({human_bytes(total)})")
-        total_on_disk += total
-
-    assert smallest_layer is not None or total_on_disk == 0 and largest_layer == 0
-    return (total_on_disk, largest_layer, smallest_layer or 0)
-
-
 def test_statvfs_error_handling(eviction_env: EvictionEnv):
     """
     We should log an error that statvfs fails.
@@ -0,0 +1,109 @@
+import os
+
+import pytest
+from fixtures.pageserver.layer_coverage import LayerCoverageIndex, analyze_layer_table
+from fixtures.pageserver.types import (
+    DeltaLayerFileName,
+    ImageLayerFileName,
+    InvalidFileName,
+    LayerKind,
+    LayerTable,
+    parse_delta_layer,
+    parse_image_layer,
+    parse_layer_file_name,
+)
+from fixtures.pg_version import PgVersion, skip_on_postgres
+from fixtures.types import KEY_MAX, KEY_MIN, Key, Lsn
+
+IMAGE = (
+    "000000067F000032BE0000400000000070B6-000000067F000032BE0000400000020B6B1C__00000000016960E9"
+)
+DELTA = "000000067F000032BE0000400000000070B6-000000067F000032BE0000400000020B6B1C__0000000001696070-00000000016960E9"
+L0 = f"{KEY_MIN.as_int():036X}-{KEY_MAX.as_int():036X}__00000000016960E9-0000000001A00000"
+
+
+@skip_on_postgres(PgVersion.V14, reason="does not use postgres")
+@pytest.mark.skipif(
+    os.environ.get("BUILD_TYPE") == "debug", reason="unit test for test support, either build works"
+)
+def test_parse_layer_file_name():
+    image = parse_layer_file_name(IMAGE)
+    assert isinstance(image, ImageLayerFileName)
+    assert image.lsn == Lsn(0x16960E9)
+    assert image.key_end == Key(0x000000067F000032BE0000400000020B6B1C)
+    assert image.to_str() == IMAGE
+
+    delta = parse_layer_file_name(DELTA)
+    assert isinstance(delta, DeltaLayerFileName)
+    assert delta.lsn_start == Lsn(0x1696070)
+    assert delta.lsn_end == Lsn(0x16960E9)
+    assert not delta.is_l0()
+    assert delta.to_str() == DELTA
+
+    l0 = parse_layer_file_name(L0)
+    assert isinstance(l0, DeltaLayerFileName)
+    assert l0.is_l0()
+
+    with pytest.raises(InvalidFileName):
+        parse_image_layer(DELTA)
+    with pytest.raises(InvalidFileName):
+        parse_delta_layer(IMAGE)
+
+    for invalid in ["metadata", "00-11__22-33-44", "00-11-22__33", "00-11__22__33", "zz-11__22"]:
+        with pytest.raises(ValueError):
+            parse_layer_file_name(invalid)
+
+
+@skip_on_postgres(PgVersion.V14, reason="does not use postgres")
+@pytest.mark.skipif(
+    os.environ.get("BUILD_TYPE") == "debug", reason="unit test for test support, either build works"
+)
+def test_layer_table():
+    table = LayerTable.from_layers([(IMAGE, 100), (DELTA, 10), (L0, 1000)])
+
+    assert len(table) == 3
+    assert table.l0_count() == 1
+    assert table.count_by_kind() == {LayerKind.IMAGE: 1, LayerKind.DELTA: 1, LayerKind.L0: 1}
+    assert table.size_by_kind() == {LayerKind.IMAGE: 100, LayerKind.DELTA: 10, LayerKind.L0: 1000}
+    assert table.total_size() == 1110
+    assert table.indices_of_kind(LayerKind.DELTA, LayerKind.L0) == [1, 2]
+
+    key = 0x000000067F000032BE0000400000000070B6
+    # the image layer only covers its own LSN
+    assert table.covering(key, key + 1, Lsn(0x16960E9)) == [0, 2]
+    assert table.covering(key, key + 1, Lsn(0x1696070)) == [1]
+    assert table.covering(0, 1, Lsn(0x16960E9)) == [2]
+    assert table.below(key, key + 1, Lsn(0x16960E9)) == [0, 1, 2]
+    assert table.below(key, key + 1, Lsn(0x1000000)) == []
+
+
+@skip_on_postgres(PgVersion.V14, reason="does not use postgres")
+@pytest.mark.skipif(
+    os.environ.get("BUILD_TYPE") == "debug", reason="unit test for test support, either build works"
+)
+def test_layer_coverage_reconstruct_path():
+    key_range = "000000067F000032BE0000400000000070B6-000000067F000032BE0000400000020B6B1C"
+    table = LayerTable.from_layers(
+        [
+            (f"{key_range}__0000000000000010", 100),
+            (f"{key_range}__0000000000000011-0000000000000020", 10),
+            (f"{key_range}__0000000000000020-0000000000000030", 10),
+            (L0.split("__")[0] + "__0000000000000030-0000000000000040", 10),
+        ]
+    )
+    index = LayerCoverageIndex(table)
+    key = 0x000000067F000032BE0000400000000070B6
+
+    # reads walk down the deltas to the image layer
+    assert index.reconstruct_path(key, Lsn(0x3F)) == ([3, 2, 1, 0], True)
+    assert index.reconstruct_path(key, Lsn(0x25)) == ([2, 1, 0], True)
+    assert index.reconstruct_path(key, Lsn(0x10)) == ([0], True)
+    # keys outside of the image layer only have the L0 layer
+    assert index.reconstruct_path(1, Lsn(0x3F)) == ([3], False)
+
+    assert index.image_coverage_gaps(Lsn(0x3F)) == (2, 3)
+
+    report = analyze_layer_table(table, keys=[key], lsns=[Lsn(0x3F), Lsn(0x10)])
+    assert report.deltas_visited == [3, 0]
+    assert report.read_amplification == 2.5
+    assert report.reads_without_image == 0
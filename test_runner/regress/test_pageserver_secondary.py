@@ -5,6 +5,7 @@ from typing import Any, Dict, Optional
 import pytest
 from fixtures.log_helper import log
 from fixtures.neon_fixtures import NeonEnvBuilder, NeonPageserver, S3Scrubber
+from fixtures.pageserver.http import LayerFilter
 from fixtures.pageserver.utils import assert_prefix_empty, tenant_delete_wait_completed
 from fixtures.remote_storage import LocalFsStorage, RemoteStorageKind
 from fixtures.types import TenantId, TimelineId
@@ -32,20 +33,15 @@ def evict_random_layers(
     rng: random.Random, pageserver: NeonPageserver, tenant_id: TenantId, timeline_id: TimelineId
 ):
     """
-    Evict 50% of the layers on a pageserver
+    Evict 50% of the resident layers on a pageserver
     """
-    timeline_path = pageserver.timeline_dir(tenant_id, timeline_id)
-    initial_local_layers = sorted(
-        list(filter(lambda path: path.name != "metadata", timeline_path.glob("*")))
-    )
     client = pageserver.http_client()
-    for layer in initial_local_layers:
-        if "ephemeral" in layer.name or "temp_download" in layer.name:
-            continue
-
-        if rng.choice([True, False]):
-            log.info(f"Evicting layer {tenant_id}/{timeline_id} {layer.name}")
-            client.evict_layer(tenant_id=tenant_id, timeline_id=timeline_id, layer_name=layer.name)
+    result = client.evict_layers(
+        tenant_id,
+        timeline_id,
+        LayerFilter(remote=False, fraction=0.5, seed=rng.randrange(2**32)),
+    )
+    log.info(f"Evicted {result.layers} layers of {tenant_id}/{timeline_id}")
 
 
 @pytest.mark.parametrize("seed", [1, 2, 3])